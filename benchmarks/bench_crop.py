@@ -0,0 +1,42 @@
+"""
+Per-frame timing of dish cropping: ROI-first crop vs. masking the full frame for every dish.
+
+Usage: python -m benchmarks.bench_crop
+"""
+import time
+
+import cv2 as cv
+import numpy as np
+
+from phase.image_manipulation.dish_detection import crop
+
+COORDINATES = [(700, 650, 520), (2030, 640, 515), (3400, 660, 520), (690, 2300, 510), (2040, 2310, 520), (3380, 2310, 500)]
+
+def crop_full_frame(img, coordinates):
+    dishes, masks = [], []
+    for (x, y, r) in coordinates:
+        mask = np.zeros(img.shape[:2], dtype=np.uint8)
+        cv.circle(mask, (x, y), r, 255, -1)
+        masked_img = cv.bitwise_and(img, img, mask=mask)
+        x1, y1 = max(0, x-r), max(0, y-r)
+        x2, y2 = min(img.shape[1], x+r), min(img.shape[0], y+r)
+        dishes.append(masked_img[y1:y2, x1:x2])
+        masks.append(mask[y1:y2, x1:x2])
+    return dishes, masks
+
+def timeit(func, *args, repeats=10):
+    func(*args) # warm up
+    start = time.perf_counter()
+    for _ in range(repeats):
+        func(*args)
+    return (time.perf_counter() - start) / repeats
+
+if __name__ == "__main__":
+    img = np.random.default_rng(0).integers(0, 256, size=(3040, 4056, 3), dtype=np.uint8)
+
+    full = timeit(crop_full_frame, img, COORDINATES)
+    roi = timeit(crop, img, COORDINATES)
+
+    print(f"full-frame masking: {full*1000:.1f} ms/frame")
+    print(f"ROI-first crop:     {roi*1000:.1f} ms/frame")
+    print(f"speedup:            {full/roi:.1f}x")
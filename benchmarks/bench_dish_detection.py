@@ -0,0 +1,28 @@
+"""
+Timing of detect_dishes on a synthetic 4056x3040 plate: full resolution Hough vs. coarse-to-fine detection.
+
+Usage: python -m benchmarks.bench_dish_detection
+"""
+import time
+
+import numpy as np
+
+from phase.helpers.synthetic import synthetic_plate
+from phase.image_manipulation.dish_detection import detect_dishes
+
+def timeit(method, img, repeats=5):
+    detect_dishes(img, save=False, method=method) # warm up
+    start = time.perf_counter()
+    for _ in range(repeats):
+        _, _, coordinates, _ = detect_dishes(img, save=False, method=method)
+    return (time.perf_counter() - start) / repeats, coordinates
+
+if __name__ == "__main__":
+    img = synthetic_plate()
+
+    full_time, full = timeit("full", img)
+    coarse_time, coarse = timeit("coarse", img)
+
+    print(f"full:   {full_time*1000:.0f} ms/frame")
+    print(f"coarse: {coarse_time*1000:.0f} ms/frame ({full_time/coarse_time:.1f}x)")
+    print(f"max coordinate deviation: {np.abs(np.array(full) - np.array(coarse)).max()} px")
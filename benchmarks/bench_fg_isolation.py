@@ -0,0 +1,26 @@
+"""
+Timing of preprocess_fg_isolation on a 1000 px dish: exact 500 px tophat vs. tophat with a downsampled background.
+
+Usage: python -m benchmarks.bench_fg_isolation
+"""
+import time
+
+import numpy as np
+
+from phase.helpers.synthetic import synthetic_dish
+from phase.image_manipulation.preprocessing import preprocess_fg_isolation
+
+if __name__ == "__main__":
+    dish, mask = synthetic_dish(0, n_colonies=300, size=1000)
+
+    start = time.perf_counter()
+    exact = preprocess_fg_isolation(dish, mask=mask, kernel_size=500, method="exact")
+    exact_time = time.perf_counter() - start
+
+    for scale in (4, 8, 16):
+        start = time.perf_counter()
+        pyramid = preprocess_fg_isolation(dish, mask=mask, kernel_size=500, method="pyramid", scale=scale)
+        pyramid_time = time.perf_counter() - start
+
+        iou = np.logical_and(exact, pyramid).sum() / max(np.logical_or(exact, pyramid).sum(), 1)
+        print(f"scale {scale}: {pyramid_time*1000:.1f} ms vs exact {exact_time*1000:.0f} ms ({exact_time/pyramid_time:.0f}x), IoU {iou:.4f}")
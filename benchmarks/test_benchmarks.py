@@ -0,0 +1,104 @@
+"""
+Benchmark suite of the pipeline stages on synthetic 4056x3040 timelapses with known colony counts,
+so that accuracy regressions fail together with the timings.
+
+Usage: python -m pytest benchmarks
+Compare against a saved run: python -m pytest benchmarks --benchmark-autosave, then --benchmark-compare --benchmark-compare-fail=mean:20%
+"""
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+import phase.main.main as main
+from phase.colony_detection.counting import detect_colonies
+from phase.helpers.synthetic import SyntheticTimelapse, dish_grid
+from phase.helpers.timelapse import make_masks
+from phase.image_manipulation.dish_detection import crop, detect_dishes
+from phase.image_manipulation.preprocessing import preprocess, preprocess_fg_isolation
+
+N_FRAMES = 6
+LAST = N_FRAMES - 1
+
+@pytest.fixture(scope="module", params=[4, 6], ids=["4_dishes", "6_dishes"])
+def timelapse(request):
+    coordinates = dish_grid(request.param)
+    return SyntheticTimelapse(0, n_frames=N_FRAMES, coordinates=coordinates, n_colonies=600 // request.param, n_dust=20, markers=True)
+
+@pytest.fixture(scope="module")
+def frame(timelapse):
+    return timelapse.frame(LAST)
+
+@pytest.fixture(scope="module")
+def dishes(timelapse, frame):
+    return crop(frame, timelapse.coordinates)
+
+@pytest.fixture(scope="module")
+def paths(timelapse, tmp_path_factory):
+    return timelapse.write(str(tmp_path_factory.mktemp("timelapse")))
+
+@pytest.mark.parametrize("method", ["full", "coarse"])
+def test_detect_dishes(benchmark, timelapse, frame, method):
+    _, _, coordinates, _ = benchmark(detect_dishes, frame, save=False, method=method)
+
+    assert len(coordinates) == len(timelapse.coordinates)
+    error = np.abs(np.array(coordinates, float)[:, :2] - np.array(timelapse.coordinates)[:, :2]).max()
+    benchmark.extra_info["max_center_error"] = float(error)
+    assert error <= 3
+
+def test_crop(benchmark, timelapse, frame):
+    dishes, masks = benchmark(crop, frame, timelapse.coordinates)
+
+    assert len(dishes) == len(masks) == len(timelapse.coordinates)
+    assert all(dish.shape[:2] == (2*r, 2*r) for dish, (_, _, r) in zip(dishes, timelapse.coordinates))
+
+def test_preprocess(benchmark, timelapse, dishes):
+    dish, mask = dishes[0][0], dishes[1][0]
+    preprocessed = benchmark(preprocess, dish, mask=mask)
+
+    count, _ = detect_colonies(preprocessed, save=False)
+    benchmark.extra_info["count_error"] = count - timelapse.counts(LAST)[0]
+    assert abs(count - timelapse.counts(LAST)[0]) <= 2
+
+@pytest.mark.parametrize("method", ["exact", "pyramid"])
+def test_preprocess_fg_isolation(benchmark, timelapse, dishes, method):
+    dish, mask = dishes[0][0], dishes[1][0]
+    foreground = benchmark(preprocess_fg_isolation, dish, mask=mask, method=method)
+
+    # every colony of the last frame is foreground
+    (centers, _, _), (x, y, r) = timelapse.colonies[0], timelapse.coordinates[0]
+    rows, cols = (centers[:, 1] - y + r).astype(int), (centers[:, 0] - x + r).astype(int)
+    covered = (foreground[rows, cols] > 0).mean()
+    benchmark.extra_info["colonies_covered"] = float(covered)
+    assert covered > 0.98
+
+def test_detect_colonies(benchmark, timelapse, dishes):
+    preprocessed = [preprocess(dish, mask=mask) for dish, mask in zip(*dishes)]
+
+    counts = benchmark(lambda: [detect_colonies(img, save=False)[0] for img in preprocessed])
+
+    errors = np.array(counts) - timelapse.counts(LAST)
+    benchmark.extra_info["max_count_error"] = int(np.abs(errors).max())
+    assert np.abs(errors).max() <= 2
+
+@pytest.mark.parametrize("fg_method", ["exact", "pyramid"])
+def test_make_masks(benchmark, timelapse, paths, fg_method):
+    fg_masks, bg_masks, coordinates = benchmark.pedantic(make_masks, args=(paths,), kwargs=dict(n_to_stack=2, fg_method=fg_method), rounds=1, iterations=1)
+
+    assert len(fg_masks) == len(bg_masks) == len(coordinates) == len(timelapse.coordinates)
+    # the background masks of the first frames hold the dust and markers, not the colonies of the last frame
+    for (centers, appears, _), (x, y, r), bg_mask in zip(timelapse.colonies, coordinates, bg_masks):
+        late = centers[appears > 1]
+        assert (bg_mask[(late[:, 1] - y + r).astype(int), (late[:, 0] - x + r).astype(int)] == 0).mean() > 0.98
+
+def test_timelapse_pipeline(benchmark, timelapse, paths):
+    states = benchmark.pedantic(main.timelapse_pipeline, args=(os.path.dirname(paths[0]),), kwargs=dict(n_to_stack=2), rounds=1, iterations=1)
+
+    counts = np.array([[count for _, count in state.history] for state in states]).T # frames x dishes
+    expected = np.array([timelapse.counts(t) for t in range(N_FRAMES)])
+    benchmark.extra_info["max_count_error"] = int(np.abs(counts - expected).max())
+    if benchmark.stats: # None with --benchmark-disable
+        benchmark.extra_info["s_per_frame"] = benchmark.stats.stats.mean / N_FRAMES
+    assert np.abs(counts - expected).max() <= 2
@@ -1,4 +1,5 @@
 from .main.main import pipeline, mult_pipeline, timelapse_pipeline
+from .main.stream import stream_pipeline
 from .image_manipulation.dish_detection import detect_dishes
 from .image_manipulation.preprocessing import preprocess
 from .colony_detection.counting import detect_colonies
\ No newline at end of file
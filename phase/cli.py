@@ -0,0 +1,246 @@
+"""
+Command-line runner of the pipelines, for unattended runs over large directories.
+
+    phase batch IMAGES -o RESULTS --jobs 8 --resume
+    phase timelapse FRAMES -o RESULTS --config params.yaml --cache-dir /scratch/phase-cache
+    phase validate counts/*.pdf -o RESULTS
+
+Parameters of the pipelines are set in a YAML config: top-level keys apply to every command that takes them,
+a section named after a command applies to that command only. Keys are the keyword arguments of mult_pipeline
+(batch and validate) and timelapse_pipeline (timelapse); options given on the command line override the config.
+
+    blob_params: {minArea: 60}
+    timelapse:
+      n_to_stack: 5
+      threshold_method: box
+"""
+import argparse
+import csv
+import inspect
+import logging
+import os
+import sys
+import time
+from datetime import timedelta
+
+import yaml
+
+from .main.main import mult_pipeline, timelapse_pipeline
+from .helpers.validation import validate_pdfs, format_report, NAME_PATTERN
+from .helpers.profiling import Profiler
+
+logger = logging.getLogger(__name__)
+
+COMMANDS = ("batch", "timelapse", "validate")
+
+def _parameters(func, exclude = ()):
+    return {name for name in inspect.signature(func).parameters if name not in exclude}
+
+# config keys each command takes; source, save_path and progress are set by the command itself
+PARAMETERS = {
+    "batch": _parameters(mult_pipeline, ("source", "progress")),
+    "timelapse": _parameters(timelapse_pipeline, ("source", "progress")),
+    "validate": _parameters(mult_pipeline, ("source", "progress", "resume", "save_metadata", "save_detected")) | {"regex_name_pattern", "pdf_cache"}
+}
+
+class Progress:
+    """
+    Reports the progress of a run with its throughput and ETA on a stream: rewritten in place on a terminal,
+    otherwise one line every interval seconds (i.e. in the log of a scheduler). Used as progress callback of the pipelines.
+
+    Parameters
+    ----------
+    stream: file, default=sys.stderr
+        Stream the progress is written to.
+    interval: float, default=30.0
+        Seconds between lines if the stream isn't a terminal.
+    """
+    def __init__(self, stream = None, interval = 30.0):
+        self.stream = stream or sys.stderr
+        self.interval = interval
+        self.tty = hasattr(self.stream, "isatty") and self.stream.isatty()
+        self.start = None
+        self._last = None
+
+    def __call__(self, done, total):
+        now = time.perf_counter()
+        if self.start is None: # timed from the first report, after any setup
+            self.start = now
+        elapsed = now - self.start
+        fps = done / elapsed if elapsed > 0 else 0.0
+
+        if self.tty:
+            self.stream.write(f"\r{self.format(done, total, fps)}\033[K")
+            if done == total:
+                self.stream.write("\n")
+            self.stream.flush()
+        elif done == total or self._last is None or now - self._last >= self.interval:
+            self.stream.write(f"{self.format(done, total, fps)}\n")
+            self.stream.flush()
+            self._last = now
+
+    @staticmethod
+    def format(done, total, fps):
+        """
+        Formats progress as i.e. "12/340 frames (3%) | 2.41 fps | ETA 0:02:16".
+        """
+        percent = f"{100 * done // total}%" if total else "100%"
+        eta = str(timedelta(seconds=round((total - done) / fps))) if fps > 0 else "--"
+        return f"{done}/{total} frames ({percent}) | {fps:.2f} fps | ETA {eta}"
+
+def load_config(path, command):
+    """
+    Loads the parameters of a command from a YAML config.
+
+    Returns
+    -------
+    dict
+        Top-level parameters the command takes, updated with its section.
+
+    Raises
+    ------
+    ValueError
+        If the config isn't a mapping or sets parameters no command (or the command of a section) takes.
+    """
+    if path is None:
+        return {}
+    with open(path) as f:
+        config = yaml.safe_load(f) or {}
+    if not isinstance(config, dict):
+        raise ValueError(f"Config {path} must be a mapping of parameters.")
+
+    sections = {name: config.pop(name) or {} for name in COMMANDS if name in config}
+    unknown = set(config) - set.union(*PARAMETERS.values())
+    if unknown:
+        raise ValueError(f"Unknown parameters in {path}: {', '.join(sorted(unknown))}")
+
+    params = {key: value for key, value in config.items() if key in PARAMETERS[command]}
+    section = sections.get(command, {})
+    if not isinstance(section, dict):
+        raise ValueError(f"Section {command} of {path} must be a mapping of parameters.")
+    unknown = set(section) - PARAMETERS[command]
+    if unknown:
+        raise ValueError(f"Unknown parameters of {command} in {path}: {', '.join(sorted(unknown))}")
+    params.update(section)
+    return params
+
+def _options(args):
+    """
+    Parameters set on the command line, overriding the config.
+    """
+    options = {"save_path": args.save_path, "n_workers": args.jobs, "cache_dir": args.cache_dir}
+    if args.cache_size is not None:
+        options["cache_size"] = int(args.cache_size * (1 << 30))
+    return {key: value for key, value in options.items() if value is not None}
+
+def run_batch(args, params):
+    params.setdefault("save_metadata", True) # results.sqlite is the output of unattended runs, and what resume skips
+    if args.resume:
+        params["resume"] = True
+
+    results = mult_pipeline(args.source, progress=Progress(), **params)
+
+    n_failed = sum(error is not None for _, error in results)
+    logger.info("Processed %d images, %d failed.", len(results) - n_failed, n_failed)
+    return 1 if n_failed else 0
+
+def run_timelapse(args, params):
+    save_path = params.setdefault("save_path", "")
+    params.setdefault("checkpoint_dir", os.path.join(save_path, "checkpoint")) # always written, so any run can be resumed
+    params["resume"] = args.resume or params.get("resume", False)
+
+    dish_states = timelapse_pipeline(args.source, progress=Progress(), **params)
+
+    path = os.path.join(save_path, "counts.csv")
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["hours"] + [f"dish_{idx}" for idx in range(1, len(dish_states) + 1)])
+        for row in zip(*(state.history for state in dish_states)):
+            writer.writerow([row[0][0]] + [count for _, count in row])
+    logger.info("Saved the counts of %d dishes to %s.", len(dish_states), path)
+    return 0
+
+def run_validate(args, params):
+    save_path = params.pop("save_path", "")
+    n_workers = params.pop("n_workers", None)
+    regex_name_pattern = params.pop("regex_name_pattern", NAME_PATTERN)
+    pdf_cache = params.pop("pdf_cache", os.path.join(save_path, "pdfs"))
+
+    report = validate_pdfs(
+        args.pdfs,
+        pdf_cache,
+        save_path=save_path,
+        n_workers=n_workers,
+        regex_name_pattern=regex_name_pattern,
+        pipeline_kwargs=params
+    )
+    print(format_report(report))
+    return 0
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="phase", description="Counts colonies on petri dish images.")
+    parser.add_argument("-v", "--verbose", action="store_true", help="log debug messages")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("-c", "--config", help="YAML config of the pipeline parameters")
+    common.add_argument("-o", "--save-path", help="directory the results are saved to (default: the current directory)")
+    common.add_argument("-j", "--jobs", type=int, help="number of worker processes")
+    common.add_argument("--cache-dir", help="directory of the stage cache; reruns only recompute stages with changed inputs or parameters")
+    common.add_argument("--cache-size", type=float, help="size of the stage cache in GiB (default: 4)")
+    common.add_argument("--profile", metavar="PATH", help="save stage timings to PATH (.json or .csv) and log a summary")
+
+    batch = subparsers.add_parser("batch", parents=[common], help="count the colonies of every image in a directory")
+    batch.add_argument("source", help="directory of the images")
+    batch.add_argument("--resume", action="store_true", help="skip images with results in results.sqlite of the save path")
+    batch.set_defaults(run=run_batch)
+
+    timelapse = subparsers.add_parser("timelapse", parents=[common], help="count the colonies of a timelapse over time")
+    timelapse.add_argument("source", help="directory of the frames")
+    timelapse.add_argument("--resume", action="store_true", help="continue from the checkpoint of an interrupted run")
+    timelapse.set_defaults(run=run_timelapse)
+
+    validate = subparsers.add_parser("validate", parents=[common], help="compare the counts of the pipeline with cell counter pdfs")
+    validate.add_argument("pdfs", nargs="+", help="cell counter pdfs")
+    validate.set_defaults(run=run_validate)
+
+    return parser
+
+def main(argv = None):
+    """
+    Entry point of the phase command.
+
+    Returns
+    -------
+    int
+        Exit status: 0 on success, 1 if images failed, 2 for invalid arguments or configs.
+    """
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    logging.captureWarnings(True) # warnings of skipped or failed images end up in the log
+
+    try:
+        params = load_config(args.config, args.command)
+    except (OSError, ValueError, yaml.YAMLError) as e:
+        parser.error(str(e))
+    params.update(_options(args))
+
+    if "save_path" in params:
+        os.makedirs(params["save_path"], exist_ok=True)
+
+    if args.profile is None:
+        return args.run(args, params)
+
+    with Profiler() as profiler:
+        status = args.run(args, params)
+    if args.profile.endswith(".csv"):
+        profiler.to_csv(args.profile)
+    else:
+        profiler.to_json(args.profile)
+    logger.info("Stage timings:\n%s", profiler.format_summary())
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
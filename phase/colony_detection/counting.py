@@ -1,9 +1,256 @@
 import cv2 as cv
+import logging
 import numpy as np
 import os
 import warnings
+from functools import lru_cache
 
 from ..helpers.inputs import read_img
+from ..helpers.outputs import save_image
+from ..helpers.profiling import stage
+
+logger = logging.getLogger(__name__)
+
+BLOB_PARAMS = { # Values from hyperparameter tuning
+    "minThreshold": 0,
+    "maxThreshold": 255, # Smaller values = less false positives
+    "thresholdStep": 1, # Smaller values = more true positives
+
+    "filterByArea": True, # Area in pxs
+    "minArea": 2,
+    "maxArea": 750,
+
+    "filterByColor": True,
+    "blobColor": 255, # Detects white colonies
+
+    "filterByCircularity": True, # how much does the geometrical shape fit the form of a circle
+    "minCircularity": 0.1,
+
+    "filterByConvexity": True, # "fullness" of the circle; think of a pie chart
+    "minConvexity": 0.7,
+
+    "filterByInertia": True, # how elongated is the circle - lower values mean more elongated.
+    "minInertiaRatio": 0.1,
+}
+
+def blob_params(params: dict = None):
+    """
+    Builds SimpleBlobDetector parameters from BLOB_PARAMS, optionally overriding some of them.
+
+    Parameters
+    ----------
+    params: dict, optional
+        Parameters overriding the defaults in BLOB_PARAMS, named as the attributes of cv.SimpleBlobDetector_Params.
+
+    Returns
+    -------
+    cv.SimpleBlobDetector_Params
+        Parameters for blob detection.
+    """
+    blob_params = cv.SimpleBlobDetector_Params()
+    for key, value in {**BLOB_PARAMS, **(params or {})}.items():
+        setattr(blob_params, key, value)
+    return blob_params
+
+@lru_cache(maxsize=16)
+def _blob_detector(params):
+    return cv.SimpleBlobDetector_create(blob_params(dict(params)))
+
+def count_blobs(img, params: dict = None):
+    """
+    Detects colonies with OpenCV's SimpleBlobDetector, which thresholds the image once per threshold step.
+
+    Parameters
+    ----------
+    img: np.ndarray
+        Thresholded image.
+    params: dict, optional
+        Parameters overriding BLOB_PARAMS.
+
+    Returns
+    -------
+    list of cv.KeyPoint
+        Detected colonies.
+    """
+    detector = _blob_detector(tuple(sorted((params or {}).items()))) # detector objects are reused between calls
+    return detector.detect(img)
+
+def count_components(img, params: dict = None):
+    """
+    Detects colonies in a binary image with a single connected components pass.
+    Mirrors the filters of SimpleBlobDetector, computed for all components at once from pixel statistics:
+    contour area via Pick's theorem, perimeter from the axial and diagonal steps along the border,
+    inertia from the second moments and convexity as the ratio of the area to the area of the ellipse with the same second moments.
+    Colonies closer than minDistBetweenBlobs are merged, as the blob detector does, in raster order of the components.
+
+    Parameters
+    ----------
+    img: np.ndarray
+        Thresholded (binary) image.
+    params: dict, optional
+        Parameters overriding BLOB_PARAMS.
+
+    Returns
+    -------
+    list of cv.KeyPoint
+        Detected colonies, compatible with the output of count_blobs.
+    """
+    p = blob_params(params)
+    candidates = component_candidates(img, p)
+    return merge_candidates(candidates, p)
+
+def component_candidates(img, p, origin = (0, 0), width = None):
+    """
+    Filtered components of count_components, before close colonies are merged.
+    A window of a larger image can be passed with its origin, so that its candidates can be combined with those of other windows.
+
+    Parameters
+    ----------
+    img: np.ndarray
+        Thresholded (binary) image or window.
+    p: cv.SimpleBlobDetector_Params
+        Parameters, from blob_params.
+    origin: tuple, default=(0, 0)
+        (x, y) of the window in the full image.
+    width: int, optional
+        Width of the full image. If None, the width of img.
+
+    Returns
+    -------
+    dict
+        "points" (n, 2), "radius", "confidence", "order" (raster index of the first pixel of the component in the full image)
+        and "bbox" (x, y, w, h in the full image) of the kept components.
+    """
+    if img.ndim == 3:
+        img = cv.cvtColor(img, cv.COLOR_BGR2GRAY)
+
+    ox, oy = origin
+    width = img.shape[1] if width is None else width
+
+    binary = (img > p.minThreshold).astype(np.uint8) # first (and for binary images, every) threshold step of the blob detector
+    if p.filterByColor and p.blobColor == 0:
+        binary = 1 - binary
+
+    n_labels, labels, stats, centroids = cv.connectedComponentsWithStats(binary, connectivity=8)
+    if n_labels <= 1:
+        return {"points": np.zeros((0, 2)), "radius": np.zeros(0), "confidence": np.zeros(0), "order": np.zeros(0, np.int64), "bbox": np.zeros((0, 4), np.int64)}
+
+    # border pixels; pixels outside of the image count as background, as in cv.findContours
+    eroded = cv.erode(binary, cv.getStructuringElement(cv.MORPH_CROSS, (3, 3)), borderType=cv.BORDER_CONSTANT, borderValue=0)
+    border = binary & (1 - eroded)
+    n_border = np.bincount(labels[border > 0], minlength=n_labels).astype(np.float64)
+
+    # steps along the border; a border pixel with two border pixels as 4-neighbours sits on axial steps only
+    neighbours = cv.filter2D(border, -1, np.array([[0, 1, 0], [1, 0, 1], [0, 1, 0]], np.float32), borderType=cv.BORDER_CONSTANT)
+    axial = np.bincount(labels[border > 0], weights=np.minimum(neighbours[border > 0], 2), minlength=n_labels) / 2
+    axial = np.minimum(axial, n_border)
+    perimeter = axial + np.sqrt(2) * (n_border - axial)
+
+    pixels = stats[:, cv.CC_STAT_AREA].astype(np.float64)
+    area = np.maximum(pixels - n_border / 2 - 1, 0) # area of the contour polygon through the border pixel centers
+
+    # second central moments of every component
+    ys, xs = np.nonzero(labels)
+    component = labels[ys, xs]
+    dx = xs - centroids[component, 0]
+    dy = ys - centroids[component, 1]
+    mu20 = np.bincount(component, weights=dx * dx, minlength=n_labels)
+    mu02 = np.bincount(component, weights=dy * dy, minlength=n_labels)
+    mu11 = np.bincount(component, weights=dx * dy, minlength=n_labels)
+
+    # first pixel of every component in raster order; np.nonzero returns pixels in raster order
+    order = np.zeros(n_labels, np.int64)
+    found, first = np.unique(component, return_index=True)
+    order[found] = (ys[first] + oy) * width + xs[first] + ox
+
+    keep = np.ones(n_labels, dtype=bool)
+    keep[0] = False # background
+
+    if p.filterByColor:
+        cx = np.clip(np.round(centroids[:, 0]).astype(int), 0, binary.shape[1] - 1)
+        cy = np.clip(np.round(centroids[:, 1]).astype(int), 0, binary.shape[0] - 1)
+        keep &= binary[cy, cx] == 1
+
+    if p.filterByArea:
+        keep &= (area >= p.minArea) & (area < p.maxArea)
+
+    if p.filterByCircularity:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            circularity = np.nan_to_num(4 * np.pi * area / (perimeter * perimeter))
+        keep &= (circularity >= p.minCircularity) & (circularity < p.maxCircularity)
+
+    # eigenvalues of the covariance of every component
+    half_trace = (mu20 + mu02) / 2
+    root = np.sqrt(((mu20 - mu02) / 2) ** 2 + mu11 ** 2)
+    major, minor = half_trace + root, half_trace - root
+
+    confidence = np.ones(n_labels)
+    if p.filterByInertia:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            inertia = np.where(2 * root > 1e-2, minor / major, 1.0)
+        keep &= (inertia >= p.minInertiaRatio) & (inertia < p.maxInertiaRatio)
+        confidence = inertia * inertia
+
+    if p.filterByConvexity:
+        ellipse_area = 4 * np.pi * np.sqrt(np.maximum(major * minor, 0)) / pixels # area of the ellipse with the same second moments
+        with np.errstate(divide="ignore", invalid="ignore"):
+            convexity = np.where(ellipse_area > 0, np.minimum(pixels / ellipse_area, 1.0), 1.0)
+        keep &= (convexity >= p.minConvexity) & (convexity < p.maxConvexity)
+
+    idxs = np.flatnonzero(keep)
+    bbox = stats[idxs, :4].astype(np.int64) + (ox, oy, 0, 0)
+
+    return {
+        "points": centroids[idxs] + (ox, oy),
+        "radius": np.sqrt(area[idxs] / np.pi),
+        "confidence": confidence[idxs],
+        "order": order[idxs],
+        "bbox": bbox
+    }
+
+def merge_candidates(candidates, p):
+    """
+    Merges close candidates from component_candidates in raster order of their components into keypoints.
+    """
+    order = np.argsort(candidates["order"], kind="stable")
+    return _merge_close(candidates["points"][order], candidates["radius"][order], candidates["confidence"][order], p.minDistBetweenBlobs)
+
+def _merge_close(points, radius, confidence, min_dist):
+    """
+    Merges detections closer than min_dist or their radius into the confidence weighted mean, using a grid hash.
+    """
+    cell = max(min_dist, float(radius.max()) if len(radius) else 0.0, 1.0)
+    grid = {}
+    clusters = [] # [first point, radius, weighted sum, sum of weights]
+
+    for point, r, w in zip(points, radius, confidence):
+        gx, gy = int(point[0] // cell), int(point[1] // cell)
+        match = None
+        for nx in (gx - 1, gx, gx + 1):
+            for ny in (gy - 1, gy, gy + 1):
+                for c in grid.get((nx, ny), ()):
+                    first, first_r = clusters[c][0], clusters[c][1]
+                    dist = np.hypot(*(point - first))
+                    if dist < min_dist or dist < first_r or dist < r:
+                        match = c
+                        break
+                if match is not None:
+                    break
+            if match is not None:
+                break
+
+        if match is None:
+            grid.setdefault((gx, gy), []).append(len(clusters))
+            clusters.append([point, r, point * w, w])
+        else:
+            clusters[match][2] = clusters[match][2] + point * w
+            clusters[match][3] += w
+
+    keypoints = []
+    for _, r, weighted, weight in clusters:
+        x, y = weighted / weight if weight > 0 else weighted
+        keypoints.append(cv.KeyPoint(float(x), float(y), float(2 * r)))
+    return keypoints
 
 def detect_colonies(
         source,
@@ -11,7 +258,10 @@ def detect_colonies(
         save = True,
         save_path = "",
         file_name = "colonies_detected",
-        idx: int = None
+        idx: int = None,
+        method = "blob",
+        params: dict = None,
+        return_keypoints = False
 ):
     """
     Detects colonies.
@@ -34,6 +284,14 @@ def detect_colonies(
         Metadata dictionary handled by a wrapper function.
     idx: int, optional
         Passed by a wrapper function when processing mutliple dishes. 
+    method: str, default="blob"
+        Counting backend. "blob" uses OpenCV's SimpleBlobDetector, which thresholds the image once per threshold step.
+        "components" counts the binary image in a single connected components pass, see count_components; it is faster,
+        but approximates the convexity filter, so its counts can differ slightly.
+    params: dict, optional
+        Parameters overriding BLOB_PARAMS.
+    return_keypoints: bool, default=False
+        Whether to also return the detected colonies, e.g. for tracking them across frames.
 
     Returns
     -------
@@ -41,6 +299,8 @@ def detect_colonies(
         Number of detected colonies
     np.ndarray
         Image with detected colonies
+    list of cv.KeyPoint
+        Detected colonies, only if return_keypoints is True.
     """
     img = read_img(source=source)
 
@@ -50,30 +310,13 @@ def detect_colonies(
     if save and not save_path:
         warnings.warn(f"No specified save path. Images saved in the current directory ({os.getcwd()}) under ...Colonies.")
 
-    params = cv.SimpleBlobDetector_Params() # Values from hyperparameter tuning
-
-    params.minThreshold = 0
-    params.maxThreshold = 255 # Smaller values = less false positives
-    params.thresholdStep = 1 # Smaller values = more true positives
-
-    params.filterByArea = True # Area in pxs
-    params.minArea = 2
-    params.maxArea = 750
-
-    params.filterByColor = True
-    params.blobColor = 255 # Detects white colonies
-
-    params.filterByCircularity = True # how much does the geometrical shape fit the form of a circle
-    params.minCircularity = 0.1
-
-    params.filterByConvexity = True # "fullness" of the circle; think of a pie chart
-    params.minConvexity = 0.7
-
-    params.filterByInertia = True # how elongated is the circle - lower values mean more elongated.
-    params.minInertiaRatio = 0.1
-
-    detector = cv.SimpleBlobDetector_create(params) # Creates detector object
-    blobs = detector.detect(img) # Blobs are markers around colonies
+    with stage("detection"):
+        if method == "components":
+            blobs = count_components(img, params) # Blobs are markers around colonies
+        elif method == "blob":
+            blobs = count_blobs(img, params)
+        else:
+            raise ValueError(f"Unknown counting method: {method}")
 
     output = cv.drawKeypoints(raw_img, blobs, np.array([]), (0,255,0), cv.DRAW_MATCHES_FLAGS_DRAW_RICH_KEYPOINTS) # Output = initial image with colonies marked
 
@@ -81,9 +324,11 @@ def detect_colonies(
 
     if save: # Saving images with marked colonies
         save_path_blob_detection = os.path.join(save_path, "Colonies")
-        os.makedirs(save_path_blob_detection, exist_ok=True)
-        cv.imwrite(os.path.join(save_path_blob_detection, save_name), output)
+        save_image(os.path.join(save_path_blob_detection, save_name), output)
+
+    logger.debug("%d colonies detected in file %s.", len(blobs), save_name)
 
-    print(f"{len(blobs)} colonies detected in file {save_name}.")
+    if return_keypoints:
+        return len(blobs), output, blobs
 
     return len(blobs), output
\ No newline at end of file
@@ -0,0 +1,159 @@
+import math
+import numpy as np
+
+def keypoints_to_array(keypoints):
+    """
+    Converts keypoints from detect_colonies to an array of (x, y, size) rows, which can be pickled and stored.
+    """
+    return np.array([(*kp.pt, kp.size) for kp in keypoints], dtype=np.float64).reshape(-1, 3)
+
+class Colony:
+    """
+    A tracked colony: stable id, time it was first seen and its trajectory of (time, x, y, size).
+    """
+    __slots__ = ("id", "first_seen", "trajectory", "missed")
+
+    def __init__(self, id, first_seen, trajectory = None, missed = 0):
+        self.id = id
+        self.first_seen = first_seen
+        self.trajectory = trajectory if trajectory is not None else []
+        self.missed = missed
+
+    @property
+    def position(self):
+        _, x, y, _ = self.trajectory[-1]
+        return x, y
+
+    @property
+    def size(self):
+        return self.trajectory[-1][3]
+
+class ColonyTracker:
+    """
+    Matches colonies of a dish from frame to frame and assigns them stable ids.
+    Colonies are looked up in a grid hash of the last known positions, so only colonies in neighbouring cells are compared
+    and a frame is matched in roughly linear time. Matches are assigned closest first.
+
+    Parameters
+    ----------
+    max_dist: float, default=5.0
+        Maximum distance in pxs a colony may move between frames. Grown colonies may move up to their radius, as their centroid shifts when they grow.
+    max_missed: int, default=3
+        Number of consecutive frames a colony may go undetected before it is no longer matched.
+    """
+    def __init__(self, max_dist = 5.0, max_missed = 3):
+        self.max_dist = max_dist
+        self.max_missed = max_missed
+        self.colonies = [] # all colonies, indexed by id
+        self.active = [] # ids of colonies that can still be matched
+        self.n_compared = 0 # detection-colony pairs compared, the work of matching
+
+    def update(self, t, colonies):
+        """
+        Matches the colonies of the next frame.
+
+        Parameters
+        ----------
+        t: float
+            Time of the frame, e.g. hours since the first frame.
+        colonies: list of cv.KeyPoint or np.ndarray
+            Detected colonies, as keypoints or (x, y, size) rows.
+
+        Returns
+        -------
+        list of int
+            Id of each detected colony.
+        """
+        if not isinstance(colonies, np.ndarray):
+            colonies = keypoints_to_array(colonies)
+
+        active = [self.colonies[i] for i in self.active]
+        gates = [max(self.max_dist, c.size / 2) for c in active]
+        cell = max(max(gates, default=0.0), 1.0)
+
+        grid = {}
+        for j, colony in enumerate(active):
+            x, y = colony.position
+            grid.setdefault((int(x // cell), int(y // cell)), []).append(j)
+
+        # candidate pairs of detection and colony within the gate of the colony
+        candidates = []
+        n_compared = 0
+        for i, (x, y, _) in enumerate(colonies.tolist()):
+            gx, gy = int(x // cell), int(y // cell)
+            for nx in (gx - 1, gx, gx + 1):
+                for ny in (gy - 1, gy, gy + 1):
+                    neighbours = grid.get((nx, ny), ())
+                    n_compared += len(neighbours)
+                    for j in neighbours:
+                        px, py = active[j].position
+                        dist = math.hypot(x - px, y - py)
+                        if dist <= gates[j]:
+                            candidates.append((dist, i, j))
+        candidates.sort()
+        self.n_compared += n_compared
+
+        ids = [None] * len(colonies)
+        new = []
+        matched = set()
+        for _, i, j in candidates:
+            if ids[i] is None and j not in matched:
+                ids[i] = active[j].id
+                matched.add(j)
+
+        for i, (x, y, size) in enumerate(colonies.tolist()):
+            if ids[i] is None: # new colony
+                ids[i] = len(self.colonies)
+                self.colonies.append(Colony(ids[i], t))
+                new.append(ids[i])
+            colony = self.colonies[ids[i]]
+            colony.trajectory.append((t, x, y, size))
+            colony.missed = 0
+
+        for j, colony in enumerate(active):
+            if j not in matched:
+                colony.missed += 1
+
+        self.active = [c.id for c in active if c.missed <= self.max_missed] + new
+        return ids
+
+    def appearance_times(self):
+        """
+        Returns the time each colony was first seen, by id.
+        """
+        return {colony.id: colony.first_seen for colony in self.colonies}
+
+    def points(self):
+        """
+        Returns the trajectories of all colonies as (id, time, x, y, size) rows.
+        """
+        return np.array([(c.id, *point) for c in self.colonies for point in c.trajectory], dtype=np.float64).reshape(-1, 5)
+
+    def state(self):
+        """
+        Returns the tracker without the trajectories as a JSON serialisable dict, e.g. for checkpoints:
+        its parameters, the number of colonies and the ids and missed frames of the active colonies.
+        """
+        return {
+            "max_dist": self.max_dist,
+            "max_missed": self.max_missed,
+            "n_colonies": len(self.colonies),
+            "active": self.active,
+            "missed": [self.colonies[i].missed for i in self.active]
+        }
+
+    @classmethod
+    def from_state(cls, state, points):
+        """
+        Rebuilds a tracker from ColonyTracker.state and the trajectory points of its colonies, as (id, time, x, y, size) rows
+        in the order they were added (i.e. from ColonyTracker.points). A colony is first seen at its first point.
+        """
+        tracker = cls(state["max_dist"], state["max_missed"])
+        trajectories = [[] for _ in range(state["n_colonies"])]
+        for i, t, x, y, size in np.asarray(points).tolist():
+            trajectories[int(i)].append((t, x, y, size))
+        tracker.colonies = [Colony(i, trajectory[0][0], trajectory) for i, trajectory in enumerate(trajectories)]
+        tracker.active = list(state["active"])
+        for i, missed in zip(tracker.active, state["missed"]):
+            tracker.colonies[i].missed = missed
+        return tracker
@@ -0,0 +1,280 @@
+import hashlib
+import inspect
+import json
+import os
+import warnings
+from importlib import metadata
+
+import numpy as np
+
+from .inputs import file_hash
+
+DEFAULT_CACHE_SIZE = 4 << 30 # 4 GiB
+_MISSING = object()
+
+def code_version(*objects):
+    """
+    Version of the code of stages: hash of the source of the given modules or functions, so cached results are invalidated when the code changes.
+    Without sources (i.e. .pyc only or zipped installs), the version of the installed package.
+    """
+    digest = hashlib.sha256()
+    try:
+        for obj in objects:
+            digest.update(inspect.getsource(obj).encode())
+    except (OSError, TypeError):
+        try:
+            return f"package-{metadata.version('PHASE')}"
+        except metadata.PackageNotFoundError:
+            return "unknown"
+    return digest.hexdigest()[:16]
+
+def array_hash(arr):
+    """
+    Hash of the content, shape and type of an array.
+    """
+    arr = np.ascontiguousarray(arr)
+    digest = hashlib.sha256(f"{arr.dtype.str}{arr.shape}".encode())
+    digest.update(arr.data)
+    return digest.hexdigest()
+
+def _pack(value, arrays):
+    """
+    JSON structure of a value of nested lists, tuples, dicts, arrays and scalars; arrays are appended to arrays and referenced by index.
+    """
+    if isinstance(value, np.ndarray):
+        arrays.append(value)
+        return {"array": len(arrays) - 1}
+    if isinstance(value, (list, tuple)):
+        return {"tuple" if isinstance(value, tuple) else "list": [_pack(v, arrays) for v in value]}
+    if isinstance(value, dict):
+        return {"dict": [[k, _pack(v, arrays)] for k, v in value.items()]}
+    if isinstance(value, np.generic):
+        return {"value": value.item()}
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return {"value": value}
+    raise TypeError(f"Stage results of type {type(value).__name__} can't be cached.")
+
+def _unpack(structure, arrays):
+    kind, content = next(iter(structure.items()))
+    if kind == "array":
+        return arrays[f"a{content}"]
+    if kind == "list":
+        return [_unpack(v, arrays) for v in content]
+    if kind == "tuple":
+        return tuple(_unpack(v, arrays) for v in content)
+    if kind == "dict":
+        return {k: _unpack(v, arrays) for k, v in content}
+    return content
+
+class StageCache:
+    """
+    Content-addressed cache of the results of pipeline stages on disk, one compressed .npz file per result, named by its key.
+    Keys hash the input content, the stage parameters and the code version (see Stage), so changed inputs, parameters or code
+    never hit stale results and nothing has to be invalidated explicitly.
+    The cache is bounded in size: the least recently used results are evicted, with the file modification time as the time of use.
+    Several processes can share a cache directory; results are written atomically and results evicted by another process are misses.
+
+    Parameters
+    ----------
+    directory: str
+        Directory of the cache, created if it doesn't exist.
+    max_bytes: int, default=4 GiB
+        Size the cache is evicted down to after writes.
+    """
+    def __init__(self, directory, max_bytes = DEFAULT_CACHE_SIZE):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._size = None # scanned on the first write
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.npz")
+
+    def _entries(self):
+        """
+        (mtime, size, path) of every cached result.
+        """
+        entries = []
+        for sub in os.scandir(self.directory):
+            if not sub.is_dir():
+                continue
+            for entry in os.scandir(sub.path):
+                if entry.name.endswith(".npz"):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError: # evicted by another process
+                        continue
+                    entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        return entries
+
+    @property
+    def size(self):
+        """
+        Size of the cached results in bytes.
+        """
+        if self._size is None:
+            self._size = sum(size for _, size, _ in self._entries())
+        return self._size
+
+    def __len__(self):
+        return len(self._entries())
+
+    def __contains__(self, key):
+        return os.path.isfile(self._path(key))
+
+    def get(self, key, default = None):
+        """
+        Loads a cached result and marks it as used.
+
+        Returns the result, or default if it isn't cached.
+        """
+        path = self._path(key)
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                arrays = {name: data[name] for name in data.files}
+            os.utime(path)
+        except (FileNotFoundError, OSError, ValueError): # missing, evicted meanwhile or unreadable
+            self.misses += 1
+            return default
+        self.hits += 1
+        return _unpack(json.loads(str(arrays.pop("structure"))), arrays)
+
+    def put(self, key, value):
+        """
+        Caches a result, then evicts the least recently used results beyond the size of the cache.
+        """
+        arrays = []
+        structure = _pack(value, arrays)
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            np.savez_compressed(f, structure=np.array(json.dumps(structure)), **{f"a{i}": arr for i, arr in enumerate(arrays)})
+        size = os.path.getsize(tmp)
+        total = self.size
+        try:
+            total -= os.path.getsize(path) # rewritten, so no longer part of the cache
+        except FileNotFoundError:
+            pass
+        os.replace(tmp, path)
+
+        self._size = total + size
+        if self._size > self.max_bytes:
+            self.evict()
+
+    def evict(self, max_bytes = None):
+        """
+        Deletes the least recently used results until the cache fits max_bytes (default: the size of the cache).
+
+        Returns the number of deleted results.
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        entries = sorted(self._entries())
+        size = sum(size for _, size, _ in entries)
+        n_deleted = 0
+        for _, entry_size, path in entries:
+            if size <= max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            size -= entry_size
+            n_deleted += 1
+        self._size = size
+        return n_deleted
+
+    def clear(self):
+        """
+        Deletes all cached results.
+        """
+        self.evict(0)
+
+class Stage:
+    """
+    Lazy stage of the pipeline DAG. Its key hashes its name, code version, parameters and the keys of its inputs (or the content it reads),
+    so it is known without computing anything. Its value is computed from the values of its inputs on first use, unless it is cached;
+    inputs of cached stages are never computed, so a rerun only recomputes the stages downstream of a change.
+
+    Parameters
+    ----------
+    cache: StageCache or None
+        Cache of the results. If None, values are only computed, like without stages.
+    name: str
+        Name of the stage.
+    func: callable
+        Computes the value as func(*input values, **params, **kwargs).
+    inputs: list of Stage, optional
+        Upstream stages.
+    params: dict, optional
+        JSON serialisable parameters, part of the key.
+    kwargs: dict, optional
+        Arguments that don't change the value (i.e. where to save images), not part of the key.
+    version: str or callable, optional
+        Code version of the stage, see code_version; a callable is only called once the key is needed, i.e. with a cache.
+    content: str, optional
+        Hash of the content the stage reads, for stages without inputs, i.e. a file hash.
+    persist: bool, default=True
+        Whether the value is cached on disk. Cheap stages only pass their key on.
+    """
+    def __init__(self, cache, name, func, inputs = (), params = None, kwargs = None, version = "", content = None, persist = True):
+        self.cache = cache
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs)
+        self.params = params or {}
+        self.kwargs = kwargs or {}
+        self.version = version
+        self.content = content
+        self.persist = persist
+        self.computed = False # whether the value was computed rather than loaded
+        self._key = None
+        self._value = _MISSING
+
+    @classmethod
+    def constant(cls, cache, name, value):
+        """
+        Stage of a known value, i.e. a mask, keyed by its content.
+        """
+        stage = cls(cache, name, None, persist=False)
+        stage._key = array_hash(value) if isinstance(value, np.ndarray) else hashlib.sha256(json.dumps(value, sort_keys=True, default=repr).encode()).hexdigest()
+        stage._value = value
+        return stage
+
+    @classmethod
+    def file(cls, cache, name, path, read):
+        """
+        Stage reading a file, keyed by the hash of its content, so renamed or copied files still hit.
+        """
+        return cls(cache, name, lambda: read(path), content=file_hash(path) if cache is not None else None, persist=False)
+
+    @property
+    def key(self):
+        if self._key is None:
+            self._key = hashlib.sha256(json.dumps(
+                [self.name, self.version() if callable(self.version) else self.version, self.params, [stage.key for stage in self.inputs], self.content],
+                sort_keys=True,
+                default=repr
+            ).encode()).hexdigest()
+        return self._key
+
+    def value(self):
+        if self._value is not _MISSING:
+            return self._value
+
+        if self.cache is not None and self.persist:
+            value = self.cache.get(self.key, _MISSING)
+            if value is not _MISSING:
+                self._value = value
+                return value
+
+        self._value = self.func(*(stage.value() for stage in self.inputs), **self.params, **self.kwargs)
+        self.computed = True
+        if self.cache is not None and self.persist:
+            try:
+                self.cache.put(self.key, self._value)
+            except OSError as e: # i.e. a full disk; the result is still used
+                warnings.warn(f"Result of stage {self.name} couldn't be cached: {e!r}")
+        return self._value
@@ -2,6 +2,7 @@ from picamera2 import Picamera2
 from libcamera import controls, Transform
 
 import RPi.GPIO as GPIO
+import os
 import time
 
 GPIO.setmode(GPIO.BCM)
@@ -27,7 +28,10 @@ picam2.set_controls({
 	"AfSpeed": controls.AfSpeedEnum.Fast
 })
 
-picam2.capture_file(f"/home/rubusidaeus/camera_test/{timestr}.jpg")
+save_dir = "/home/rubusidaeus/camera_test" # watched by phase.main.stream
+
+picam2.capture_file(os.path.join(save_dir, f".{timestr}.jpg")) # hidden until complete, so the stream never reads a partial frame
+os.replace(os.path.join(save_dir, f".{timestr}.jpg"), os.path.join(save_dir, f"{timestr}.jpg"))
 
 time.sleep(3)
 GPIO.output(26, GPIO.HIGH)
@@ -0,0 +1,172 @@
+import bisect
+import hashlib
+import json
+import os
+import warnings
+from collections import namedtuple
+from datetime import datetime
+
+from .inputs import read_time
+
+VALID_EXTENSIONS = {".jpg", ".jpeg", ".png"}
+
+Frame = namedtuple("Frame", ["path", "name", "time", "source"])
+
+def read_exif_time(path):
+    """
+    Extracts the capture time from the EXIF data of an image.
+
+    Returns datetime object, or None if the image has no capture time or Pillow is not available.
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+
+    try:
+        with Image.open(path) as img:
+            exif = img.getexif()
+            value = exif.get_ifd(0x8769).get(36867) or exif.get(306) # DateTimeOriginal, DateTime
+        return datetime.strptime(str(value).strip("\x00 "), "%Y:%m:%d %H:%M:%S") if value else None
+    except Exception:
+        return None
+
+def frame_time(path):
+    """
+    Timestamp of a frame, from the filename (DD.MM.YYYY-HH.MM.SS), the EXIF capture time, or the modification time.
+
+    Returns datetime object and the source of the timestamp ("filename", "exif" or "mtime").
+    """
+    t = read_time(path)
+    if t is not None:
+        return t, "filename"
+
+    t = read_exif_time(path)
+    if t is not None:
+        return t, "exif"
+
+    return datetime.fromtimestamp(os.path.getmtime(path)), "mtime"
+
+class FrameCatalog:
+    """
+    Chronologically sorted index of the frames of a timelapse directory.
+    The directory is scanned once; the index can be cached and is reused while the directory's modification time is unchanged.
+    The index is cached in a separate directory (i.e. the save path) by default, so read-only or watched frame directories aren't written to.
+    Behaves like a list of frame paths, so it can be passed wherever image paths are expected.
+
+    Parameters
+    ----------
+    directory: str
+        Directory with the frames.
+    cache_dir: str, optional
+        Directory the index is cached in, as .phase_catalog_<hash of the frame directory>.json. If None, the index isn't cached
+        (unless in_directory is set).
+    in_directory: bool, default=False
+        Whether to cache the index in the frame directory itself, as .phase_catalog.json. Only used without a cache_dir.
+    """
+    def __init__(self, directory, cache_dir: str = None, in_directory = False):
+        if not isinstance(directory, str) or not os.path.isdir(directory):
+            raise TypeError("directory must be a string of directory path.")
+
+        self.directory = directory
+        if cache_dir:
+            key = hashlib.sha256(os.path.abspath(directory).encode()).hexdigest()[:16]
+            self.cache_path = os.path.join(cache_dir, f".phase_catalog_{key}.json")
+        else:
+            self.cache_path = os.path.join(directory, ".phase_catalog.json") if in_directory else None
+
+        self.frames = self._load_cache() if self.cache_path else None
+        if self.frames is None:
+            mtime_ns = os.stat(directory).st_mtime_ns # before the scan, so frames added meanwhile invalidate the index
+            self.frames = self._scan()
+            if self.cache_path:
+                self._save_cache(mtime_ns)
+
+        self.times = [frame.time for frame in self.frames]
+
+    def _scan(self):
+        frames = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            base, ext = os.path.splitext(name)
+            if ext.lower() in VALID_EXTENSIONS and os.path.isfile(path):
+                t, source = frame_time(path)
+                frames.append(Frame(path, base, t, source))
+        frames.sort(key=lambda frame: (frame.time, frame.name))
+        return frames
+
+    def _load_cache(self):
+        try:
+            with open(self.cache_path) as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if cached.get("directory") != os.path.abspath(self.directory) or cached.get("mtime_ns") != os.stat(self.directory).st_mtime_ns:
+            return None # another directory, or files were added or removed
+
+        return [Frame(os.path.join(self.directory, file), os.path.splitext(file)[0], datetime.fromisoformat(t), source)
+                for file, t, source in cached["frames"]]
+
+    def _save_cache(self, mtime_ns):
+        cached = {
+            "directory": os.path.abspath(self.directory),
+            "mtime_ns": mtime_ns,
+            "frames": [[os.path.basename(frame.path), frame.time.isoformat(), frame.source] for frame in self.frames]
+        }
+        in_directory = os.path.dirname(self.cache_path) == self.directory
+        tmp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.cache_path) or ".", exist_ok=True)
+            with open(tmp_path, "w") as f:
+                json.dump(cached, f)
+            os.replace(tmp_path, self.cache_path)
+
+            if in_directory: # creating the index changes the modification time of the directory, rewriting it in place doesn't
+                cached["mtime_ns"] = os.stat(self.directory).st_mtime_ns
+                with open(self.cache_path, "w") as f:
+                    json.dump(cached, f)
+        except OSError as e:
+            warnings.warn(f"Could not cache the frame index of {self.directory}: {e}")
+
+    @property
+    def paths(self):
+        return [frame.path for frame in self.frames]
+
+    @property
+    def names(self):
+        return [frame.name for frame in self.frames]
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __iter__(self):
+        return iter(self.paths)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [frame.path for frame in self.frames[idx]]
+        return self.frames[idx].path
+
+    def between(self, t1 = None, t2 = None):
+        """
+        Returns the frames taken between t1 and t2 (inclusive). None leaves the range open.
+        """
+        start = 0 if t1 is None else bisect.bisect_left(self.times, t1)
+        end = len(self.frames) if t2 is None else bisect.bisect_right(self.times, t2)
+        return self.frames[start:end]
+
+    def every(self, n, start = 0):
+        """
+        Returns every nth frame, beginning with frame start.
+        """
+        return self.frames[start::n]
+
+    def hours(self):
+        """
+        Returns the time of each frame in hours since the first frame.
+        """
+        if not self.frames:
+            return []
+        t0 = self.times[0]
+        return [(t - t0).total_seconds() / 3600.0 for t in self.times]
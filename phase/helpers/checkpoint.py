@@ -0,0 +1,134 @@
+import json
+import numpy as np
+import os
+
+from .timelapse import DishState
+from ..colony_detection.tracking import ColonyTracker
+
+TRACK_COLUMNS = 5 # id, time, x, y, size of a trajectory point
+
+class Checkpoint:
+    """
+    Checkpoint of a timelapse run in a directory: masks in a compressed .npz, dish coordinates, dish states and progress in a small JSON manifest.
+    Both files are replaced atomically, so a crash never leaves a partial checkpoint. Masks are only written when they change.
+    Of colony trackers, the manifest holds the active colonies; trajectories are appended to a track file per dish (float64 rows of TRACK_COLUMNS),
+    of which the manifest holds the number of saved points. Points after those, from a crash before the manifest was replaced, are overwritten.
+
+    Parameters
+    ----------
+    directory: str
+        Directory of the checkpoint, created if it doesn't exist.
+    """
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.manifest_path = os.path.join(directory, "checkpoint.json")
+        self.masks_path = os.path.join(directory, "checkpoint_masks.npz")
+        self._tracks = {} # per dish: saved points per colony, ids of the active colonies and number of points in the track file
+
+    def _tracks_path(self, idx):
+        return os.path.join(self.directory, f"checkpoint_tracks_{idx}.bin")
+
+    def _save_tracks(self, idx, tracker):
+        """
+        Appends the trajectory points added since the last save to the track file of a dish.
+        Only colonies active at the last save and new colonies can have new points, so only these are checked.
+
+        Returns the number of points in the track file.
+        """
+        saved, active, n_points = self._tracks.get(idx, ([], [], 0))
+        ids = sorted(set(active) | set(range(len(saved), len(tracker.colonies))))
+        saved.extend([0] * (len(tracker.colonies) - len(saved)))
+
+        rows = []
+        for i in ids:
+            trajectory = tracker.colonies[i].trajectory
+            rows.extend((i, *point) for point in trajectory[saved[i]:])
+            saved[i] = len(trajectory)
+
+        path = self._tracks_path(idx)
+        with open(path, "r+b" if os.path.isfile(path) else "wb") as f:
+            f.seek(n_points * TRACK_COLUMNS * 8)
+            np.array(rows, dtype=np.float64).reshape(-1, TRACK_COLUMNS).tofile(f)
+            f.truncate()
+
+        n_points += len(rows)
+        self._tracks[idx] = (saved, list(tracker.active), n_points)
+        return n_points
+
+    def exists(self):
+        return os.path.isfile(self.manifest_path)
+
+    def save(self, coordinates, dish_states, fg_masks = None, bg_masks = None, **progress):
+        """
+        Saves the checkpoint.
+
+        Parameters
+        ----------
+        coordinates: list of tuples
+            Coordinates of the dishes.
+        dish_states: list of DishState
+            State of each dish.
+        fg_masks, bg_masks: list of np.ndarray, optional
+            Foreground and background masks; only written if passed.
+        **progress
+            JSON serialisable progress, e.g. the index of the last processed frame.
+        """
+        if fg_masks is not None or bg_masks is not None:
+            arrays = {f"fg_{i}": mask for i, mask in enumerate(fg_masks or [])}
+            arrays.update({f"bg_{i}": mask for i, mask in enumerate(bg_masks or [])})
+            with open(self.masks_path + ".tmp", "wb") as f:
+                np.savez_compressed(f, **arrays)
+            os.replace(self.masks_path + ".tmp", self.masks_path)
+
+        manifest = {
+            "coordinates": [[int(v) for v in c] for c in coordinates],
+            "dishes": [{
+                "fine": state.fine,
+                "fine_buffer": state.fine_buffer,
+                "history": state.history,
+                "tracker": {**state.tracker.state(), "n_points": self._save_tracks(idx, state.tracker)} if state.tracker is not None else None
+            } for idx, state in enumerate(dish_states)],
+            **progress
+        }
+        with open(self.manifest_path + ".tmp", "w") as f:
+            json.dump(manifest, f)
+        os.replace(self.manifest_path + ".tmp", self.manifest_path)
+
+    def load(self):
+        """
+        Loads the checkpoint.
+
+        Returns
+        -------
+        dict or None
+            "coordinates", "dish_states", "fg_masks" and "bg_masks" (None if not saved) and the saved progress;
+            None if there is no checkpoint.
+        """
+        if not self.exists():
+            return None
+
+        with open(self.manifest_path) as f:
+            manifest = json.load(f)
+
+        dish_states = []
+        for idx, dish in enumerate(manifest.pop("dishes")):
+            state = DishState(dish["fine_buffer"])
+            state.fine = dish["fine"]
+            state.history = [tuple(entry) for entry in dish["history"]]
+            if dish.get("tracker") is not None:
+                n_points = dish["tracker"]["n_points"]
+                points = np.fromfile(self._tracks_path(idx), dtype=np.float64, count=n_points * TRACK_COLUMNS).reshape(-1, TRACK_COLUMNS)
+                state.tracker = ColonyTracker.from_state(dish["tracker"], points)
+                self._tracks[idx] = ([len(c.trajectory) for c in state.tracker.colonies], list(state.tracker.active), n_points)
+            dish_states.append(state)
+
+        n_dishes = len(dish_states)
+        fg_masks, bg_masks = None, None
+        if os.path.isfile(self.masks_path):
+            with np.load(self.masks_path) as masks:
+                fg_masks = [masks[f"fg_{i}"] for i in range(n_dishes)] if "fg_0" in masks else None
+                bg_masks = [masks[f"bg_{i}"] for i in range(n_dishes)] if "bg_0" in masks else None
+
+        manifest["coordinates"] = [tuple(c) for c in manifest["coordinates"]]
+        return {**manifest, "dish_states": dish_states, "fg_masks": fg_masks, "bg_masks": bg_masks}
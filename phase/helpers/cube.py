@@ -0,0 +1,157 @@
+import json
+import os
+from contextlib import nullcontext
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+from ..image_manipulation.dish_detection import crop, crop_boxes, crop_masks
+from .frames import FrameSource
+
+INDEX_NAME = "cube_index.json"
+
+def _signature(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+class DishCubes:
+    """
+    Cropped frames of every dish of a timelapse, in one memory-mapped uint8 array of shape (T, H, W, C) per dish,
+    with a JSON index of the frames (paths, names, hours since the first frame) and the dish coordinates.
+    Dishes are read as views into the files, so repeat runs over an experiment skip decoding and cropping.
+    Made with build_cubes.
+
+    Parameters
+    ----------
+    directory: str
+        Directory of the cubes.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, INDEX_NAME)) as f:
+            self.index = json.load(f)
+
+        self.paths = self.index["paths"]
+        self.names = self.index["names"]
+        self.hours = self.index["hours"]
+        self.coordinates = [tuple(c) for c in self.index["coordinates"]]
+        self.frame_shape = tuple(self.index["frame_shape"])
+        self.cubes = [np.load(os.path.join(directory, f"dish_{idx+1}.npy"), mmap_mode="r") for idx in range(len(self.coordinates))]
+        self.masks = crop_masks(self.coordinates, self.frame_shape)
+
+    @classmethod
+    def open(cls, directory, image_paths = None):
+        """
+        Opens the cubes in a directory, if they exist and still match the images.
+
+        Parameters
+        ----------
+        directory: str
+            Directory of the cubes.
+        image_paths: list of str, optional
+            Images the cubes must have been made from, unchanged since.
+
+        Returns
+        -------
+        DishCubes or None
+            None if there are no cubes or they don't match.
+        """
+        if not os.path.isfile(os.path.join(directory, INDEX_NAME)):
+            return None
+        cubes = cls(directory)
+        if image_paths is not None and not cubes.matches(image_paths):
+            return None
+        return cubes
+
+    def matches(self, image_paths):
+        """
+        Returns whether the cubes were made from the images, which haven't changed since.
+        """
+        image_paths = [os.path.abspath(path) for path in image_paths]
+        if image_paths != self.paths:
+            return False
+        try:
+            return all(_signature(path) == signature for path, signature in zip(image_paths, self.index["signatures"]))
+        except OSError:
+            return False
+
+    def __len__(self):
+        return len(self.paths)
+
+    def dish(self, idx):
+        """
+        Returns the read-only (T, H, W, C) cube of a dish.
+        """
+        return self.cubes[idx]
+
+    def crop(self, t):
+        """
+        Returns the dishes of frame t and their masks, like crop on the full frame, without copying.
+        """
+        return [cube[t] for cube in self.cubes], self.masks
+
+def build_cubes(directory, image_paths, coordinates, names = None, hours = None, max_frames = 8, n_threads = 2, frames = None):
+    """
+    Decodes a timelapse once and writes the cropped dishes of every frame into memory-mapped cubes.
+    The index is written last, so interrupted builds are never opened.
+
+    Parameters
+    ----------
+    directory: str
+        Directory of the cubes, created if it doesn't exist.
+    image_paths: list of str
+        Paths to the images of the timelapse, in chronological order.
+    coordinates: list of tuples
+        Coordinates of the dishes.
+    names: list of str, optional
+        Names of the frames. Defaults to the file names without extension.
+    hours: list of float, optional
+        Hours since the first frame.
+    max_frames: int, default=8
+        Maximum number of decoded frames held in memory.
+    n_threads: int, default=2
+        Number of decoding threads.
+    frames: FrameSource, optional
+        Source of the frames of image_paths, i.e. the one make_masks decoded its frames from, so they aren't decoded again.
+        If None, the frames are decoded by a FrameSource of max_frames and n_threads.
+
+    Returns
+    -------
+    DishCubes
+        The cubes.
+    """
+    os.makedirs(directory, exist_ok=True)
+    index_path = os.path.join(directory, INDEX_NAME)
+    if os.path.isfile(index_path):
+        os.remove(index_path)
+
+    cubes = None
+    with nullcontext(frames) if frames is not None else FrameSource(image_paths, max_frames=max_frames, n_threads=n_threads) as source:
+        for t, (_, frame) in enumerate(source):
+            if cubes is None:
+                frame_shape = frame.shape
+                cubes = [
+                    open_memmap(os.path.join(directory, f"dish_{idx+1}.npy"), mode="w+", dtype=np.uint8, shape=(len(image_paths), y2-y1, x2-x1, *frame.shape[2:]))
+                    for idx, (x1, y1, x2, y2) in enumerate(crop_boxes(coordinates, frame.shape))
+                ]
+            dishes, _ = crop(frame, coordinates)
+            for cube, dish in zip(cubes, dishes):
+                cube[t] = dish
+
+    for cube in cubes:
+        cube.flush()
+    del cubes
+
+    index = {
+        "paths": [os.path.abspath(path) for path in image_paths],
+        "signatures": [_signature(path) for path in image_paths],
+        "names": list(names) if names is not None else [os.path.splitext(os.path.basename(path))[0] for path in image_paths],
+        "hours": list(hours) if hours is not None else None,
+        "coordinates": [[int(v) for v in c] for c in coordinates],
+        "frame_shape": list(frame_shape)
+    }
+    with open(index_path + ".tmp", "w") as f:
+        json.dump(index, f)
+    os.replace(index_path + ".tmp", index_path)
+
+    return DishCubes(directory)
@@ -0,0 +1,120 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from .inputs import read_img
+from .profiling import stage
+
+def load_frame(path):
+    """
+    Decodes an image file.
+
+    Returns image, raises a ValueError if the file can't be decoded.
+    """
+    with stage("decode", frame=os.path.splitext(os.path.basename(path))[0]): # frames are decoded ahead, on other threads
+        img = read_img(path)
+    if img is None:
+        raise ValueError(f"Could not decode image {path}.")
+    return img
+
+class FrameSource:
+    """
+    Decodes frames of a timelapse ahead of use on a bounded thread pool.
+    Decoded frames are kept in an LRU cache. Frames used again much later (i.e. the frames of make_masks, used again by the main loop)
+    are pinned outside of the cache until they are iterated, so they are decoded once however many frames are decoded in between.
+
+    Parameters
+    ----------
+    paths: list of str
+        Paths of the frames, in the order they are iterated.
+    max_frames: int, default=8
+        Maximum number of decoded or decoding frames held in the LRU cache; pinned frames come on top.
+    n_threads: int, default=2
+        Number of decoding threads.
+    prefetch: int, optional
+        Number of frames decoded ahead while iterating. Defaults to max_frames - 1.
+    """
+    def __init__(self, paths, max_frames = 8, n_threads = 2, prefetch: int = None):
+        if max_frames < 1:
+            raise ValueError("max_frames must be at least 1.")
+
+        self.paths = list(paths)
+        self.max_frames = max_frames
+        self.prefetch = min(max_frames - 1, max_frames - 1 if prefetch is None else prefetch)
+
+        self._pool = ThreadPoolExecutor(max_workers=n_threads)
+        self._cache = OrderedDict() # path -> future of the decoded frame, least recently used first
+        self._pinned = {} # path -> future of a pinned frame, outside of the cache
+        self._lock = threading.Lock()
+
+    def _submit(self, path, touch):
+        with self._lock:
+            if path in self._pinned:
+                return self._pinned[path]
+            if path in self._cache:
+                if touch:
+                    self._cache.move_to_end(path)
+                return self._cache[path]
+
+            while len(self._cache) >= self.max_frames: # memory cap, evicts the least recently used frame
+                self._cache.popitem(last=False)
+
+            future = self._pool.submit(load_frame, path)
+            self._cache[path] = future
+            return future
+
+    def get(self, path):
+        """
+        Returns the decoded frame, from the cache if available.
+        """
+        return self._submit(path, touch=True).result()
+
+    def request(self, paths):
+        """
+        Starts decoding frames in the background, as far as the memory cap allows.
+        """
+        for path in list(paths)[:self.max_frames]:
+            self._submit(path, touch=False)
+
+    def pin(self, paths):
+        """
+        Starts decoding frames in the background and keeps them outside of the memory cap until they are iterated (or unpinned).
+        """
+        for path in paths:
+            with self._lock:
+                if path not in self._pinned:
+                    future = self._cache.pop(path, None)
+                    self._pinned[path] = future if future is not None else self._pool.submit(load_frame, path)
+
+    def unpin(self, path):
+        """
+        Releases a pinned frame.
+        """
+        with self._lock:
+            self._pinned.pop(path, None)
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __iter__(self):
+        """
+        Yields (path, frame) for all paths, decoding the next frames in the background. Pinned frames are released once yielded.
+        """
+        for i, path in enumerate(self.paths):
+            frame = self.get(path)
+            self.unpin(path)
+            self.request(self.paths[i+1:i+1+self.prefetch])
+            yield path, frame
+
+    def close(self):
+        self._pool.shutdown(wait=True, cancel_futures=True)
+        with self._lock:
+            self._cache.clear()
+            self._pinned.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
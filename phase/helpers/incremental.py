@@ -0,0 +1,245 @@
+import cv2 as cv
+import numpy as np
+
+from ..image_manipulation.preprocessing import _area_lut
+from ..colony_detection.counting import blob_params, component_candidates, merge_candidates
+from ..colony_detection.tracking import keypoints_to_array
+
+class IncrementalDish:
+    """
+    Preprocesses and counts one dish of a timelapse incrementally; the same result as process_dish with fine=True.
+    Each frame is diffed against the previous one in tiles. Only around dirty tiles the adaptive threshold is recomputed,
+    with a halo of half the block size, and the area filter, erosion and component statistics are rerun,
+    in windows grown until every changed component lies inside. Colonies of clean tiles are reused.
+
+    Tiles whose green channel changed by at most tolerance are treated as clean and keep the previous frame,
+    so the result is that of full processing of a frame made of the dirty tiles of this frame and the clean tiles of earlier frames.
+    With tolerance=0 it matches full processing exactly.
+
+    Parameters
+    ----------
+    mask: np.ndarray, optional
+        Mask of the background area outside of the dish.
+    fg_mask: np.ndarray, optional
+        Foreground mask of the dish, from make_masks.
+    bg_mask: np.ndarray, optional
+        Background mask of the dish, from make_masks.
+    tile_size: int, default=64
+        Size of the tiles in pxs.
+    tolerance: int, default=0
+        Largest change of a pixel in a clean tile.
+    max_fraction: float, default=0.7
+        Fraction of the dish above which a stage is rerun on the full dish instead, as the halos of scattered tiles cost more.
+    s, C, kernel_size, min_area, max_area:
+        Parameters of preprocess.
+    params: dict, optional
+        Parameters overriding BLOB_PARAMS.
+    """
+    def __init__(self, mask = None, fg_mask = None, bg_mask = None, tile_size = 64, tolerance = 0, max_fraction = 0.7, s = 121, C = 11, kernel_size = 3, min_area = 5, max_area = 200, params: dict = None):
+        self.tile_size = tile_size
+        self.tolerance = tolerance
+        self.max_fraction = max_fraction
+        self.s, self.C = s, C
+        self.min_area, self.max_area = min_area, max_area
+        self.kernel = cv.getStructuringElement(cv.MORPH_ELLIPSE, (kernel_size, kernel_size))
+        self.band = 2 * (kernel_size // 2) + 1 # components this close to a window edge may reach outside of it
+        self.p = blob_params(params)
+
+        # mask, fg_mask and bg_mask combined, as applied one after another by preprocess
+        keep = None
+        for m in (mask, fg_mask, None if bg_mask is None else cv.bitwise_not(bg_mask)):
+            if m is not None:
+                keep = m != 0 if keep is None else keep & (m != 0)
+        self.keep = None if keep is None else np.where(keep, 255, 0).astype(np.uint8)
+
+        self.green = None # reference frame: last dirty version of every tile
+        self.dirty_fraction = 1.0 # fraction of dirty tiles in the last frame
+
+    @property
+    def preprocessed(self):
+        return self.eroded
+
+    def process(self, dish, return_colonies = False):
+        """
+        Preprocesses the next frame of the dish and counts its colonies.
+
+        Parameters
+        ----------
+        dish: np.ndarray
+            Cropped dish.
+        return_colonies: bool, default=False
+            Whether to also return the detected colonies, for tracking.
+
+        Returns
+        -------
+        int
+            Number of detected colonies.
+        np.ndarray
+            Detected colonies as (x, y, size) rows, only if return_colonies is True.
+        """
+        green = np.ascontiguousarray(dish[:, :, 1])
+
+        if self.green is None or self.green.shape != green.shape:
+            self._full(green)
+        else:
+            self._update(green)
+
+        if return_colonies:
+            return len(self.keypoints), keypoints_to_array(self.keypoints)
+        return len(self.keypoints)
+
+    def _threshold(self, green):
+        return cv.adaptiveThreshold(
+            src=green,
+            maxValue=255,
+            adaptiveMethod=cv.ADAPTIVE_THRESH_GAUSSIAN_C,
+            thresholdType=cv.THRESH_BINARY_INV,
+            blockSize=self.s,
+            C=self.C
+        )
+
+    def _erode(self, filtered, keep):
+        masked = cv.bitwise_and(filtered, filtered, mask=keep) if keep is not None else filtered
+        return cv.morphologyEx(masked, cv.MORPH_ERODE, self.kernel)
+
+    def _full(self, green):
+        self.green = green.copy()
+        self.threshold = self._threshold(self.green)
+
+        _, labels, stats, _ = cv.connectedComponentsWithStats(self.threshold, connectivity=8)
+        self.filtered = _area_lut(stats, self.min_area, self.max_area)[labels]
+        self.eroded = self._erode(self.filtered, self.keep)
+
+        self.candidates = component_candidates(self.eroded, self.p)
+        self.keypoints = merge_candidates(self.candidates, self.p)
+        self.dirty_fraction = 1.0
+
+    def _rects(self, grid, rows = 4):
+        """
+        Rectangles (x0, y0, x1, y1) in pxs covering the set tiles of a tile grid: runs of columns with set tiles in bands of rows.
+        Bands bound the clean area covered, unlike bounding boxes of scattered tiles.
+        """
+        t = self.tile_size
+        h, w = self.green.shape
+        rects = []
+        for r in range(0, grid.shape[0], rows):
+            columns = np.flatnonzero(grid[r:r+rows].any(axis=0))
+            if not len(columns):
+                continue
+            breaks = np.flatnonzero(np.diff(columns) > 1)
+            for c0, c1 in zip(columns[np.r_[0, breaks + 1]], columns[np.r_[breaks, len(columns) - 1]]):
+                rects.append((c0 * t, r * t, min((c1 + 1) * t, w), min((r + rows) * t, h)))
+        return rects
+
+    def _tile_grid(self, img):
+        """
+        Maximum of every tile of an image.
+        """
+        t = self.tile_size
+        h, w = img.shape
+        padded = np.pad(img, ((0, -h % t), (0, -w % t)))
+        return padded.reshape(padded.shape[0] // t, t, padded.shape[1] // t, t).max(axis=(1, 3))
+
+    def _update(self, green):
+        t = self.tile_size
+        h, w = green.shape
+
+        dirty = self._tile_grid(cv.absdiff(green, self.green)) > self.tolerance
+        self.dirty_fraction = dirty.mean()
+        if not dirty.any():
+            return
+
+        dirty_pxs = np.repeat(np.repeat(dirty, t, axis=0), t, axis=1)[:h, :w]
+        np.copyto(self.green, green, where=dirty_pxs)
+
+        # THRESHOLD: tiles within half a block of a dirty tile, computed with a halo of half a block
+        halo = self.s // 2
+        reach = -(-halo // t)
+        affected = cv.dilate(dirty.astype(np.uint8), np.ones((2 * reach + 1, 2 * reach + 1), np.uint8))
+
+        rects = [(x0, y0, x1, y1, max(x0 - halo, 0), max(y0 - halo, 0), min(x1 + halo, w), min(y1 + halo, h)) for x0, y0, x1, y1 in self._rects(affected)]
+        if sum((hx1 - hx0) * (hy1 - hy0) for *_, hx0, hy0, hx1, hy1 in rects) > self.max_fraction * h * w:
+            rects = [(0, 0, w, h, 0, 0, w, h)] # scattered changes: the halos cost more than the full dish
+
+        threshold_changed = False
+        for x0, y0, x1, y1, hx0, hy0, hx1, hy1 in rects:
+            threshold = self._threshold(self.green[hy0:hy1, hx0:hx1])[y0-hy0:y1-hy0, x0-hx0:x1-hx0]
+            if not threshold_changed and not np.array_equal(threshold, self.threshold[y0:y1, x0:x1]):
+                threshold_changed = True
+            self.threshold[y0:y1, x0:x1] = threshold
+
+        if not threshold_changed:
+            return
+
+        # AREA FILTER: components can span the dish (e.g. the area outside of it), so the single labelling pass runs on the full dish
+        _, labels, stats, _ = cv.connectedComponentsWithStats(self.threshold, connectivity=8)
+        filtered = _area_lut(stats, self.min_area, self.max_area)[labels]
+        changed = cv.compare(filtered, self.filtered, cv.CMP_NE)
+        self.filtered = filtered
+
+        changed_tiles = self._tile_grid(changed) > 0
+        if not changed_tiles.any():
+            return
+
+        # EROSION AND COLONIES: windows around the tiles with changed components
+        # windows may overlap; each one only replaces the colonies inside of it, which are the same for any of them
+        if changed_tiles.mean() > self.max_fraction / 4: # many small windows cost more than one pass over the full dish
+            self.eroded = self._erode(self.filtered, self.keep)
+            self.candidates = component_candidates(self.eroded, self.p)
+        else:
+            for window in self._rects(changed_tiles, rows=2):
+                self._update_window(window)
+
+        self.keypoints = merge_candidates(self.candidates, self.p)
+
+    def _update_window(self, window):
+        h, w = self.green.shape
+        r = self.kernel.shape[0] // 2
+        margin = self.band + 2 * r
+        x0, y0, x1, y1 = window
+        x0, y0, x1, y1 = max(x0 - margin, 0), max(y0 - margin, 0), min(x1 + margin, w), min(y1 + margin, h)
+
+        while True:
+            # the erosion is only valid away from the window edges, except image edges
+            ix0, iy0 = (x0 + r if x0 > 0 else 0), (y0 + r if y0 > 0 else 0)
+            ix1, iy1 = (x1 - r if x1 < w else w), (y1 - r if y1 < h else h)
+            eroded = self._erode(self.filtered[y0:y1, x0:x1], self.keep[y0:y1, x0:x1] if self.keep is not None else None)
+            eroded = eroded[iy0-y0:iy1-y0, ix0-x0:ix1-x0]
+            old = self.eroded[iy0:iy1, ix0:ix1]
+            changed = eroded != old
+
+            # colonies within band of a window edge, except image edges, may reach outside of the window
+            inner = (ix0 + self.band if ix0 > 0 else 0, iy0 + self.band if iy0 > 0 else 0,
+                     ix1 - self.band if ix1 < w else w, iy1 - self.band if iy1 < h else h)
+            edge = np.ones(changed.shape, bool)
+            edge[inner[1]-iy0:inner[3]-iy0, inner[0]-ix0:inner[2]-ix0] = False
+
+            if (x0, y0, x1, y1) == (0, 0, w, h) or not _open_changed(eroded, edge, changed) and not _open_changed(old, edge, changed):
+                break
+
+            # a changed colony reaches outside of the window
+            grow = self.tile_size
+            x0, y0, x1, y1 = max(x0 - grow, 0), max(y0 - grow, 0), min(x1 + grow, w), min(y1 + grow, h)
+
+        self.eroded[iy0:iy1, ix0:ix1] = eroded
+
+        # colonies inside of the window are replaced, the ones reaching its edges are unchanged
+        new = component_candidates(eroded, self.p, origin=(ix0, iy0), width=w)
+        old_inside, new_inside = _inside(self.candidates["bbox"], inner), _inside(new["bbox"], inner)
+        self.candidates = {key: np.concatenate([self.candidates[key][~old_inside], new[key][new_inside]]) for key in self.candidates}
+
+def _open_changed(binary, edge, changed):
+    """
+    Whether a component of a binary window reaching the edge of the window has changed pixels.
+    """
+    if not changed.any():
+        return False
+    n, labels = cv.connectedComponents(binary, connectivity=8)
+    is_open = np.zeros(n, bool)
+    is_open[labels[edge]] = True
+    is_open[0] = False
+    return is_open[labels[changed]].any()
+
+def _inside(bbox, rect):
+    x0, y0, x1, y1 = rect
+    return (bbox[:, 0] >= x0) & (bbox[:, 1] >= y0) & (bbox[:, 0] + bbox[:, 2] <= x1) & (bbox[:, 1] + bbox[:, 3] <= y1)
@@ -1,4 +1,5 @@
 import cv2 as cv, numpy as np, os
+import hashlib
 import re
 from pypdf import PdfReader
 from datetime import datetime
@@ -29,6 +30,16 @@ def read_img(source):
         raise TypeError("source must be a file path or a NumPy array")
     return img
 
+def file_hash(path, chunk_size = 1 << 20):
+    """
+    Returns the SHA-256 hex digest of a file's contents.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
 def read_time(filename):
     """
     Extracts datetime from image filenames, i.e. '01.10.2025-17.40.02.jpg'
@@ -61,6 +72,7 @@ def read_image_paths(directory):
     """
     Extracts all image files (.jpg, .jpeg, .png) from a given directory.
     For ease of use in pipelines that depend on multiple image files.
+    Images with a timestamp in their name (DD.MM.YYYY-HH.MM.SS) are sorted chronologically, others by name after them.
 
     Returns full image paths as well as base names.
 
@@ -84,7 +96,11 @@ def read_image_paths(directory):
     image_paths = []
     base_names = []
 
-    for img in sorted(os.listdir(directory)): # sorts all entries from given directory
+    def sort_key(name): # lexical order of DD.MM.YYYY names breaks across months
+        t = read_time(name)
+        return (t is None, t or datetime.min, name)
+
+    for img in sorted(os.listdir(directory), key=sort_key): # sorts all entries from given directory
 
         full_path = os.path.join(directory, img) # grabs full path
 
@@ -96,6 +112,54 @@ def read_image_paths(directory):
 
     return image_paths, base_names
 
+def parse_pdf_pages(
+        source,
+        pages = None,
+        regex_name_pattern = r"(WT\s*\d+\s+P\s*\d+)"
+):
+    r"""
+    Parses pages of a pdf exported by the Interscience cell counter into records of the dish name, colony count and image.
+    Pages without a name or count are skipped.
+
+    Parameters
+    ----------
+    source: str
+        String of a filepath to the pdf file.
+    pages: iterable of int, optional
+        Indices of the pages to parse. If None, all pages are parsed.
+    regex_name_pattern: str, default=r"(WT\s*\d+\s+P\s*\d+)"
+        Regular expression pattern of the dish naming scheme.
+
+    Returns
+    -------
+    list of dict
+        Per page "page", "name", "count", "image" (encoded image of the dish, or None) and "extension" of the image.
+    """
+    pattern_count = re.compile(r"Count :\s*(\d+)")
+    pattern_name = re.compile(regex_name_pattern)
+
+    doc = PdfReader(source)
+    pages = range(len(doc.pages)) if pages is None else pages
+
+    records = []
+    for page_idx in pages:
+        page = doc.pages[page_idx]
+        text = page.extract_text()
+
+        counts, names = pattern_count.findall(text), pattern_name.findall(text)
+        if not counts or not names:
+            continue
+
+        images = page.images[1:2] # the dish; the first image is the header
+        records.append({
+            "page": page_idx,
+            "name": str(names[0]).replace(" ", "_"),
+            "count": int(counts[0]),
+            "image": images[0].data if images else None,
+            "extension": os.path.splitext(images[0].name)[1].lower() if images else None
+        })
+    return records
+
 def read_pdf(
         source,
         save_images = False,
@@ -103,9 +167,9 @@ def read_pdf(
         file_name = "from_pdf",
         regex_name_pattern = r"(WT\s*\d+\s+P\s*\d+)"
 ):
-    """
+    r"""
     Reads pdf data exported by the Interscience cell counter and extracts images, dish names, and cell counts.
-    The data can be then used as ground truth for validation.
+    The data can be then used as ground truth for validation. phase.helpers.validation parses pdfs in parallel and caches the results.
 
     Returns a dictionary of the dish names with the associated value counts.
 
@@ -118,7 +182,7 @@ def read_pdf(
     save_path: str, default = ""
         String of a path to where the detected images should be saved.
     file_name: str, default = "from_pdf"
-        String of the file name the images should be saved as.
+        String of the file name the images should be saved as, followed by the dish name.
     regex_name_pattern: str, default = r"(WT\s*\d+\s+P\s*\d+)"
         Regular expression pattern of the dish naming scheme.
 
@@ -128,36 +192,18 @@ def read_pdf(
         Dictionary of plate names with associated colony counts.
 
     """
+    records = parse_pdf_pages(source, regex_name_pattern=regex_name_pattern)
+
     if save_images:
-        save_folder = save_path + r"\FromPDF"
+        save_folder = os.path.join(save_path, "FromPDF")
         os.makedirs(save_folder, exist_ok=True)
 
-    pattern_count = re.compile(r"Count :\s*(\d+)")
-    pattern_name = re.compile(regex_name_pattern)
-
-    doc = PdfReader(source)
-
-    all_counts = []
-    all_names = []
-
-    for page in doc.pages:
-        text = page.extract_text()
-
-        count = int(pattern_count.findall(text)[0])
-        all_counts.append(count)
-
-        name = str(pattern_name.findall(text)[0]).replace(" ", "_")
-        all_names.append(name)
-
-        if save_images:
-            for idx, image in enumerate(page.images[1:2], start=1): #change the slice, and naming to get all images
-                save_name = f"{file_name}_{idx+1}"
-                with open(f"{os.path.join(save_folder, save_name)}.jpg", "wb") as fp:
-                    fp.write(image.data)
-
-    output = dict(zip(all_names, all_counts))
+        for record in records:
+            if record["image"] is not None:
+                with open(os.path.join(save_folder, f"{file_name}_{record['name']}{record['extension']}"), "wb") as fp:
+                    fp.write(record["image"])
 
-    return(output)
+    return {record["name"]: record["count"] for record in records}
 
 def show_image(
         source,
@@ -0,0 +1,132 @@
+import atexit
+import cv2 as cv
+import os
+import threading
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+from .profiling import stage
+
+class ImageWriter:
+    """
+    Encodes and writes images on a background thread pool.
+    At most max_pending images are queued; further writes block until one is done.
+    Images must not be modified after they are passed to write.
+
+    Parameters
+    ----------
+    n_threads: int, default=2
+        Number of encoding threads.
+    max_pending: int, default=16
+        Maximum number of queued images.
+    fmt: str, optional
+        Image format ("png", "jpg") replacing the extension of every written file, e.g. "jpg" for fast debug artifacts.
+        If None, the format follows the file extension.
+    png_compression: int, default=1
+        PNG compression level, 0-9; low levels are considerably faster to encode.
+    jpeg_quality: int, default=90
+        JPEG quality, 0-100.
+    """
+    def __init__(self, n_threads = 2, max_pending = 16, fmt: str = None, png_compression = 1, jpeg_quality = 90):
+        self.fmt = fmt
+        self.png_compression = png_compression
+        self.jpeg_quality = jpeg_quality
+
+        self._pool = ThreadPoolExecutor(max_workers=n_threads)
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._futures = set()
+        self._lock = threading.Lock()
+
+    def _params(self, ext):
+        if ext == ".png":
+            return [cv.IMWRITE_PNG_COMPRESSION, self.png_compression]
+        if ext in (".jpg", ".jpeg"):
+            return [cv.IMWRITE_JPEG_QUALITY, self.jpeg_quality]
+        return []
+
+    def _write(self, path, img):
+        try:
+            with stage("write"):
+                directory = os.path.dirname(path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                if not cv.imwrite(path, img, self._params(os.path.splitext(path)[1].lower())):
+                    raise IOError(f"Could not write image {path}.")
+        except Exception as e: # a failed debug image must not abort processing
+            warnings.warn(f"Saving image {path} failed: {e}")
+        finally:
+            self._slots.release()
+
+    def write(self, path, img):
+        """
+        Queues an image to be written, blocking while max_pending images are queued.
+
+        Returns the path the image is written to.
+        """
+        if self.fmt:
+            path = f"{os.path.splitext(path)[0]}.{self.fmt.lstrip('.')}"
+
+        self._slots.acquire() # backpressure
+        future = self._pool.submit(self._write, path, img)
+        with self._lock:
+            self._futures.add(future)
+        future.add_done_callback(self._done)
+        return path
+
+    def _done(self, future):
+        with self._lock:
+            self._futures.discard(future)
+
+    def flush(self):
+        """
+        Waits until all queued images are written.
+        """
+        with self._lock:
+            futures = list(self._futures)
+        for future in futures:
+            future.result()
+
+    def close(self):
+        self.flush()
+        self._pool.shutdown()
+
+_writer = None
+_writer_lock = threading.Lock()
+
+def get_writer():
+    """
+    Returns the shared image writer all save paths of the package go through.
+    """
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = ImageWriter()
+        return _writer
+
+def configure_writer(**kwargs):
+    """
+    Replaces the shared image writer, after flushing the current one. Takes the parameters of ImageWriter.
+    """
+    global _writer
+    with _writer_lock:
+        if _writer is not None:
+            _writer.close()
+        _writer = ImageWriter(**kwargs)
+        return _writer
+
+def save_image(path, img):
+    """
+    Saves an image through the shared image writer, creating its directory.
+
+    Returns the path the image is written to.
+    """
+    return get_writer().write(path, img)
+
+def flush_images():
+    """
+    Waits until all images queued on the shared image writer are written.
+    """
+    if _writer is not None:
+        _writer.flush()
+
+atexit.register(flush_images)
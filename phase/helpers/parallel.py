@@ -0,0 +1,249 @@
+import cv2 as cv
+import numpy as np
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+from multiprocessing.util import Finalize
+
+from ..image_manipulation.dish_detection import crop
+from .timelapse import process_dish
+from .cube import DishCubes
+from .outputs import flush_images
+
+def init_worker(cv_threads = 1):
+    """
+    Initializes a worker process of a pool.
+    Limits OpenCV's internal threading, so that n workers don't start n times as many threads as there are cores,
+    and flushes images queued by the worker when it exits.
+
+    Parameters
+    ----------
+    cv_threads: int, default=1
+        Number of threads OpenCV may use in the worker.
+    """
+    cv.setNumThreads(cv_threads)
+    Finalize(None, flush_images, exitpriority=10) # images queued by the worker are written before it exits
+
+def _call(func, kwargs):
+    try:
+        return func(**kwargs), None
+    except Exception as e: # a failing item must not abort the rest of the batch
+        return None, e
+
+def run_parallel(
+        func,
+        kwargs_list,
+        n_workers = None,
+        cv_threads = 1,
+        progress = None
+):
+    """
+    Runs a function over a list of keyword arguments on a process pool.
+    On Windows, the calling script needs an `if __name__ == "__main__":` guard.
+
+    Returns results in input order.
+
+    Parameters
+    ----------
+    func: callable
+        Module level (picklable) function to run.
+    kwargs_list: list of dict
+        Keyword arguments for each call.
+    n_workers: int, optional
+        Number of worker processes. If None, the number of CPUs is used; 1 runs everything in the current process.
+    cv_threads: int, default=1
+        Number of threads OpenCV may use in each worker.
+    progress: callable, optional
+        Called as progress(done, total) before the first and after every finished call.
+
+    Returns
+    -------
+    list of tuples
+        (result, None) for successful calls, (None, exception) for failed ones.
+    """
+    n_workers = n_workers or os.cpu_count() or 1
+    n_workers = min(n_workers, max(1, len(kwargs_list)))
+    total = len(kwargs_list)
+
+    if progress is not None:
+        progress(0, total)
+
+    if n_workers == 1:
+        results = []
+        for kwargs in kwargs_list:
+            results.append(_call(func, kwargs))
+            if progress is not None:
+                progress(len(results), total)
+        return results
+
+    results = []
+    with ProcessPoolExecutor(max_workers=n_workers, initializer=init_worker, initargs=(cv_threads,)) as pool:
+        futures = [pool.submit(_call, func, kwargs) for kwargs in kwargs_list]
+
+        if progress is not None: # reported as calls finish, in any order
+            for done, _ in enumerate(as_completed(futures), start=1):
+                progress(done, total)
+
+        for future in futures: # collected in input order
+            try:
+                results.append(future.result())
+            except Exception as e: # e.g. a crashed worker or an unpicklable result
+                results.append((None, e))
+
+    return results
+
+class SharedFrame:
+    """
+    Frame in shared memory, written by the main process and read by the workers of a pool without pickling.
+    The block is reused for all frames of the same size.
+    """
+    def __init__(self, shape, dtype = np.uint8):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.shm = shared_memory.SharedMemory(create=True, size=int(np.prod(self.shape)) * self.dtype.itemsize)
+        self.array = np.ndarray(self.shape, dtype=self.dtype, buffer=self.shm.buf)
+
+    @property
+    def spec(self):
+        """
+        (name, shape, dtype) for attach_frame in the workers.
+        """
+        return self.shm.name, self.shape, self.dtype.str
+
+    def write(self, frame):
+        self.array[...] = frame
+
+    def close(self):
+        del self.array
+        self.shm.close()
+        self.shm.unlink()
+
+_attached = {} # shared memory blocks the worker is attached to, by name
+_dish_worker = {} # coordinates and masks of the timelapse, set by init_dish_worker
+
+def attach_frame(name, shape, dtype):
+    """
+    Attaches a worker to a SharedFrame, once per block. Blocks of earlier frames are detached,
+    the pool replaces its block when the frame size changes.
+
+    Returns the frame as a numpy array backed by the shared memory.
+    """
+    if name not in _attached:
+        for stale in list(_attached):
+            _attached.pop(stale).close()
+        _attached[name] = shared_memory.SharedMemory(name=name) # the main process owns and unlinks the block
+    return np.ndarray(shape, dtype=np.dtype(dtype), buffer=_attached[name].buf)
+
+def init_dish_worker(cv_threads, coordinates, fg_masks, bg_masks, cube_dir = None, backgrounds = None):
+    """
+    Initializes a worker for per-dish processing of timelapse frames. The masks are sent once per worker, not per frame.
+    Each worker keeps its own copy of the BackgroundCache, if passed; DishPool sends each dish to the same worker.
+    """
+    init_worker(cv_threads)
+    _dish_worker.update(coordinates=coordinates, fg_masks=fg_masks, bg_masks=bg_masks, cubes=DishCubes(cube_dir) if cube_dir else None, backgrounds=backgrounds)
+
+def _background(idx, t, dish):
+    """
+    Local mean of a dish from the worker's BackgroundCache, or None.
+    """
+    if _dish_worker.get("backgrounds") is None or t is None:
+        return None
+    return _dish_worker["backgrounds"].get(idx, t, dish[:, :, 1])
+
+def process_shared_dish(frame_spec, idx, fine, t = None, coordinates = None, **kwargs):
+    """
+    Crops a dish from the frame in shared memory and processes it with process_dish.
+    t is the index of the frame, for the BackgroundCache; coordinates of the dish replace those the worker was started with, i.e. after drift.
+
+    Returns number of colonies.
+    """
+    frame = attach_frame(*frame_spec)
+    dishes, masks = crop(frame, [coordinates or _dish_worker["coordinates"][idx]])
+
+    return process_dish(
+        dishes[0],
+        masks[0],
+        _dish_worker["fg_masks"][idx],
+        _dish_worker["bg_masks"][idx],
+        fine=fine,
+        idx=idx+1,
+        background=_background(idx, t, dishes[0]),
+        **kwargs
+    )
+
+def process_cube_dish(t, idx, fine, **kwargs):
+    """
+    Processes a dish of frame t from the memory-mapped cubes with process_dish.
+
+    Returns number of colonies.
+    """
+    cube = _dish_worker["cubes"].dish(idx)
+
+    return process_dish(
+        cube[t],
+        _dish_worker["cubes"].masks[idx],
+        _dish_worker["fg_masks"][idx],
+        _dish_worker["bg_masks"][idx],
+        fine=fine,
+        idx=idx+1,
+        background=_background(idx, t, cube[t]),
+        **kwargs
+    )
+
+class DishPool:
+    """
+    Process pool for the per-dish work of timelapse frames.
+    Each frame is written once into shared memory, the workers crop their dish from it.
+    Coordinates and masks are sent to each worker once, when the pool starts.
+    With cube_dir, the workers read the dishes from the memory-mapped cubes instead (count_cube).
+    Each dish is processed by the same worker in every frame, so with a BackgroundCache the worker reuses the local means of its dishes.
+    """
+    def __init__(self, n_workers, cv_threads, coordinates, fg_masks, bg_masks, cube_dir = None, backgrounds = None):
+        self.n_dishes = len(coordinates)
+        self.pools = [ProcessPoolExecutor( # one worker each, dish idx goes to pool idx % n_workers
+            max_workers=1,
+            initializer=init_dish_worker,
+            initargs=(cv_threads, coordinates, fg_masks, bg_masks, cube_dir, backgrounds)
+        ) for _ in range(max(1, min(n_workers, self.n_dishes)))]
+        self.frame = None
+
+    def _submit(self, idx, func, *args, **kwargs):
+        return self.pools[idx % len(self.pools)].submit(func, *args, **kwargs)
+
+    def count(self, frame, fine, t = None, coordinates = None, **kwargs):
+        """
+        Processes all dishes of a frame with process_dish. t is the index of the frame, for the BackgroundCache;
+        coordinates replace those of the pool, i.e. after drift.
+
+        Returns number of colonies per dish, in dish order.
+        """
+        if self.frame is None or self.frame.shape != frame.shape:
+            if self.frame is not None:
+                self.frame.close()
+            self.frame = SharedFrame(frame.shape, frame.dtype)
+        self.frame.write(frame)
+
+        futures = [self._submit(idx, process_shared_dish, self.frame.spec, idx, fine[idx], t, coordinates[idx] if coordinates else None, **kwargs) for idx in range(self.n_dishes)]
+        return [future.result() for future in futures] # all dishes are done before the next frame overwrites this one
+
+    def count_cube(self, t, fine, **kwargs):
+        """
+        Processes all dishes of frame t of the cubes with process_dish.
+
+        Returns number of colonies per dish, in dish order.
+        """
+        futures = [self._submit(idx, process_cube_dish, t, idx, fine[idx], **kwargs) for idx in range(self.n_dishes)]
+        return [future.result() for future in futures]
+
+    def close(self):
+        for pool in self.pools:
+            pool.shutdown()
+        if self.frame is not None:
+            self.frame.close()
+            self.frame = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,223 @@
+import cProfile
+import csv
+import json
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+_NULL = nullcontext() # shared no-op context, returned while no Profiler is active
+_active = None # active Profiler
+
+def stage(name, frame = None):
+    """
+    Times a stage of the pipeline, if a Profiler is active; otherwise a shared no-op context, so instrumentation costs a function call.
+
+    Parameters
+    ----------
+    name: str
+        Name of the stage, i.e. "threshold".
+    frame: str, optional
+        Frame the stage belongs to, for stages run ahead on other threads (i.e. decoding). Defaults to the current frame.
+    """
+    if _active is None:
+        return _NULL
+    return _active.stage(name, frame)
+
+def frame(name):
+    """
+    Marks the stages within as belonging to a frame, if a Profiler is active.
+    """
+    if _active is None:
+        return _NULL
+    return _active.frame(name)
+
+def dish(idx):
+    """
+    Marks the stages within as belonging to a dish, if a Profiler is active.
+    """
+    if _active is None:
+        return _NULL
+    return _active.dish(idx)
+
+def active():
+    """
+    Returns the active Profiler, or None.
+    """
+    return _active
+
+class Profiler:
+    """
+    Collects wall and CPU times of the pipeline stages, per frame and dish, and optionally the peak memory of each frame and dish.
+    Stages are timed while the profiler is active, i.e. within a with block; only one profiler can be active at a time.
+    Stages run in worker processes (n_workers > 1) aren't timed. Nested stages are recorded on their own and within their parent.
+
+    Parameters
+    ----------
+    memory: bool, default=False
+        Whether to trace the peak memory allocated through Python (including numpy arrays) per frame and dish, with tracemalloc.
+        Tracing slows allocations down.
+    """
+    def __init__(self, memory = False):
+        self.memory = memory
+        self.records = [] # (frame, dish, stage, wall s, cpu s)
+        self.peaks = [] # (frame, dish, peak bytes)
+        self._frame = None
+        self._dish = None
+        self._peak = 0 # running peak of the enclosing frame
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        global _active
+        if _active is not None:
+            raise RuntimeError("Another Profiler is already active.")
+        if self.memory:
+            self._started_tracing = not tracemalloc.is_tracing()
+            if self._started_tracing:
+                tracemalloc.start()
+        _active = self
+        return self
+
+    def __exit__(self, *exc):
+        global _active
+        _active = None
+        if self.memory and self._started_tracing:
+            tracemalloc.stop()
+
+    @contextmanager
+    def stage(self, name, frame = None):
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield
+        finally:
+            record = (frame if frame is not None else self._frame, self._dish, name, time.perf_counter() - wall, time.thread_time() - cpu)
+            with self._lock: # stages may run on decoding and writing threads
+                self.records.append(record)
+
+    def _take_peak(self):
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.reset_peak()
+        self._peak = max(self._peak, peak)
+        return peak
+
+    @contextmanager
+    def frame(self, name):
+        self._frame = name
+        if self.memory:
+            tracemalloc.reset_peak()
+            self._peak = 0
+        try:
+            yield
+        finally:
+            if self.memory:
+                self._take_peak()
+                self.peaks.append((name, None, self._peak))
+            self._frame = None
+
+    @contextmanager
+    def dish(self, idx):
+        self._dish = idx
+        if self.memory:
+            self._take_peak() # peak of the frame so far
+        try:
+            yield
+        finally:
+            if self.memory:
+                self.peaks.append((self._frame, idx, self._take_peak()))
+            self._dish = None
+
+    def summary(self, by = "stage"):
+        """
+        Aggregates the timings.
+
+        Parameters
+        ----------
+        by: str, default="stage"
+            "stage" aggregates over all frames and dishes, "frame" per frame and stage, "dish" per dish and stage.
+
+        Returns
+        -------
+        list of dict
+            Per group its keys, "n" calls, "wall" and "cpu" totals and "wall_mean" in s, largest wall time first;
+            with memory tracing, "peak_memory" in bytes for frames and dishes.
+        """
+        if by not in ("stage", "frame", "dish"):
+            raise ValueError(f"Unknown aggregation: {by}")
+
+        groups = {}
+        for frame_name, dish_idx, name, wall, cpu in self.records:
+            key = (name,) if by == "stage" else (frame_name, name) if by == "frame" else (dish_idx, name)
+            group = groups.setdefault(key, [0, 0.0, 0.0])
+            group[0] += 1
+            group[1] += wall
+            group[2] += cpu
+
+        peaks = {}
+        for frame_name, dish_idx, peak in self.peaks:
+            if by == "frame" and dish_idx is None:
+                peaks[frame_name] = max(peaks.get(frame_name, 0), peak)
+            elif by == "dish" and dish_idx is not None:
+                peaks[dish_idx] = max(peaks.get(dish_idx, 0), peak)
+
+        rows = []
+        for key, (n, wall, cpu) in groups.items():
+            row = dict(zip(["stage"] if by == "stage" else [by, "stage"], key))
+            row.update(n=n, wall=wall, cpu=cpu, wall_mean=wall / n)
+            if peaks:
+                row["peak_memory"] = peaks.get(key[0])
+            rows.append(row)
+        return sorted(rows, key=lambda row: -row["wall"])
+
+    def format_summary(self):
+        """
+        Formats the per stage summary as a text table.
+        """
+        lines = [f"{'stage':<16}{'n':>8}{'wall s':>10}{'cpu s':>10}{'mean ms':>10}"]
+        lines += [f"{row['stage']:<16}{row['n']:>8}{row['wall']:>10.3f}{row['cpu']:>10.3f}{row['wall_mean']*1000:>10.2f}" for row in self.summary()]
+        return "\n".join(lines)
+
+    def to_json(self, path):
+        """
+        Saves the records, peaks and summaries as JSON.
+        """
+        with open(path, "w") as f:
+            json.dump({
+                "records": [dict(zip(("frame", "dish", "stage", "wall", "cpu"), record)) for record in self.records],
+                "peak_memory": [dict(zip(("frame", "dish", "bytes"), peak)) for peak in self.peaks],
+                "stages": self.summary("stage"),
+                "frames": self.summary("frame"),
+                "dishes": self.summary("dish")
+            }, f, indent=2)
+
+    def to_csv(self, path):
+        """
+        Saves the records as CSV, one row per timed stage.
+        """
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["frame", "dish", "stage", "wall", "cpu"])
+            writer.writerows(self.records)
+
+@contextmanager
+def cprofile(path = None):
+    """
+    Runs the code within under cProfile, i.e. the processing of a single frame.
+
+    Parameters
+    ----------
+    path: str, optional
+        Path the raw profile is saved to, for pstats or snakeviz.
+
+    Yields
+    ------
+    cProfile.Profile
+        The profile; once the block is done, pstats.Stats(profile) holds the statistics.
+    """
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield profile
+    finally:
+        profile.disable()
+        if path:
+            profile.dump_stats(path)
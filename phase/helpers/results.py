@@ -0,0 +1,132 @@
+import os
+import sqlite3
+from contextlib import closing
+
+import yaml
+
+def _rows(metadata):
+    return [
+        (file_name, int(dish), *map(int, record["center"]), int(record["radius"]), record["colony_count"])
+        for file_name, dishes in metadata.items()
+        for dish, (record, *_) in dishes.items()
+    ]
+
+class ResultsStore:
+    """
+    Results of processed images in an SQLite database, one record per dish per image.
+    Records are written in one small transaction per image, so any number of processes can write to the same store concurrently.
+
+    Parameters
+    ----------
+    path: str
+        Path to the database file, created if it doesn't exist.
+    timeout: float, default=60
+        Seconds a writer waits for another writer to finish.
+    """
+    def __init__(self, path, timeout = 60):
+        self.path = path
+        self.timeout = timeout
+
+        with self._connect() as con:
+            con.execute("""
+                CREATE TABLE IF NOT EXISTS dishes (
+                    file_name TEXT NOT NULL,
+                    dish INTEGER NOT NULL,
+                    center_x INTEGER,
+                    center_y INTEGER,
+                    radius INTEGER,
+                    colony_count INTEGER,
+                    PRIMARY KEY (file_name, dish)
+                )
+            """)
+            con.execute("CREATE TABLE IF NOT EXISTS imports (path TEXT PRIMARY KEY)")
+
+    def _connect(self):
+        con = sqlite3.connect(self.path, timeout=self.timeout)
+        return closing(con)
+
+    def add(self, metadata):
+        """
+        Adds the metadata of processed images, replacing earlier records of the same image and dish.
+
+        Parameters
+        ----------
+        metadata: dict
+            Metadata as returned by pipeline: {file_name: {dish: [{"center": [x, y], "radius": r, "colony_count": n}]}}.
+        """
+        with self._connect() as con, con: # one transaction
+            con.executemany("INSERT OR REPLACE INTO dishes VALUES (?, ?, ?, ?, ?, ?)", _rows(metadata))
+
+    def has(self, file_name):
+        """
+        Returns whether results of an image are stored.
+        """
+        with self._connect() as con:
+            return con.execute("SELECT 1 FROM dishes WHERE file_name = ? LIMIT 1", (file_name,)).fetchone() is not None
+
+    def file_names(self):
+        """
+        Returns the set of images with stored results.
+        """
+        with self._connect() as con:
+            return {row[0] for row in con.execute("SELECT DISTINCT file_name FROM dishes")}
+
+    def to_metadata(self):
+        """
+        Returns all results in the layout of metadata.yaml.
+        """
+        metadata = {}
+        with self._connect() as con:
+            for file_name, dish, x, y, r, count in con.execute("SELECT * FROM dishes ORDER BY file_name, dish"):
+                metadata.setdefault(file_name, {})[dish] = [{
+                    "center": [x, y],
+                    "radius": r,
+                    "colony_count": count,
+                }]
+        return metadata
+
+    def import_yaml(self, path):
+        """
+        Adds the results of a YAML file in the layout of metadata.yaml, i.e. written before the store existed.
+        Stored records of the same image and dish are kept. Each file is imported once: the import is recorded in the same transaction
+        as the records, so of concurrent processes only the first imports it.
+
+        Returns the number of imported images, 0 if the file was imported before.
+        """
+        key = os.path.abspath(path)
+        with self._connect() as con:
+            if con.execute("SELECT 1 FROM imports WHERE path = ?", (key,)).fetchone() is not None: # the file isn't read again
+                return 0
+
+        with open(path) as f:
+            metadata = yaml.safe_load(f) or {}
+        metadata = {file_name: {dish: [{"colony_count": None, **records[0]}] for dish, records in dishes.items()} for file_name, dishes in metadata.items()}
+
+        with self._connect() as con, con: # one transaction
+            if con.execute("INSERT OR IGNORE INTO imports VALUES (?)", (key,)).rowcount == 0: # imported by another process meanwhile
+                return 0
+            con.executemany("INSERT OR IGNORE INTO dishes VALUES (?, ?, ?, ?, ?, ?)", _rows(metadata))
+        return len(metadata)
+
+    def export_yaml(self, path):
+        """
+        Writes all results to a YAML file in the layout of metadata.yaml. The file is replaced atomically.
+        """
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            yaml.safe_dump(self.to_metadata(), f)
+        os.replace(tmp, path)
+
+def open_results(save_path = ""):
+    """
+    Returns the results store of a save path (results.sqlite).
+    A metadata.yaml in the save path is imported once, so its results aren't lost by exports of the store.
+    """
+    if save_path:
+        os.makedirs(save_path, exist_ok=True)
+    store = ResultsStore(os.path.join(save_path, "results.sqlite"))
+
+    yaml_path = os.path.join(save_path, "metadata.yaml")
+    if os.path.isfile(yaml_path):
+        store.import_yaml(yaml_path)
+    return store
@@ -0,0 +1,98 @@
+from functools import cache, partial
+
+import cv2 as cv
+import numpy as np
+
+from ..image_manipulation import dish_detection, preprocessing, registration, thresholding
+from ..colony_detection import counting
+from ..colony_detection.tracking import keypoints_to_array
+from . import timelapse
+from .cache import Stage, code_version
+from .inputs import read_img
+
+# stages are invalidated when the code of their modules changes; the stages downstream too, their keys hash the keys of their inputs
+VERSION_MODULES = {
+    "dishes": (dish_detection,),
+    "crop": (dish_detection, registration), # crop, or the crop of a DishGeometry
+    "preprocess": (preprocessing, thresholding),
+    "count": (counting,),
+    "masks": (timelapse, dish_detection, preprocessing, thresholding)
+}
+
+@cache
+def stage_version(name):
+    """
+    Code version of a stage, see code_version. Computed on first use, so the sources are only read when a StageCache is used.
+    """
+    return code_version(*VERSION_MODULES[name])
+
+def _detect(img, method):
+    _, _, coordinates, _ = dish_detection.detect_dishes(img, save=False, method=method)
+    return [[int(v) for v in c] for c in coordinates]
+
+def _preprocess(crops, fg_mask, bg_mask, idx, erode = False, **params):
+    dishes, masks = crops
+    preprocessed = preprocessing.preprocess(dishes[idx], mask=masks[idx], fg_mask=fg_mask, bg_mask=bg_mask, **params)
+    if erode: # coarse dishes of a timelapse, see process_dish
+        preprocessed = cv.morphologyEx(preprocessed, cv.MORPH_ERODE, cv.getStructuringElement(cv.MORPH_ELLIPSE, (3, 3)))
+    return preprocessed
+
+def _count(preprocessed, method, params):
+    count, _, keypoints = counting.detect_colonies(preprocessed, save=False, method=method, params=params, return_keypoints=True)
+    return count, keypoints_to_array(keypoints)
+
+def decode_stage(cache, path, read = read_img):
+    """
+    Decoded frame, keyed by the content of the file. Not cached, the stages after it are.
+    """
+    return Stage.file(cache, "decode", path, read)
+
+def dishes_stage(cache, frame, method = "full"):
+    """
+    Coordinates of the dishes detected in a frame, see detect_dishes.
+    """
+    return Stage(cache, "dishes", _detect, [frame], params={"method": method}, version=partial(stage_version, "dishes"))
+
+def crop_stage(cache, frame, coordinates, crop = dish_detection.crop):
+    """
+    Dishes and masks cropped from a frame. Not cached: crops are large and cropping a decoded frame is cheap.
+    Its code version is part of the keys of the preprocessed and counted dishes.
+
+    Parameters
+    ----------
+    frame: Stage
+        Decoded frame.
+    coordinates: Stage
+        Coordinates of the dishes, from dishes_stage or Stage.constant.
+    crop: callable, default=crop
+        Crops a frame at coordinates into dishes and masks, i.e. lambda img, coordinates: geometry.crop(img) for a DishGeometry.
+    """
+    return Stage(cache, "crop", crop, [frame, coordinates], version=partial(stage_version, "crop"), persist=False)
+
+def preprocess_stage(cache, crops, idx, fg_mask = None, bg_mask = None, erode = False, **params):
+    """
+    Preprocessed dish idx of cropped dishes, see preprocess; params are passed to preprocess.
+
+    Parameters
+    ----------
+    fg_mask, bg_mask: Stage, optional
+        Foreground and background masks of the dish, as Stage.constant.
+    erode: bool, default=False
+        Whether to erode the preprocessed dish further, like process_dish for coarse dishes.
+    """
+    fg_mask = fg_mask if fg_mask is not None else Stage.constant(cache, "fg_mask", None)
+    bg_mask = bg_mask if bg_mask is not None else Stage.constant(cache, "bg_mask", None)
+    return Stage(cache, "preprocess", _preprocess, [crops, fg_mask, bg_mask], params={"idx": idx, "erode": erode, **params}, version=partial(stage_version, "preprocess"))
+
+def count_stage(cache, preprocessed, method = "blob", params: dict = None):
+    """
+    Number of colonies and colonies as (x, y, size) rows of a preprocessed dish, see detect_colonies.
+    """
+    return Stage(cache, "count", _count, [preprocessed], params={"method": method, "params": params}, version=partial(stage_version, "count"))
+
+def draw_colonies(dish, colonies):
+    """
+    Image of a dish with its colonies marked like detect_colonies, from (x, y, size) rows.
+    """
+    keypoints = [cv.KeyPoint(float(x), float(y), float(size)) for x, y, size in np.asarray(colonies).reshape(-1, 3)]
+    return cv.drawKeypoints(dish, keypoints, np.array([]), (0,255,0), cv.DRAW_MATCHES_FLAGS_DRAW_RICH_KEYPOINTS)
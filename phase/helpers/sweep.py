@@ -0,0 +1,270 @@
+import csv
+import inspect
+import itertools
+import os
+
+import cv2 as cv
+import numpy as np
+
+from ..image_manipulation.dish_detection import detect_dishes
+from ..image_manipulation.preprocessing import preprocess, threshold_dish, clean_threshold
+from ..colony_detection.counting import count_blobs, count_components
+from .inputs import read_img
+from .parallel import run_parallel
+
+THRESHOLD_PARAMS = ("s", "C", "threshold_method")
+CLEAN_PARAMS = ("area_filter", "kernel_size", "min_area", "max_area")
+BLOB_PARAM_NAMES = {name for name in dir(cv.SimpleBlobDetector_Params()) if not name.startswith("_")}
+PREPROCESS_DEFAULTS = {name: inspect.signature(preprocess).parameters[name].default for name in THRESHOLD_PARAMS + CLEAN_PARAMS}
+
+def parameter_grid(space):
+    """
+    All combinations of the values of a parameter space.
+
+    Parameters
+    ----------
+    space: dict
+        Values of each parameter, e.g. {"s": [101, 121], "minArea": [2, 5]}. Parameters of preprocess and of the blob detector (BLOB_PARAMS) can be swept.
+
+    Returns
+    -------
+    list of dict
+        Parameter sets.
+    """
+    names = list(space)
+    return [dict(zip(names, values)) for values in itertools.product(*(space[name] for name in names))]
+
+def random_parameters(space, n, seed = None):
+    """
+    Random parameter sets from a parameter space.
+
+    Parameters
+    ----------
+    space: dict
+        Per parameter a list of values to choose from, or a (low, high) tuple to draw uniformly from; integers if both bounds are integers.
+    n: int
+        Number of parameter sets.
+    seed: int, optional
+        Seed of the random generator.
+
+    Returns
+    -------
+    list of dict
+        Parameter sets.
+
+    Raises
+    ------
+    ValueError
+        If the space of the block size s has no odd values or even values to choose from.
+    """
+    # block size of the threshold must be odd: drawn from the odd integers in the range
+    odd_s = None
+    if isinstance(space.get("s"), tuple):
+        low, high = space["s"]
+        odd_s = (low | 1, high if high % 2 else high - 1)
+        if not (isinstance(low, int) and isinstance(high, int)) or odd_s[0] > odd_s[1]:
+            raise ValueError(f"No odd block sizes s in {space['s']}.")
+    elif "s" in space and any(s % 2 == 0 for s in space["s"]):
+        raise ValueError(f"Block sizes s must be odd: {space['s']}")
+
+    rng = np.random.default_rng(seed)
+    candidates = []
+    for _ in range(n):
+        params = {}
+        for name, values in space.items():
+            if name == "s" and odd_s is not None:
+                params[name] = int(odd_s[0] + 2 * rng.integers((odd_s[1] - odd_s[0]) // 2 + 1))
+            elif isinstance(values, tuple):
+                low, high = values
+                params[name] = int(rng.integers(low, high + 1)) if isinstance(low, int) and isinstance(high, int) else float(rng.uniform(low, high))
+            else:
+                params[name] = values[rng.integers(len(values))]
+        candidates.append(params)
+    return candidates
+
+def _split(params):
+    """
+    Splits a parameter set into the keys of its stages: threshold, cleaned threshold and blob parameters.
+    """
+    unknown = set(params) - set(PREPROCESS_DEFAULTS) - BLOB_PARAM_NAMES
+    if unknown:
+        raise ValueError(f"Unknown parameters: {', '.join(sorted(unknown))}")
+
+    values = {**PREPROCESS_DEFAULTS, **params}
+    threshold_key = tuple(values[name] for name in THRESHOLD_PARAMS)
+    clean_key = threshold_key + tuple(values[name] for name in CLEAN_PARAMS)
+    blob = {name: value for name, value in params.items() if name not in PREPROCESS_DEFAULTS}
+    return threshold_key, clean_key, blob
+
+def sweep_dish(dish, mask, candidates, method = "blob"):
+    """
+    Counts the colonies of one dish for every parameter set, memoizing the stages:
+    a threshold is computed once per (s, C, threshold_method) and cleaned once per preprocessing parameters, and reused across all blob parameters.
+    Parameter sets are evaluated grouped by stage, so only the current threshold and cleaned threshold are held in memory.
+
+    Parameters
+    ----------
+    dish: np.ndarray
+        Cropped dish.
+    mask: np.ndarray
+        Mask of the background area outside of the dish.
+    candidates: list of dict
+        Parameter sets.
+    method: str, default="blob"
+        Counting backend of detect_colonies.
+
+    Returns
+    -------
+    list of int
+        Number of colonies per parameter set, in input order.
+    dict
+        Number of thresholds and cleaned thresholds computed.
+    """
+    if method not in ("components", "blob"):
+        raise ValueError(f"Unknown counting method: {method}")
+    count = count_components if method == "components" else count_blobs
+
+    keys = [_split(params) for params in candidates]
+    order = sorted(range(len(candidates)), key=lambda i: repr(keys[i][1]))
+
+    counts = [None] * len(candidates)
+    stats = {"thresholds": 0, "cleaned": 0}
+    threshold_key, clean_key = None, None
+    for i in order:
+        key, key_clean, blob = keys[i]
+        values = {**PREPROCESS_DEFAULTS, **candidates[i]}
+
+        if key != threshold_key:
+            threshold = threshold_dish(dish, s=values["s"], C=values["C"], method=values["threshold_method"])
+            threshold_key = key
+            stats["thresholds"] += 1
+
+        if key_clean != clean_key:
+            cleaned = clean_threshold(threshold, mask=mask, **{name: values[name] for name in CLEAN_PARAMS})
+            clean_key = key_clean
+            stats["cleaned"] += 1
+
+        counts[i] = len(count(cleaned, blob))
+    return counts, stats
+
+def _crop_image(path, method):
+    dishes, masks, _, _ = detect_dishes(read_img(path), save=False, file_name=os.path.basename(path), method=method)
+    return dishes, masks
+
+def crop_samples(image_paths, truth, method = "full", n_workers = None):
+    """
+    Crop stage of a sweep: detects and crops the dishes of each image once, on a process pool.
+
+    Parameters
+    ----------
+    image_paths: list of str
+        Images with ground truth.
+    truth: dict
+        True colony counts per dish, {file_name: [count of dish 1, count of dish 2, ...]}; file names without extension.
+        Dishes without a count (None) are skipped.
+    method: str, default="full"
+        Dish detection method.
+    n_workers: int, optional
+        Number of worker processes. If None, the number of CPUs is used; 1 runs everything in the current process.
+
+    Returns
+    -------
+    list of tuples
+        (file_name, dish number, dish, mask, true count) per dish with ground truth.
+    """
+    file_names = {path: os.path.splitext(os.path.basename(path))[0] for path in image_paths}
+    paths = [path for path in image_paths if file_names[path] in truth]
+
+    results = run_parallel(_crop_image, [{"path": path, "method": method} for path in paths], n_workers=n_workers)
+
+    samples = []
+    for path, (result, error) in zip(paths, results):
+        if error is not None:
+            raise RuntimeError(f"Dish detection failed on {path}.") from error
+        dishes, masks = result
+        counts = truth[file_names[path]]
+        for idx, (dish, mask) in enumerate(zip(dishes, masks)):
+            true_count = counts[idx] if idx < len(counts) else None
+            if true_count is not None:
+                samples.append((file_names[path], idx + 1, dish, mask, true_count))
+    return samples
+
+def sweep(
+        samples,
+        candidates,
+        n_workers = None,
+        cv_threads = 1,
+        method = "blob"
+):
+    """
+    Evaluates parameter sets over a dataset of dishes with ground truth on a process pool, one task per dish.
+
+    Returns the parameter sets ranked by mean absolute error.
+
+    Parameters
+    ----------
+    samples: list of tuples
+        (file_name, dish number, dish, mask, true count), e.g. from crop_samples.
+    candidates: list of dict
+        Parameter sets, e.g. from parameter_grid or random_parameters.
+    n_workers: int, optional
+        Number of worker processes. If None, the number of CPUs is used; 1 runs everything in the current process.
+    cv_threads: int, default=1
+        Number of threads OpenCV may use in each worker.
+    method: str, default="blob"
+        Counting backend of detect_colonies.
+
+    Returns
+    -------
+    list of dict
+        Per parameter set its parameters, "mae", "bias" (mean of detected - true), "rmse", "max_error" and "counts", best first.
+    """
+    for params in candidates: # fails early on unknown parameters
+        _split(params)
+
+    results = run_parallel(
+        sweep_dish,
+        [{"dish": dish, "mask": mask, "candidates": candidates, "method": method} for _, _, dish, mask, _ in samples],
+        n_workers=n_workers,
+        cv_threads=cv_threads
+    )
+    for (_, error), (file_name, dish_idx, *_) in zip(results, samples):
+        if error is not None:
+            raise RuntimeError(f"Sweep failed on dish {dish_idx} of {file_name}.") from error
+
+    counts = np.array([result[0] for result, _ in results]).T # parameter set x dish
+    truth = np.array([true_count for *_, true_count in samples])
+    errors = counts - truth
+
+    rows = [{
+        **params,
+        "mae": float(np.abs(e).mean()),
+        "bias": float(e.mean()),
+        "rmse": float(np.sqrt((e ** 2).mean())),
+        "max_error": int(np.abs(e).max()),
+        "counts": c.tolist()
+    } for params, e, c in zip(candidates, errors, counts)]
+
+    return sorted(rows, key=lambda row: (row["mae"], abs(row["bias"])))
+
+def format_table(rows, top = 10):
+    """
+    Formats the ranked results of sweep as a text table.
+    """
+    params = [name for name in rows[0] if name not in ("mae", "bias", "rmse", "max_error", "counts")] if rows else []
+    header = ["rank", *params, "mae", "bias", "rmse", "max_error"]
+    lines = [[str(rank + 1), *(str(row[name]) for name in params), f"{row['mae']:.2f}", f"{row['bias']:+.2f}", f"{row['rmse']:.2f}", str(row["max_error"])]
+             for rank, row in enumerate(rows[:top])]
+    widths = [max(len(cell) for cell in column) for column in zip(header, *lines)]
+    return "\n".join("  ".join(cell.rjust(width) for cell, width in zip(line, widths)) for line in [header, *lines])
+
+def save_table(rows, path):
+    """
+    Saves the ranked results of sweep as CSV, without the per dish counts.
+    """
+    fields = [name for name in rows[0] if name != "counts"]
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["rank", *fields], extrasaction="ignore")
+        writer.writeheader()
+        for rank, row in enumerate(rows):
+            writer.writerow({"rank": rank + 1, **row})
@@ -0,0 +1,220 @@
+import os
+from datetime import datetime, timedelta
+
+import cv2 as cv
+import numpy as np
+
+from ..image_manipulation.preprocessing import preprocess
+from ..colony_detection.counting import count_components
+from ..colony_detection.tracking import keypoints_to_array
+
+FRAME_SHAPE = (3040, 4056, 3) # frames of the Raspberry Pi HQ camera
+COORDINATES = [(720, 700, 500), (2030, 690, 505), (3330, 710, 498), (700, 2290, 502), (2040, 2300, 500), (3340, 2310, 503)]
+
+AGAR = (140, 170, 150)
+RIM = (200, 210, 205)
+COLONY = (60, 70, 65)
+INK = (90, 40, 40)
+
+def synthetic_dish(seed, n_colonies = 300, size = 1000):
+    """
+    Dish crop with dark colonies on a slightly uneven, noisy agar background.
+    Colonies may overlap, so the number drawn is an upper bound of the count.
+
+    Returns the dish and its mask.
+    """
+    rng = np.random.default_rng(seed)
+    _, xx = np.mgrid[:size, :size]
+    background = 150 + 30 * xx / size + rng.normal(0, 3, (size, size))
+    img = np.dstack([background * 0.8, background, background * 0.9])
+    for _ in range(n_colonies):
+        x, y = rng.uniform(50, size - 50, 2)
+        cv.circle(img, (int(x), int(y)), int(round(rng.uniform(1.5, 9))), COLONY, -1)
+    img = np.clip(img, 0, 255).astype(np.uint8)
+
+    mask = np.zeros((size, size), np.uint8)
+    cv.circle(mask, (size//2, size//2), size//2, 255, -1)
+    return cv.bitwise_and(img, img, mask=mask), mask
+
+def growing_dish(seed = 0, n_frames = 10, size = 1000, n_colonies = 300, appear = (0, 10), growth = (0.05, 0.3), noise = 0.0):
+    """
+    Frames of a dish with colonies appearing and growing, like a timelapse with a 10 minute cadence.
+    Yields the dish and its mask.
+    """
+    rng = np.random.default_rng(seed)
+    _, xx = np.mgrid[:size, :size]
+    background = 150 + 30 * xx / size + rng.normal(0, 3, (size, size))
+    centers = rng.uniform(40, size - 40, (n_colonies, 2))
+    appears = rng.uniform(*appear, n_colonies)
+    rates = rng.uniform(*growth, n_colonies) # px per frame
+
+    mask = np.zeros((size, size), np.uint8)
+    cv.circle(mask, (size//2, size//2), size//2, 255, -1)
+
+    for frame in range(n_frames):
+        img = background + rng.normal(0, noise, background.shape) if noise else background
+        img = np.dstack([img * 0.8, img, img * 0.9])
+        for (x, y), t0, rate in zip(centers, appears, rates):
+            if t0 <= frame:
+                cv.circle(img, (int(x), int(y)), int(round(1.5 + rate * (frame - t0))), COLONY, -1)
+        img = np.clip(img, 0, 255).astype(np.uint8)
+        yield cv.bitwise_and(img, img, mask=mask), mask
+
+def full_count(dish, mask, bg_mask = None):
+    """
+    Colonies of a dish by full processing (preprocess and connected components), the reference of incremental processing.
+
+    Returns the number of colonies and the colonies as (x, y, size) rows.
+    """
+    keypoints = count_components(preprocess(dish, mask=mask, bg_mask=bg_mask))
+    return len(keypoints), keypoints_to_array(keypoints)
+
+def dish_grid(n_dishes, shape = FRAME_SHAPE, r = 500):
+    """
+    Coordinates (x, y, r) of n dishes laid out in a grid over a frame, in the order detect_dishes sorts them (rows, then columns).
+    The radius is set by the dishes and the optics, so the dishes have to fit in the frame.
+    """
+    h, w = shape[:2]
+    cols = int(np.ceil(np.sqrt(n_dishes * w / h) - 1e-9))
+    rows = int(np.ceil(n_dishes / cols))
+    if min(h / rows, w / cols) < 2 * r + 20:
+        raise ValueError(f"{n_dishes} dishes of radius {r} px don't fit in a {w}x{h} frame.")
+    return [(int((0.5 + idx % cols) * w / cols), int((0.5 + idx // cols) * h / rows), r) for idx in range(n_dishes)]
+
+def synthetic_plate(seed = 0, coordinates = COORDINATES, shape = FRAME_SHAPE, n_colonies = 100, noise = 4.0):
+    """
+    Frame of dishes with a bright rim and dark colonies on a dark incubator background.
+    Colonies may overlap; see SyntheticTimelapse for frames with known counts.
+    """
+    rng = np.random.default_rng(seed)
+    img = np.full(shape, 35, np.float32)
+    for (x, y, r) in coordinates:
+        cv.circle(img, (x, y), r, AGAR, -1)
+        cv.circle(img, (x, y), r, RIM, 6)
+        for _ in range(n_colonies):
+            angle, dist = rng.uniform(0, 2*np.pi), rng.uniform(0, r - 30)
+            cv.circle(img, (int(x + dist*np.cos(angle)), int(y + dist*np.sin(angle))), int(rng.uniform(2, 8)), COLONY, -1)
+    img += rng.normal(0, noise, img.shape)
+    return np.clip(img, 0, 255).astype(np.uint8)
+
+class SyntheticTimelapse:
+    """
+    Timelapse of dishes with colonies appearing and growing, with known counts.
+    Colonies don't touch even at their final size, so every drawn colony is one colony to count.
+    Dust specks and marker strokes on the lid are present from the first frame, like the artifacts the background masks remove.
+
+    Parameters
+    ----------
+    seed: int, default=0
+        Seed of the colonies, artifacts and noise.
+    n_frames: int, default=6
+        Number of frames.
+    coordinates: list of tuples, optional
+        Coordinates (x, y, r) of the dishes, see dish_grid. Defaults to 6 dishes.
+    shape: tuple, default=(3040, 4056, 3)
+        Shape of the frames.
+    n_colonies: int, default=100
+        Colonies per dish by the last frame (density).
+    appear: tuple, default=(0, 3)
+        Range of frames colonies appear in.
+    growth: tuple, default=(0.5, 1.5)
+        Range of the growth rates of the colony radii, in px per frame, from a radius of 3 px.
+    max_radius: int, default=8
+        Radius colonies stop growing at; larger colonies are eroded once a dish is coarse, which changes their count.
+    noise: float, default=4.0
+        Standard deviation of the sensor noise of each frame.
+    n_dust: int, default=0
+        Static dust specks per dish.
+    markers: bool, default=False
+        Whether to draw a marker stroke near the rim of each dish, like the label of a plate.
+    """
+    def __init__(
+            self,
+            seed = 0,
+            n_frames = 6,
+            coordinates = None,
+            shape = FRAME_SHAPE,
+            n_colonies = 100,
+            appear = (0, 3),
+            growth = (0.5, 1.5),
+            max_radius = 8,
+            noise = 4.0,
+            n_dust = 0,
+            markers = False
+    ):
+        self.seed = seed
+        self.n_frames = n_frames
+        self.coordinates = list(coordinates if coordinates is not None else COORDINATES)
+        self.shape = tuple(shape)
+        self.max_radius = max_radius
+        self.noise = noise
+
+        rng = np.random.default_rng(seed)
+        self.colonies = [] # per dish: centers, appearance frames, growth rates
+        for (x, y, r) in self.coordinates:
+            centers = self._place(rng, (x, y), r - 80, n_colonies, 2*max_radius + 6)
+            self.colonies.append((centers, rng.uniform(*appear, len(centers)), rng.uniform(*growth, len(centers))))
+
+        # static scene: agar, rims and artifacts
+        self.scene = np.full(self.shape, 35, np.float32)
+        for idx, (x, y, r) in enumerate(self.coordinates):
+            cv.circle(self.scene, (x, y), r, AGAR, -1)
+            cv.circle(self.scene, (x, y), r, RIM, 6)
+            for dx, dy in self._place(rng, (0, 0), r - 80, n_dust, 2*max_radius + 6, avoid=self.colonies[idx][0] - (x, y)):
+                cv.circle(self.scene, (int(x + dx), int(y + dy)), 1, COLONY, -1)
+            if markers:
+                angle = rng.uniform(0, 2*np.pi)
+                arc = [(x + (r - 45) * np.cos(a), y + (r - 45) * np.sin(a)) for a in np.linspace(angle, angle + 0.5, 20)]
+                cv.polylines(self.scene, [np.int32(arc)], False, INK, 12)
+
+    @staticmethod
+    def _place(rng, center, radius, n, spacing, avoid = None):
+        """
+        Up to n random points within a radius of a center, at least spacing apart from each other and from the avoided points.
+        """
+        points = [] if avoid is None else list(avoid)
+        n_avoided = len(points)
+        for _ in range(50 * n):
+            if len(points) - n_avoided == n:
+                break
+            angle, dist = rng.uniform(0, 2*np.pi), radius * np.sqrt(rng.uniform())
+            point = (center[0] + dist * np.cos(angle), center[1] + dist * np.sin(angle))
+            if all((point[0] - px)**2 + (point[1] - py)**2 >= spacing**2 for px, py in points):
+                points.append(point)
+        return np.array(points[n_avoided:]).reshape(-1, 2)
+
+    def counts(self, frame):
+        """
+        Number of colonies in each dish at a frame.
+        """
+        return [int(np.count_nonzero(appears <= frame)) for _, appears, _ in self.colonies]
+
+    def frame(self, frame):
+        """
+        Renders a frame. Frames are deterministic for a seed, whatever order they're rendered in.
+        """
+        img = self.scene.copy()
+        for centers, appears, rates in self.colonies:
+            for (x, y), t0, rate in zip(centers, appears, rates):
+                if t0 <= frame:
+                    cv.circle(img, (int(x), int(y)), int(min(self.max_radius, round(3 + rate * (frame - t0)))), COLONY, -1)
+        img += np.random.default_rng((self.seed, frame)).normal(0, self.noise, self.shape).astype(np.float32)
+        return np.clip(img, 0, 255).astype(np.uint8)
+
+    def __iter__(self):
+        for frame in range(self.n_frames):
+            yield self.frame(frame)
+
+    def write(self, directory, start = datetime(2025, 10, 30, 12), interval = timedelta(minutes=10), extension = ".jpg"):
+        """
+        Writes the frames to a directory, named by their capture time like helpers/camera.py.
+
+        Returns the paths of the frames.
+        """
+        os.makedirs(directory, exist_ok=True)
+        paths = []
+        for idx, img in enumerate(self):
+            path = os.path.join(directory, (start + idx * interval).strftime("%d.%m.%Y-%H.%M.%S") + extension)
+            cv.imwrite(path, img)
+            paths.append(path)
+        return paths
@@ -3,41 +3,87 @@ import numpy as np
 import os
 
 from ..image_manipulation.dish_detection import detect_dishes, crop
-from ..image_manipulation.preprocessing import preprocess_bg_isolation, preprocess_fg_isolation
+from ..image_manipulation.preprocessing import preprocess, preprocess_bg_isolation, preprocess_fg_isolation
+from ..colony_detection.counting import detect_colonies
+from ..colony_detection.tracking import keypoints_to_array
+from .inputs import read_img
+from .outputs import save_image
+from .profiling import dish as dish_context
 
 def make_masks(
         image_paths,
         save_path = "",
         save = False,
-        n_to_stack=5
+        n_to_stack=5,
+        fg_method = "exact",
+        frames = None,
+        cubes = None
 ):
     """
-    Makes foreground and background masks from a given 
+    Makes foreground and background masks from a given timelapse.
+    The last image is used for the foreground masks, the first n_to_stack images are stacked into the background masks.
+
+    Returns foreground masks, background masks and dish coordinates.
+
+    Parameters
+    ----------
+    image_paths: list of str
+        Paths to the images of the timelapse, in chronological order.
+    save_path: str, optional
+        Path to directory where the masks are saved.
+    save: bool, default=False
+        Whether to save the masks.
+    n_to_stack: int, default=5
+        Number of images at the start of the timelapse stacked into the background masks.
+    fg_method: str, default="exact"
+        Background estimation of preprocess_fg_isolation; "pyramid" is much faster for the large tophat kernel.
+    frames: FrameSource, optional
+        Source of decoded frames, so that frames decoded here are not decoded again by the caller. If None, frames are read directly.
+    cubes: DishCubes, optional
+        Cropped dishes of every frame, from build_cubes. The dishes and coordinates are taken from them, without decoding any frame.
+
+    Returns
+    -------
+    list of np.ndarray
+        Foreground masks.
+    list of np.ndarray
+        Background masks.
+    list of tuples
+        Coordinates of the dishes.
     """
+    load = frames.get if frames is not None else read_img
+
+    if frames is not None and cubes is None: # decodes the background frames while the foreground masks are made; pinned, the main loop uses them again
+        frames.pin(image_paths[:n_to_stack] + image_paths[-1:])
+
     # FOREGROUND MASKING
 
     last_image_path = image_paths[-1] # last image used for a foreground mask
 
-    dishes, masks, coordinates, _ = detect_dishes( # dish crops from last image
-        source=last_image_path,
-        file_name=os.path.basename(last_image_path),
-        save=False
-    )
+    if cubes is not None:
+        coordinates = cubes.coordinates
+        dishes, masks = cubes.crop(len(image_paths) - 1)
+    else:
+        dishes, masks, coordinates, _ = detect_dishes( # dish crops from last image
+            source=load(last_image_path),
+            file_name=os.path.basename(last_image_path),
+            save=False
+        )
 
     file_name = os.path.splitext(os.path.basename(last_image_path))[0]
-    foreground_masks = [preprocess_fg_isolation(source=dish, mask=mask, file_name=file_name, kernel_size=500) for dish, mask in zip(dishes, masks)]
+    foreground_masks = [preprocess_fg_isolation(source=dish, mask=mask, file_name=file_name, kernel_size=500, method=fg_method) for dish, mask in zip(dishes, masks)]
 
     if save:
         for idx, mask in enumerate(foreground_masks):
-            cv.imwrite(os.path.join(save_path, f"fg_mask{idx+1}.png"), mask)
+            save_image(os.path.join(save_path, f"fg_mask{idx+1}.png"), mask)
 
     # BACKGROUND MASKING
     first_n_image_paths = image_paths[:n_to_stack] # grabs the first n images
 
     first_n_dishes = []
     
-    for img_path in first_n_image_paths: # crops dishes and preprocesses them
-        dishes, masks = crop(img_path, coordinates)
+    for t, img_path in enumerate(first_n_image_paths): # crops dishes and preprocesses them
+        dishes, masks = cubes.crop(t) if cubes is not None else crop(load(img_path), coordinates)
 
         preprocessed = [preprocess_bg_isolation(source=dish, mask=mask, file_name=os.path.splitext(os.path.basename(img_path))[0]) for dish, mask in zip(dishes, masks)]
         first_n_dishes.append(preprocessed)
@@ -51,18 +97,103 @@ def make_masks(
         for idx, img in enumerate(group):
             stack = cv.bitwise_or(stack, img)
             if save:
-                cv.imwrite(os.path.join(save_path, f"bg_mask_dish{i+1}_{idx+1}.png"), img)
+                save_image(os.path.join(save_path, f"bg_mask_dish{i+1}_{idx+1}.png"), img)
         background_masks.append(stack)
         if save:
-            cv.imwrite(os.path.join(save_path, f"bg_mask_dish{i+1}_stack.png"), stack)
+            save_image(os.path.join(save_path, f"bg_mask_dish{i+1}_stack.png"), stack)
 
     return foreground_masks, background_masks, coordinates
 
+def process_dish(
+        dish,
+        mask,
+        fg_mask,
+        bg_mask,
+        fine = True,
+        save = False,
+        save_path = "",
+        file_name = "",
+        idx: int = None,
+        return_colonies = False,
+        threshold_method = "gaussian",
+        background = None,
+        count_method = "blob",
+        params: dict = None
+):
+    """
+    Preprocesses a dish of a timelapse frame and counts its colonies, dependant on its growth state.
+
+    Returns number of colonies.
+
+    Parameters
+    ----------
+    dish: np.ndarray
+        Cropped dish.
+    mask: np.ndarray
+        Mask of the background area outside of the dish.
+    fg_mask: np.ndarray
+        Foreground mask of the dish, from make_masks.
+    bg_mask: np.ndarray
+        Background mask of the dish, from make_masks.
+    fine: bool, default=True
+        Growth state of the dish (DishState.fine). Small colonies are area filtered, large ones eroded further.
+    save: bool, default=False
+        Whether to save the dish and intermediate images.
+    save_path: str, optional
+        Path to directory where the images are saved.
+    file_name: str, optional
+        Name of the frame, used for saving.
+    idx: int, optional
+        Number of the dish, used for saving.
+    return_colonies: bool, default=False
+        Whether to also return the detected colonies, for tracking.
+    threshold_method: str, default="gaussian"
+        Local mean of the threshold, see thresholding.local_mean.
+    background: np.ndarray, optional
+        Precomputed local mean of the green channel of the dish, from a BackgroundCache.
+    count_method: str, default="blob"
+        Counting backend of detect_colonies.
+    params: dict, optional
+        Parameters overriding BLOB_PARAMS of detect_colonies.
+
+    Returns
+    -------
+    int
+        Number of detected colonies.
+    np.ndarray
+        Detected colonies as (x, y, size) rows, only if return_colonies is True.
+    """
+    with dish_context(idx):
+        if save:
+            save_image(os.path.join(save_path, "Dishes", f"{file_name}_dish_{idx}.jpg"), dish)
+
+        preprocessed = preprocess(source=dish,
+                    mask=mask,
+                    fg_mask=fg_mask,
+                    bg_mask=bg_mask,
+                    area_filter=fine,
+                    threshold_method=threshold_method,
+                    background=background,
+                    file_name=file_name,
+                    save=save,
+                    save_path=save_path,
+                    idx=idx
+                    )
+        if not fine:
+            preprocessed = cv.morphologyEx(preprocessed, cv.MORPH_ERODE, cv.getStructuringElement(cv.MORPH_ELLIPSE, (3, 3)))
+
+        count, _, keypoints = detect_colonies(source=preprocessed, raw_img=dish, save=save, save_path=save_path, file_name=file_name, idx=idx, method=count_method, params=params, return_keypoints=True)
+
+        if return_colonies:
+            return count, keypoints_to_array(keypoints)
+        return count
+
 class DishState:
     def __init__(self, fine_buffer = 2):
         self.fine = True
         self.history = []
         self.fine_buffer = fine_buffer
+        self.tracker = None # ColonyTracker, if colonies are tracked
     def trigger(self):
         self.fine_buffer -= 1
         if self.fine_buffer <= 0:
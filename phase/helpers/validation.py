@@ -0,0 +1,265 @@
+import hashlib
+import json
+import os
+import re
+import warnings
+
+import numpy as np
+from pypdf import PdfReader
+
+from .inputs import file_hash, parse_pdf_pages
+from .parallel import run_parallel
+
+RECORDS_NAME = "records.json"
+NAME_PATTERN = r"(WT\s*\d+\s+P\s*\d+)"
+
+def _cache_dir(cache_dir, path, regex_name_pattern):
+    pattern = hashlib.sha256(regex_name_pattern.encode()).hexdigest()[:8] # records depend on the naming scheme too
+    return os.path.join(cache_dir, f"{file_hash(path)}-{pattern}")
+
+def _load_records(directory):
+    with open(os.path.join(directory, RECORDS_NAME)) as f:
+        records = json.load(f)
+    for record in records:
+        if record["image"] is not None:
+            record["image"] = os.path.join(directory, record["image"])
+    return records
+
+def _save_records(directory, records):
+    """
+    Writes the images of the records to the directory, then the records; the records are written last, so interrupted writes are never read.
+    Images are named "page<index>_<name>", so pages of the same plate (recounts) don't overwrite each other.
+    """
+    os.makedirs(directory, exist_ok=True)
+    saved = []
+    for record in records:
+        image_name = None
+        if record["image"] is not None:
+            image_name = f"page{record['page']}_{record['name']}{record['extension']}"
+            with open(os.path.join(directory, image_name), "wb") as f:
+                f.write(record["image"])
+        saved.append({**record, "image": image_name})
+
+    path = os.path.join(directory, RECORDS_NAME)
+    with open(path + ".tmp", "w") as f:
+        json.dump(saved, f)
+    os.replace(path + ".tmp", path)
+
+def parse_pdfs(
+        pdf_paths,
+        cache_dir = None,
+        n_workers = None,
+        pages_per_task = 8,
+        regex_name_pattern = NAME_PATTERN
+):
+    r"""
+    Parses pdfs exported by the Interscience cell counter into records of the dish name, colony count and image, in parallel page ranges.
+    With a cache directory, the records and images of each pdf are kept on disk keyed by its file hash, so pdfs are parsed only once.
+
+    Parameters
+    ----------
+    pdf_paths: str or list of str
+        Filepath or filepaths to the pdf files.
+    cache_dir: str, optional
+        Directory of the parsed records. If None, nothing is cached and the records hold the encoded images.
+    n_workers: int, optional
+        Number of worker processes. If None, the number of CPUs is used; 1 parses everything in the current process.
+    pages_per_task: int, default=8
+        Number of pages parsed per task.
+    regex_name_pattern: str, default=r"(WT\s*\d+\s+P\s*\d+)"
+        Regular expression pattern of the dish naming scheme.
+
+    Returns
+    -------
+    list of dict
+        Per dish "pdf", "page", "name", "count" and "image": the path to the cached image, the encoded image without a cache, or None.
+    """
+    if isinstance(pdf_paths, str):
+        pdf_paths = [pdf_paths]
+
+    records, to_parse = {}, []
+    for path in pdf_paths:
+        directory = _cache_dir(cache_dir, path, regex_name_pattern) if cache_dir is not None else None
+        if directory is not None and os.path.isfile(os.path.join(directory, RECORDS_NAME)):
+            records[path] = _load_records(directory)
+        else:
+            to_parse.append((path, directory))
+
+    tasks, kwargs_list = [], []
+    for path, directory in to_parse:
+        n_pages = len(PdfReader(path).pages)
+        for start in range(0, n_pages, pages_per_task):
+            tasks.append(path)
+            kwargs_list.append({"source": path, "pages": range(start, min(start + pages_per_task, n_pages)), "regex_name_pattern": regex_name_pattern})
+
+    parsed = {path: [] for path, _ in to_parse}
+    results = run_parallel(parse_pdf_pages, kwargs_list, n_workers=n_workers) if kwargs_list else []
+    for path, (result, error) in zip(tasks, results):
+        if error is not None:
+            raise RuntimeError(f"Parsing of {path} failed.") from error
+        parsed[path].extend(result)
+
+    for path, directory in to_parse:
+        if directory is not None:
+            _save_records(directory, parsed[path])
+            records[path] = _load_records(directory)
+        else:
+            records[path] = parsed[path]
+
+    return [{"pdf": path, **record} for path in pdf_paths for record in records[path]]
+
+def normalize_name(name):
+    """
+    Normalizes a dish name for matching: lower case, only letters and digits.
+    """
+    return re.sub(r"[^a-z0-9]", "", str(name).lower())
+
+def counts_from_metadata(metadata):
+    """
+    Colony counts per image from pipeline metadata, summed over the dishes of each image.
+
+    Parameters
+    ----------
+    metadata: dict or list
+        Metadata of pipeline or ResultsStore.to_metadata, or the results of mult_pipeline.
+
+    Returns
+    -------
+    dict
+        Colony count per file name.
+    """
+    if isinstance(metadata, list): # results of mult_pipeline
+        merged = {}
+        for result, _ in metadata:
+            merged.update(result or {})
+        metadata = merged
+
+    return {
+        file_name: sum(record["colony_count"] for records in dishes.values() for record in records if record["colony_count"] is not None)
+        for file_name, dishes in metadata.items()
+    }
+
+def _image_key(record):
+    """
+    Path of the cached image of a record without extension, the key of its count in validate_pdfs; None without a cached image.
+    """
+    image = record.get("image")
+    return os.path.splitext(image)[0] if isinstance(image, str) else None
+
+def match(records, counts):
+    """
+    Matches parsed records to pipeline counts. A record with a cached image matches the count keyed by the image's path without extension
+    (see validate_pdfs), so pages of the same plate match their own image. Other records match by normalized name:
+    a count matches a record if its name ends with the record's name, so images saved as "<prefix>_<name>" match.
+
+    Returns a list of (record, detected count) and the names of unmatched records.
+    """
+    image_keys = {_image_key(record) for record in records} - {None}
+    normalized = {normalize_name(name): count for name, count in counts.items() if name not in image_keys} # counts of images belong to their record
+    matched, unmatched = [], []
+    for record in records:
+        if _image_key(record) in counts:
+            matched.append((record, counts[_image_key(record)]))
+            continue
+
+        name = normalize_name(record["name"])
+        candidates = [key for key in normalized if key == name or key.endswith(name)]
+        if len(candidates) == 1 or name in candidates:
+            matched.append((record, normalized[name if name in candidates else candidates[0]]))
+        else:
+            if len(candidates) > 1:
+                warnings.warn(f"Ambiguous match for {record['name']}: {len(candidates)} candidates.")
+            unmatched.append(record["name"])
+    return matched, unmatched
+
+def validate(records, counts):
+    """
+    Compares pipeline counts to the counts of the cell counter.
+
+    Parameters
+    ----------
+    records: list of dict
+        Parsed records, e.g. from parse_pdfs.
+    counts: dict
+        Detected colony counts per name, e.g. from counts_from_metadata.
+
+    Returns
+    -------
+    dict
+        "n" matched plates, "unmatched" record names, "mae", "bias" (mean of detected - true), "rmse",
+        and "plates": per plate "name", "true", "detected" and "delta", largest absolute delta first.
+    """
+    matched, unmatched = match(records, counts)
+    plates = sorted((
+        {"name": record["name"], "true": record["count"], "detected": detected, "delta": detected - record["count"]}
+        for record, detected in matched
+    ), key=lambda plate: -abs(plate["delta"]))
+
+    deltas = np.array([plate["delta"] for plate in plates], dtype=float)
+    return {
+        "n": len(plates),
+        "unmatched": unmatched,
+        "mae": float(np.abs(deltas).mean()) if plates else None,
+        "bias": float(deltas.mean()) if plates else None,
+        "rmse": float(np.sqrt((deltas ** 2).mean())) if plates else None,
+        "plates": plates
+    }
+
+def format_report(report, top = 10):
+    """
+    Formats a report of validate as text.
+    """
+    if not report["n"]:
+        return f"No plates matched ({len(report['unmatched'])} unmatched)."
+
+    lines = [
+        f"{report['n']} plates matched, {len(report['unmatched'])} unmatched",
+        f"MAE {report['mae']:.2f}, bias {report['bias']:+.2f}, RMSE {report['rmse']:.2f}"
+    ]
+    width = max(len(plate["name"]) for plate in report["plates"][:top])
+    lines += [f"{plate['name']:<{width}}  true {plate['true']:>4}  detected {plate['detected']:>4}  delta {plate['delta']:+d}" for plate in report["plates"][:top]]
+    if report["unmatched"]:
+        lines.append("unmatched: " + ", ".join(report["unmatched"]))
+    return "\n".join(lines)
+
+def validate_pdfs(
+        pdf_paths,
+        cache_dir,
+        save_path = "",
+        n_workers = None,
+        regex_name_pattern = NAME_PATTERN,
+        pipeline_kwargs: dict = None
+):
+    r"""
+    Validates the pipeline against cell counter pdfs: runs mult_pipeline on the images of the pdfs and compares the counts.
+    The pdfs are parsed once into the cache; reruns only cost the pipeline.
+
+    Parameters
+    ----------
+    pdf_paths: str or list of str
+        Filepath or filepaths to the pdf files.
+    cache_dir: str
+        Directory of the parsed records and images.
+    save_path: str, default=""
+        Filepath where the images of the pipeline should be saved.
+    n_workers: int, optional
+        Number of worker processes. If None, the number of CPUs is used.
+    regex_name_pattern: str, default=r"(WT\s*\d+\s+P\s*\d+)"
+        Regular expression pattern of the dish naming scheme.
+    pipeline_kwargs: dict, optional
+        Further keyword arguments of mult_pipeline, i.e. blob_params or the cache_dir of a StageCache.
+
+    Returns
+    -------
+    dict
+        Report of validate.
+    """
+    from ..main.main import mult_pipeline # main imports the helpers
+
+    records = parse_pdfs(pdf_paths, cache_dir=cache_dir, n_workers=n_workers, regex_name_pattern=regex_name_pattern)
+
+    counts = {} # keyed by the paths of the images without extension, see match
+    for directory in sorted({os.path.dirname(record["image"]) for record in records if record["image"] is not None}):
+        results = mult_pipeline(directory, save_path=save_path, save_detected=False, n_workers=n_workers, **(pipeline_kwargs or {}))
+        counts.update({os.path.join(directory, name): count for name, count in counts_from_metadata(results).items()})
+    return validate(records, counts)
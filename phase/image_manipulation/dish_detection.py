@@ -1,9 +1,15 @@
 import cv2 as cv
+import logging
 import numpy as np
 import os
 import warnings
+from functools import lru_cache
 
 from ..helpers.inputs import read_img
+from ..helpers.outputs import save_image
+from ..helpers.profiling import stage
+
+logger = logging.getLogger(__name__)
 
 def sort_circles(circles, row_tolerance=100):
     """
@@ -38,9 +44,56 @@ def sort_circles(circles, row_tolerance=100):
     sorted_circles = [c for row in rows for c in row]
     return sorted_circles
 
+@lru_cache(maxsize=64)
+def _circle_mask(r, cx, cy, h, w):
+    """
+    Builds a dish-sized circular mask for a given crop geometry. Cached, as all dishes of a plate usually share
+    the same radius and only clipped dishes at the image border differ.
+
+    Parameters
+    ----------
+    r: int
+        Radius of the dish.
+    cx, cy: int
+        Center of the dish relative to the top left corner of the crop.
+    h, w: int
+        Height and width of the crop.
+
+    Returns
+    -------
+    np.ndarray
+        Read-only mask of the crop; white inside the dish.
+    """
+    mask = np.zeros((h, w), dtype=np.uint8)
+    cv.circle(mask, (cx, cy), r, 255, -1) # same rasterisation as drawing the circle on the full image and cropping
+    mask.setflags(write=False) # shared between calls, so it must not be modified
+    return mask
+
+def crop_boxes(coordinates, shape):
+    """
+    Squares (x1, y1, x2, y2) around dishes, clipped to an image of the given shape.
+    """
+    boxes = []
+    for (x, y, r) in coordinates:
+        x, y, r = int(x), int(y), int(r)
+        x1, y1 = max(0, x-r), max(0, y-r) # defines top left corner of the crop
+        x2, y2 = min(shape[1], x+r), min(shape[0], y+r) # defines bottom right corner of the crop
+        boxes.append((x1, y1, x2, y2))
+    return boxes
+
+def crop_masks(coordinates, shape):
+    """
+    Masks of the background outside of dishes, as returned by crop, for an image of the given shape.
+    """
+    return [
+        _circle_mask(int(r), int(x)-x1, int(y)-y1, y2-y1, x2-x1) # white circle at the location of the dish
+        for (x, y, r), (x1, y1, x2, y2) in zip(coordinates, crop_boxes(coordinates, shape))
+    ]
+
 def crop(image, coordinates):
     """
     Crops around dishes in an image.
+    The square around each dish is cut out first and only then masked, so the full image is never masked or copied.
     
     Parameters
     ----------
@@ -62,33 +115,127 @@ def crop(image, coordinates):
 
     img = read_img(image)
 
-    for (x, y, r) in coordinates:
-        mask = np.zeros(img.shape[:2], dtype=np.uint8) # mask (black image) the size of the input image
-        cv.circle(mask, (x, y), r, 255, -1) # fills the mask with a white circle at the location of the coordinates (detected dish)
-
-        masked_img = cv.bitwise_and(  # applies mask (keeps values where the mask is white) to original image
-            img, 
-            img, 
-            mask=mask)
+    for (x1, y1, x2, y2), mask_crop in zip(crop_boxes(coordinates, img.shape), crop_masks(coordinates, img.shape)):
+        roi = img[y1:y2, x1:x2] # square crop around the dish, no copy
 
-        x1, y1 = max(0, x-r), max(0, y-r) # defines top left corner of the crop
-        x2, y2 = min(img.shape[1], x+r), min(img.shape[0], y+r) # defines bottom right corner of the crop
-
-        square_crop = masked_img[y1:y2, x1:x2] # applies a square crop for the masked dishes
-        mask_crop = mask[y1:y2, x1:x2] # crops the masks
+        square_crop = cv.bitwise_and(roi, roi, mask=mask_crop) # applies mask (keeps values where the mask is white)
 
         dishes.append(square_crop)
         masks.append(mask_crop)
         
     return dishes, masks
 
+def refine_circle(
+        img,
+        circle,
+        search = 12,
+        n_rays = 360,
+        edge_width = 10
+):
+    """
+    Refines center and radius of a roughly known circle at full resolution.
+    Samples intensity profiles along rays through a narrow annulus around the circle, takes the strongest step edge of each
+    profile and fits a circle to the edge points, rejecting outliers.
+
+    Parameters
+    ----------
+    img: np.ndarray
+        Full resolution image, BGR or grayscale.
+    circle: tuple
+        Rough (x, y, r) of the circle.
+    search: int, default=12
+        Half width in px of the annulus that is searched for the edge.
+    n_rays: int, default=360
+        Number of rays the edge is searched along.
+    edge_width: int, default=10
+        Width in px of the windows compared on either side of the edge; wider windows ignore thin rims and markers.
+
+    Returns
+    -------
+    tuple
+        Refined (x, y, r).
+    """
+    x, y, r = (float(v) for v in circle)
+
+    theta = np.linspace(0, 2*np.pi, n_rays, endpoint=False)
+    radii = np.arange(r - search - edge_width, r + search + edge_width + 1, dtype=np.float32)
+    map_x = (x + np.outer(np.cos(theta), radii)).astype(np.float32)
+    map_y = (y + np.outer(np.sin(theta), radii)).astype(np.float32)
+
+    profiles = cv.remap(img, map_x, map_y, cv.INTER_LINEAR, borderMode=cv.BORDER_REPLICATE) # one row per ray
+    if profiles.ndim == 3:
+        profiles = cv.cvtColor(profiles, cv.COLOR_BGR2GRAY)
+    profiles = profiles.astype(np.float32)
+
+    # step edge strength: difference between the mean inside and outside of each radius
+    cumsum = np.concatenate([np.zeros((n_rays, 1), np.float32), np.cumsum(profiles, axis=1)], axis=1)
+    i = np.arange(edge_width, profiles.shape[1] - edge_width + 1)
+    inner = (cumsum[:, i] - cumsum[:, i - edge_width]) / edge_width
+    outer = (cumsum[:, i + edge_width] - cumsum[:, i]) / edge_width
+    edge = radii[i[np.abs(inner - outer).argmax(axis=1)]] - 0.5
+
+    edge_x = x + edge * np.cos(theta)
+    edge_y = y + edge * np.sin(theta)
+
+    keep = np.ones(n_rays, dtype=bool)
+    for _ in range(3): # least squares circle fit, rejecting rays that hit colonies, markers or reflections
+        A = np.column_stack([2*edge_x[keep], 2*edge_y[keep], np.ones(keep.sum())])
+        b = edge_x[keep]**2 + edge_y[keep]**2
+        (cx, cy, c), *_ = np.linalg.lstsq(A, b, rcond=None)
+        cr = np.sqrt(c + cx**2 + cy**2)
+
+        residuals = np.abs(np.hypot(edge_x - cx, edge_y - cy) - cr)
+        keep = residuals <= max(2.0, 3*np.median(residuals[keep]))
+
+    return int(round(cx)), int(round(cy)), int(round(cr))
+
+def detect_circles_coarse(img, scale = 4):
+    """
+    Detects dishes with Hough Circle Transform on a downsampled image and refines them at full resolution.
+
+    Parameters
+    ----------
+    img: np.ndarray
+        Full resolution BGR image.
+    scale: int, default=4
+        Downsampling factor for the Hough Circle Transform.
+
+    Returns
+    -------
+    np.ndarray or None
+        Detected circles as rows of (x, y, r), None if no dishes were detected.
+    """
+    h, w = img.shape[:2]
+    small = cv.resize(img, (w // scale, h // scale), interpolation=cv.INTER_AREA)
+    gray_small = cv.cvtColor(small, cv.COLOR_BGR2GRAY)
+
+    blur = cv.medianBlur(gray_small, max(3, (21 // scale) | 1)) # same blur as at full resolution, relative to the image size
+
+    circles = cv.HoughCircles( # parameters of the full resolution detection, scaled
+        blur,
+        cv.HOUGH_GRADIENT,
+        dp=1,
+        minDist=800 / scale,
+        param1=125,
+        param2=100 / scale, # fewer edge pixels vote for each center
+        minRadius=400 // scale,
+        maxRadius=600 // scale
+    )
+
+    if circles is None:
+        return None
+
+    return np.array([refine_circle(img, c * scale, search=2*scale + 4) for c in circles[0, :]])
+
 def detect_dishes(
         source,
         save=True,
         save_path = "",
         file_name = "dish_detected", 
         metadata: dict = None,
-        debug = False
+        debug = False,
+        method = "full",
+        scale = 4
 ):
     """
     Detects dishes in an image and crops around them.
@@ -107,6 +254,11 @@ def detect_dishes(
         Metadata dictionary handled by main.py.
     debug: bool, default=False
         Whether to save the input image with numbered circles for debugging.
+    method: str, default="full"
+        "full" runs the Hough Circle Transform on the full resolution image. "coarse" runs it on an image downsampled by scale
+        and refines every dish at full resolution, which is several times faster.
+    scale: int, default=4
+        Downsampling factor for method="coarse".
 
     Returns
     -------
@@ -122,28 +274,35 @@ def detect_dishes(
     dishes, masks, coordinates = [], [], []
 
     img = read_img(source=source)
-    gray_img = cv.cvtColor(img, cv.COLOR_BGR2GRAY)
 
     if (save and not save_path) or (debug and not save_path):
         warnings.warn(f"No specified save path. Images saved in the current directory ({os.getcwd()}) under ...Dishes.")
 
     save_path_dish_detection = os.path.join(save_path, "Dishes") # path for dish crops
 
-    blur = cv.medianBlur(gray_img, 21) # blur so that hough circles doesn't detect random stuff
-
-    circles = cv.HoughCircles( # creates a numpy array of detected circles
-        blur, # image, should be grayscale
-        cv.HOUGH_GRADIENT, # detection method
-        dp=3, # resolution used for the detection; dp=2 means half resolution of the original image
-        minDist=800, # minimum distance between the centers of circles in px
-        param1=125, # upper threshold for canny edge detection (uses canny edge detection internally)
-        param2=100, # threshold for center detection, turn this up if non-dishes are detected
-        minRadius=400, # minimum and maxmimum radius in px
-        maxRadius=600 
-    )
+    with stage("dish_detection"):
+        if method == "full":
+            gray_img = cv.cvtColor(img, cv.COLOR_BGR2GRAY)
+            blur = cv.medianBlur(gray_img, 21) # blur so that hough circles doesn't detect random stuff
+
+            circles = cv.HoughCircles( # creates a numpy array of detected circles
+                blur, # image, should be grayscale
+                cv.HOUGH_GRADIENT, # detection method
+                dp=3, # resolution used for the detection; dp=2 means half resolution of the original image
+                minDist=800, # minimum distance between the centers of circles in px
+                param1=125, # upper threshold for canny edge detection (uses canny edge detection internally)
+                param2=100, # threshold for center detection, turn this up if non-dishes are detected
+                minRadius=400, # minimum and maxmimum radius in px
+                maxRadius=600 
+            )
+            if circles is not None:
+                circles = np.round(circles[0, :]).astype("int") 
+        elif method == "coarse":
+            circles = detect_circles_coarse(img, scale=scale)
+        else:
+            raise ValueError(f"Unknown dish detection method: {method}")
 
     if circles is not None:
-        circles = np.round(circles[0, :]).astype("int") 
         circles = sort_circles(circles, row_tolerance=150)
 
         coordinates = [(x, y, r) for (x, y, r) in circles]
@@ -170,14 +329,12 @@ def detect_dishes(
             save_name = f"{file_name}_dish_{idx}.png" if idx is not None else f"{file_name}_dish.png"
 
             if save: # saving the dishes if the flag is passed
-                os.makedirs(save_path_dish_detection, exist_ok=True)
-                cv.imwrite(os.path.join(save_path_dish_detection, save_name), dish)
+                save_image(os.path.join(save_path_dish_detection, save_name), dish)
 
-        print(f"{len(circles)} dishes detected in file: {file_name}.")
+        logger.info("%d dishes detected in file: %s.", len(circles), file_name)
 
         if debug: # saves debug image
-            os.makedirs(save_path_dish_detection, exist_ok=True)
-            cv.imwrite(os.path.join(save_path_dish_detection, f"{file_name}_debug.png"), debug_img)
+            save_image(os.path.join(save_path_dish_detection, f"{file_name}_debug.png"), debug_img)
 
     else:
         warnings.warn("No dishes detected.")
@@ -1,35 +1,276 @@
 import cv2 as cv
+import logging
 import numpy as np
 import os
 import warnings
 
 from ..helpers.inputs import read_img, show_image
+from ..helpers.outputs import save_image
+from ..helpers.profiling import stage
+from .thresholding import adaptive_threshold
+
+logger = logging.getLogger(__name__)
 
 def separate_components(
         source,
         th,
         kernel_size=3,
-        max_dist = 0.7
+        max_dist = 0.7,
+        min_area = 200,
+        connectivity = 8,
+        return_labels = False
+        ):
+    """
+    Splits touching colonies of a binary image by a distance transform watershed.
+    Only components of at least min_area px are split, each on its own crop: the distance transform of the component is thresholded
+    at max_dist of its maximum into peak markers, which are flooded by a watershed. Smaller components are left as they are.
+
+    Returns split binary image, or label image.
+
+    Parameters
+    ----------
+    source: str or np.ndarray, optional
+        Image of dish, or string to the image path; the watershed floods its intensities. If None, each pixel goes to its nearest marker.
+    th: str or np.ndarray
+        Thresholded (binary) image of the dish, or string to the image path.
+    kernel_size: int, default=3
+        Mask size of the distance transform, 3, 5 or 0 (precise).
+    max_dist: float, default=0.7
+        Height of the peak markers relative to the maximum distance of their component. Lower values split less.
+    min_area: int, default=200
+        Minimum area of a component in px to be split.
+    connectivity: int, default=8
+        Connectivity of the components, 4 or 8.
+    return_labels: bool, default=False
+        Return a label image (int32, background 0) instead of a binary image.
+
+    Returns
+    -------
+    np.ndarray
+        Binary image with the split components separated by cut lines, or label image with one label per split component.
+    """
+    th = read_img(th)
+    if th.ndim == 3:
+        th = cv.cvtColor(th, cv.COLOR_BGR2GRAY)
+    img = read_img(source) if source is not None else None
+    if img is not None and img.ndim == 2:
+        img = cv.cvtColor(img, cv.COLOR_GRAY2BGR)
+
+    n_labels, labels, stats, _ = cv.connectedComponentsWithStats(th, connectivity=connectivity, ltype=cv.CV_32S)
+    height, width = th.shape
+
+    next_label = n_labels
+    for label in np.flatnonzero(stats[1:, cv.CC_STAT_AREA] >= min_area) + 1:
+        x, y, w, h = stats[label, :4]
+        x0, y0, x1, y1 = max(x - 1, 0), max(y - 1, 0), min(x + w + 1, width), min(y + h + 1, height) # 1 px border for the watershed
+        component = labels[y0:y1, x0:x1] == label
+
+        dist = cv.distanceTransform(component.astype(np.uint8), cv.DIST_L2, kernel_size)
+        n_peaks, markers = cv.connectedComponents((dist >= max_dist * dist.max()).astype(np.uint8), connectivity=8, ltype=cv.CV_32S)
+        if n_peaks <= 2: # a single peak, nothing to split
+            continue
+
+        if img is not None:
+            markers[~component] = n_peaks # outside of the component, so the flooding stays inside
+            cv.watershed(np.ascontiguousarray(img[y0:y1, x0:x1]), markers)
+        else: # flooding the distance to the markers: every pixel goes to its nearest peak, the ridges are equidistant
+            _, nearest = cv.distanceTransformWithLabels((markers == 0).astype(np.uint8), cv.DIST_L2, 3, labelType=cv.DIST_LABEL_CCOMP)
+            lut = np.zeros(nearest.max() + 1, np.int32)
+            lut[nearest[markers > 0]] = markers[markers > 0]
+            markers = lut[nearest]
+
+        # cuts the pixels next to a higher region, so the regions are separated with any connectivity; watershed lines (-1) are cut too
+        regions = np.where(component, markers, 0).astype(np.float32)
+        cut = component & ((markers <= 0) | (cv.dilate(regions, np.ones((3, 3), np.uint8)) > regions))
+
+        roi = labels[y0:y1, x0:x1]
+        roi[cut] = 0
+        for peak in range(2, n_peaks): # the first region keeps the label of the component
+            roi[component & ~cut & (markers == peak)] = next_label
+            next_label += 1
+
+    if return_labels:
+        return labels
+    return np.where(labels > 0, 255, 0).astype(np.uint8)
+
+def filter_area(
+        source,
+        min_area = 5,
+        max_area = 200,
+        invert = False,
+        connectivity = 8
+        ):
+    """
+    Filters connected components of a binary image by their area.
+    Builds a keep/drop lookup table over the component labels and applies it in a single indexing pass.
+
+    Returns filtered image.
+
+    Parameters
+    ----------
+    source: np.ndarray
+        Binary image.
+    min_area: int, default=5
+        Minimum area of a component in px (inclusive).
+    max_area: int, default=200
+        Maximum area of a component in px (inclusive).
+    invert: bool, default=False
+        Keep the components outside of the range instead, i.e. artifacts for background masks.
+    connectivity: int, default=8
+        Connectivity of the components, 4 or 8.
+
+    Returns
+    -------
+    np.ndarray
+        Binary image with the kept components.
+    """
+    _, labels, stats, _ = cv.connectedComponentsWithStats(source, connectivity=connectivity)
+    return _area_lut(stats, min_area, max_area, invert)[labels]
+
+def _area_lut(stats, min_area, max_area, invert = False):
+    """
+    Label -> output value lookup table of filter_area, from the component stats.
+    """
+    area = stats[:, cv.CC_STAT_AREA]
+    keep = (min_area <= area) & (area <= max_area)
+    if invert:
+        keep = ~keep
+    keep[0] = False # background
+
+    return np.where(keep, 255, 0).astype(np.uint8)
+
+def estimate_background(
+        source,
+        kernel_size = 500,
+        method = "exact",
+        scale = 8
+        ):
+    """
+    Estimates the background of a grayscale image by morphological opening with an elliptical kernel.
+    Subtracting it from the image gives the (white) tophat.
+
+    Returns background image.
+
+    Parameters
+    ----------
+    source: np.ndarray
+        Grayscale image.
+    kernel_size: int, default=500
+        Kernel size for the opening at full resolution.
+    method: str, default="exact"
+        "exact" opens the full resolution image. "pyramid" opens the image downsampled by scale with a kernel scaled accordingly,
+        and upsamples the result.
+    scale: int, default=8
+        Downsampling factor for method="pyramid".
+
+    Returns
+    -------
+    np.ndarray
+        Background image, same size as source.
+    """
+    if method == "exact":
+        kernel = cv.getStructuringElement(cv.MORPH_ELLIPSE, (kernel_size, kernel_size))
+        return cv.morphologyEx(source, cv.MORPH_OPEN, kernel)
+
+    if method != "pyramid":
+        raise ValueError(f"Unknown background estimation method: {method}")
+
+    h, w = source.shape[:2]
+    small = cv.resize(source, (max(1, w // scale), max(1, h // scale)), interpolation=cv.INTER_AREA)
+
+    small_kernel_size = max(1, round(kernel_size / scale))
+    kernel = cv.getStructuringElement(cv.MORPH_ELLIPSE, (small_kernel_size, small_kernel_size))
+    background = cv.morphologyEx(small, cv.MORPH_OPEN, kernel)
+
+    return cv.resize(background, (w, h), interpolation=cv.INTER_LINEAR)
+
+def threshold_dish(
+        img,
+        s = 121,
+        C = 11,
+        method = "gaussian",
+        background = None
         ):
-    source = read_img(source)
-    th = cv.cvtColor(read_img(th), cv.COLOR_BGR2GRAY)
+    """
+    First stage of preprocess: adaptive threshold of the green channel of a dish.
+
+    Returns thresholded image.
+
+    Parameters
+    ----------
+    img: np.ndarray
+        Image of dish.
+    s: int, default=121
+        Block size for thresholding.
+    C: int, default=11
+        Constant to subtract from thresholding.
+    method: str, default="gaussian"
+        Local mean of the threshold, "gaussian", "box" or "downsampled"; see thresholding.local_mean.
+    background: np.ndarray, optional
+        Precomputed local mean of the green channel, i.e. from thresholding.BackgroundCache.
+
+    Returns
+    -------
+    np.ndarray
+        Binary image, colonies (darker than their surroundings) white.
+    """
+    green_channel = img[:, :, 1] # isolating green channel
 
-    # Perform connected component labeling
-    n_labels, labels, stats, centroids = cv.connectedComponentsWithStats(th, connectivity=4)
+    with stage("threshold"):
+        return adaptive_threshold(green_channel, s=s, C=C, method=method, background=background)
 
-    # Create false color image and color background black
-    colors = np.random.randint(0, 255, size=(n_labels, 3), dtype=np.uint8)
-    colors[0] = [0, 0, 0]  # for cosmetic reason we want the background black
-    false_colors = colors[labels]
+def clean_threshold(
+        threshold,
+        mask = None,
+        fg_mask = None,
+        bg_mask = None,
+        area_filter = True,
+        kernel_size = 3,
+        min_area = 5,
+        max_area = 200
+        ):
+    """
+    Second stage of preprocess: area filter (or watershed), masks and erosion of a thresholded dish.
 
-    # Label area of each polygon
-    false_colors_area = false_colors.copy()
-    for i, centroid in enumerate(centroids[1:], start=1):
-        area = stats[i, 4]
-        cv.putText(false_colors_area, str(area), (int(centroid[0]), int(centroid[1])), cv.FONT_HERSHEY_SIMPLEX, 0.5, (255,255,255), 1)
+    Returns preprocessed image.
 
-    cv.imshow('false_colors_area', false_colors_area)
-    cv.waitKey()
+    Parameters
+    ----------
+    threshold: np.ndarray
+        Thresholded dish, from threshold_dish.
+    mask, fg_mask, bg_mask, area_filter, kernel_size, min_area, max_area:
+        As in preprocess.
+
+    Returns
+    -------
+    np.ndarray
+        Preprocessed dish.
+    """
+    # area filter if area_filter flag is passed, otherwise watershed of the components larger than max_area
+    with stage("area_filter"):
+        if area_filter:
+            filtered = filter_area(threshold, min_area=min_area, max_area=max_area)
+        else:
+            filtered = cv.bitwise_and(threshold, threshold, mask=mask) if mask is not None else threshold # the outside of the dish is one huge component
+            filtered = separate_components(None, filtered, min_area=max_area)
+
+    with stage("masking"):
+        # "crops" the outside of the dish if mask is passed
+        if mask is not None:
+            cropped = cv.bitwise_and(filtered, filtered, mask=mask)
+        else:
+            cropped = filtered
+
+        # applies fg_mask and bg_mask if passed, each on its own
+        masked1 = cv.bitwise_and(cropped, cropped, mask=fg_mask) if fg_mask is not None else cropped
+        if bg_mask is not None:
+            masked2 = cv.bitwise_and(masked1, masked1, mask=cv.bitwise_not(bg_mask))
+        else:
+            masked2 = masked1
+
+        # erosion
+        kernel = cv.getStructuringElement(cv.MORPH_ELLIPSE, (kernel_size, kernel_size))
+        return cv.morphologyEx(masked2, cv.MORPH_ERODE, kernel)
 
 def preprocess(
         source,
@@ -42,6 +283,8 @@ def preprocess(
         kernel_size = 3,
         min_area = 5,
         max_area = 200,
+        threshold_method = "gaussian",
+        background = None,
         save = False,
         save_path = "",
         file_name = "preprocessed",
@@ -63,13 +306,18 @@ def preprocess(
     bg_mask: np.ndarray, optional
         "Ground truth negative" mask of the petri dish, marker, and other artifacts. From preprocess_bg_isolation().
     area_filter: bool, default=True,
-        Filter large objects by virtue of connected components. Useful for just formed colonies to reduce the noise; turn off when colonies are larger.
+        Filter large objects by virtue of connected components. Useful for just formed colonies to reduce the noise; turn off when colonies are larger,
+        then components larger than max_area are split by separate_components instead.
     s: int, default=121
         Block size for thresholding. Bigger numbers include more to threshold.
     C: int, default=11
         Constant to subtract from thresholding.
     kernel_size: int, optional
         Kernel size for erosion. Used for noise removal and colony separation.
+    threshold_method: str, default="gaussian"
+        Local mean of the threshold, "gaussian", "box" or "downsampled"; see thresholding.local_mean.
+    background: np.ndarray, optional
+        Precomputed local mean of the green channel, i.e. from thresholding.BackgroundCache. Replaces s and threshold_method.
     save: bool, default=True
         Whether to save the preprocessed image.
     save_path: str, optional
@@ -89,59 +337,27 @@ def preprocess(
     if save and not save_path:
         warnings.warn(f"No specified save path. Images saved in the current directory ({os.getcwd()}) under ...Preprocessing.")
 
-    # isolating green channel
-    green_channel = img[:, :, 1]
-
-    # thresholding
-    threshold = cv.adaptiveThreshold(
-        src=green_channel,
-        maxValue=255,
-        adaptiveMethod=cv.ADAPTIVE_THRESH_GAUSSIAN_C,
-        thresholdType=cv.THRESH_BINARY_INV,
-        blockSize=s,
-        C=C
+    threshold = threshold_dish(img, s=s, C=C, method=threshold_method, background=background)
+
+    eroded = clean_threshold(
+        threshold,
+        mask=mask,
+        fg_mask=fg_mask,
+        bg_mask=bg_mask,
+        area_filter=area_filter,
+        kernel_size=kernel_size,
+        min_area=min_area,
+        max_area=max_area
     )
 
-    # area filter if area_filter flag is passed, otherwise watershed
-    if area_filter:
-        num_labels, labels, stats, _ = cv.connectedComponentsWithStats(threshold, connectivity=8)
-        filtered = np.zeros_like(threshold)
-
-        for i in range(1, num_labels):  # skips background
-            area = stats[i, cv.CC_STAT_AREA]
-            if min_area <= area <= max_area:
-                filtered[labels == i] = 255
-    else:
-        filtered = threshold
-        separate_components()
-
-    # "crops" the outside of the dish if mask is passed
-    if mask is not None:
-        cropped = cv.bitwise_and(filtered, filtered, mask=mask)
-    else:
-        cropped = filtered
-
-    # applies fg_mask and bg_mask if passed
-    if fg_mask is not None:
-            masked1 = cv.bitwise_and(cropped, cropped, mask=fg_mask)
-    if bg_mask is not None:
-            masked2 = cv.bitwise_and(masked1, masked1, mask=cv.bitwise_not(bg_mask))
-    else:
-        masked2 = cropped
-    
-    # erosion
-    kernel = cv.getStructuringElement(cv.MORPH_ELLIPSE, (kernel_size, kernel_size))
-    eroded = cv.morphologyEx(masked2, cv.MORPH_ERODE, kernel)
-
     # saving
     save_name = f"{file_name}_preprocessed_{idx}.png" if idx is not None else f"{file_name}_preprocessed.png"
 
     if save:
         save_path_preprocessing = os.path.join(save_path, "Preprocessing")
-        os.makedirs(save_path_preprocessing, exist_ok=True)
-        cv.imwrite(os.path.join(save_path_preprocessing, save_name), eroded)
+        save_image(os.path.join(save_path_preprocessing, save_name), eroded)
 
-    print(f"File {save_name} preprocessed.")
+    logger.debug("File %s preprocessed.", save_name)
 
     return eroded
 
@@ -149,6 +365,8 @@ def preprocess_fg_isolation(
         source,
         mask = None,
         kernel_size = 500,
+        method = "exact",
+        scale = 8,
         save = False,
         save_path = "",
         file_name = "preprocessed",
@@ -168,6 +386,11 @@ def preprocess_fg_isolation(
         Mask of background area outside of dish, if None the background crop won't be applied and watershedding won't work.
     kernel_size: int, default = 200
         Kernel size for tophat; higher number results in a smoother background and contrasted colonies, but takes longer. 
+    method: str, default="exact"
+        Background estimation for the tophat. "exact" opens the full resolution image,
+        "pyramid" opens a downsampled image and upsamples the background, which is orders of magnitude faster for large kernels.
+    scale: int, default=8
+        Downsampling factor for method="pyramid".
     save: bool, default = True
         Whether to save the preprocessed image.
     save_path: str, optional
@@ -191,9 +414,7 @@ def preprocess_fg_isolation(
 
     blur = cv.medianBlur(green_channel, 5)
 
-    kernel = cv.getStructuringElement(cv.MORPH_ELLIPSE, (kernel_size, kernel_size))
-
-    tophat = cv.morphologyEx(blur, cv.MORPH_TOPHAT, kernel)
+    tophat = cv.subtract(blur, estimate_background(blur, kernel_size=kernel_size, method=method, scale=scale))
 
     _, threshold = cv.threshold(tophat, 0, 255, cv.THRESH_BINARY_INV + cv.THRESH_OTSU)
 
@@ -204,9 +425,8 @@ def preprocess_fg_isolation(
 
     if save:
         save_path_preprocessing = os.path.join(save_path, "Preprocessing")
-        os.makedirs(save_path_preprocessing, exist_ok=True)
-        cv.imwrite(os.path.join(save_path_preprocessing, save_name), threshold)
-    print(f"File {save_name} preprocessed.")
+        save_image(os.path.join(save_path_preprocessing, save_name), threshold)
+    logger.debug("File %s preprocessed.", save_name)
 
     return threshold
 
@@ -218,6 +438,7 @@ def preprocess_bg_isolation(
         kernel_size = 3,
         min_area = 5,
         max_area = 200,
+        threshold_method = "gaussian",
         save=False,
         save_path = "",
         file_name = "preprocessed",
@@ -241,6 +462,8 @@ def preprocess_bg_isolation(
         Constant to subtract from thresholding.
     kernel_size: int, optional
         Kernel size for opening. Used for closing gaps.
+    threshold_method: str, default="gaussian"
+        Local mean of the threshold, "gaussian", "box" or "downsampled"; see thresholding.local_mean.
     save: bool, default=True
         Whether to save the preprocessed images.
     save_path: str, optional
@@ -260,24 +483,9 @@ def preprocess_bg_isolation(
     if save and not save_path:
         warnings.warn(f"No specified save path. Images saved in the current directory ({os.getcwd()}) under ...Preprocessing.")
 
-    green_channel = img[:, :, 1]
-
-    threshold = cv.adaptiveThreshold(
-        src=green_channel,
-        maxValue=255,
-        adaptiveMethod=cv.ADAPTIVE_THRESH_GAUSSIAN_C,
-        thresholdType=cv.THRESH_BINARY_INV,
-        blockSize=s,
-        C=C
-    )
-
-    num_labels, labels, stats, centroids = cv.connectedComponentsWithStats(threshold, connectivity=8)
-    filtered = np.zeros_like(threshold)
+    threshold = threshold_dish(img, s=s, C=C, method=threshold_method)
 
-    for i in range(1, num_labels):  # skip background
-        area = stats[i, cv.CC_STAT_AREA]
-        if not min_area <= area <= max_area:
-            filtered[labels == i] = 255
+    filtered = filter_area(threshold, min_area=min_area, max_area=max_area, invert=True) # keeps everything that isn't colony sized
 
     kernel = cv.getStructuringElement(cv.MORPH_ELLIPSE, (kernel_size, kernel_size))
     opened = cv.morphologyEx(filtered, cv.MORPH_OPEN, kernel)
@@ -291,8 +499,7 @@ def preprocess_bg_isolation(
 
     if save:
         save_path_preprocessing = os.path.join(save_path, "Preprocessing")
-        os.makedirs(save_path_preprocessing, exist_ok=True)
-        cv.imwrite(os.path.join(save_path_preprocessing, save_name), filtered)
-    print(f"File {save_name} preprocessed.")
+        save_image(os.path.join(save_path_preprocessing, save_name), filtered)
+    logger.debug("File %s preprocessed.", save_name)
 
     return filtered
\ No newline at end of file
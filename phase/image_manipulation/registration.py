@@ -0,0 +1,136 @@
+import cv2 as cv
+import numpy as np
+import warnings
+
+from .dish_detection import crop_boxes, crop_masks, refine_circle
+
+def _small_gray(img, box, scale):
+    """
+    Downsampled grayscale float crop of an image, for phase correlation.
+    """
+    x1, y1, x2, y2 = box
+    roi = img[y1:y2, x1:x2]
+    if roi.ndim == 3:
+        roi = cv.cvtColor(roi, cv.COLOR_BGR2GRAY)
+    return cv.resize(roi, (max(1, (x2-x1) // scale), max(1, (y2-y1) // scale)), interpolation=cv.INTER_AREA).astype(np.float32)
+
+def estimate_shift(reference, image, window = None):
+    """
+    Estimates the translation of an image relative to a reference by phase correlation.
+
+    Parameters
+    ----------
+    reference: np.ndarray
+        Grayscale float32 reference.
+    image: np.ndarray
+        Grayscale float32 image of the same size.
+    window: np.ndarray, optional
+        Window applied to both, i.e. from cv.createHanningWindow, against edge effects.
+
+    Returns
+    -------
+    tuple
+        (dx, dy) in px of the image and the response of the correlation peak (0 - 1); low responses are unreliable.
+    """
+    (dx, dy), response = cv.phaseCorrelate(reference.copy(), image.copy(), window) # the window is applied in place
+    return (dx, dy), response
+
+class DishGeometry:
+    """
+    Dish geometry of a timelapse: crop boxes and masks of every dish, made once instead of per frame.
+    register checks each frame for drifted dishes, i.e. after the incubator door was opened, by phase correlation of each
+    downsampled dish crop against its reference, and moves the geometry of drifted dishes only.
+    The size of the crops is kept, so masks made for the dishes stay valid.
+
+    Parameters
+    ----------
+    coordinates: list of tuples
+        Coordinates (x, y, r) of the dishes.
+    shape: tuple
+        Shape of the frames.
+    scale: int, default=4
+        Downsampling factor of the phase correlation.
+    max_shift: float, default=3.0
+        Drift in px up to which dishes are considered unmoved.
+    min_response: float, default=0.05
+        Minimum response of the phase correlation; dishes with weaker responses (i.e. covered or out of view) are not moved.
+    method: str, default="redetect"
+        "shift" moves the geometry of a drifted dish by the estimated drift.
+        "redetect" also re-detects the center of the dish around the shifted position with refine_circle, which is more precise.
+    """
+    def __init__(self, coordinates, shape, scale = 4, max_shift = 3.0, min_response = 0.05, method = "redetect"):
+        if method not in ("shift", "redetect"):
+            raise ValueError(f"Unknown registration method: {method}")
+        self.coordinates = [tuple(int(v) for v in c) for c in coordinates]
+        self.shape = tuple(shape)
+        self.scale = scale
+        self.max_shift = max_shift
+        self.min_response = min_response
+        self.method = method
+
+        self.boxes = crop_boxes(self.coordinates, self.shape)
+        self.masks = crop_masks(self.coordinates, self.shape)
+        self.references = None # downsampled crops the drift is measured against
+        self.windows = None
+        self.n_moved = 0
+
+    def crop(self, frame):
+        """
+        Crops the dishes of a frame, like crop.
+
+        Returns the dishes and their masks.
+        """
+        dishes = []
+        for (x1, y1, x2, y2), mask in zip(self.boxes, self.masks):
+            roi = frame[y1:y2, x1:x2]
+            dishes.append(cv.bitwise_and(roi, roi, mask=mask))
+        return dishes, self.masks
+
+    def register(self, frame):
+        """
+        Measures the drift of each dish in a frame and moves the geometry of drifted dishes.
+        The first registered frame is the reference; the reference of a moved dish is updated to the frame it moved in.
+
+        Parameters
+        ----------
+        frame: np.ndarray
+            Full frame.
+
+        Returns
+        -------
+        list of int
+            Indices of the moved dishes.
+        """
+        smalls = [_small_gray(frame, box, self.scale) for box in self.boxes]
+        if self.references is None:
+            self.references = smalls
+            self.windows = [cv.createHanningWindow(small.shape[::-1], cv.CV_32F) for small in smalls]
+            return []
+
+        moved = []
+        for idx, (reference, small, window) in enumerate(zip(self.references, smalls, self.windows)):
+            (dx, dy), response = estimate_shift(reference, small, window)
+            dx, dy = dx * self.scale, dy * self.scale
+            if response < self.min_response or np.hypot(dx, dy) <= self.max_shift:
+                continue
+
+            x, y, r = self.coordinates[idx]
+            x, y = int(round(x + dx)), int(round(y + dy))
+            if self.method == "redetect":
+                rx, ry, _ = refine_circle(frame, (x, y, r), search=2*self.scale + 4)
+                if np.hypot(rx - x, ry - y) <= 2*self.scale + 4: # otherwise the edge wasn't found, the shift is kept
+                    x, y = rx, ry
+
+            box = crop_boxes([(x, y, r)], self.shape)[0]
+            if (box[2] - box[0], box[3] - box[1]) != (self.boxes[idx][2] - self.boxes[idx][0], self.boxes[idx][3] - self.boxes[idx][1]):
+                warnings.warn(f"Dish {idx+1} drifted out of the frame, its geometry is kept.")
+                continue
+
+            self.coordinates[idx] = (x, y, r)
+            self.boxes[idx] = box
+            self.masks[idx] = crop_masks([(x, y, r)], self.shape)[0]
+            self.references[idx] = _small_gray(frame, box, self.scale)
+            self.n_moved += 1
+            moved.append(idx)
+
+        return moved
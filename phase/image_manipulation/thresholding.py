@@ -0,0 +1,146 @@
+import cv2 as cv
+import numpy as np
+
+THRESHOLD_METHODS = ("gaussian", "box", "downsampled")
+
+def _sigma(s):
+    # sigma OpenCV derives from the block size, as in cv.adaptiveThreshold
+    return 0.3 * ((s - 1) * 0.5 - 1) + 0.8
+
+def local_mean(
+        source,
+        s = 121,
+        method = "gaussian",
+        scale = 4
+        ):
+    """
+    Local mean (background estimate) of a grayscale image, the reference of the adaptive threshold.
+
+    Returns the local mean.
+
+    Parameters
+    ----------
+    source: np.ndarray
+        Grayscale image, i.e. the green channel of a dish.
+    s: int, default=121
+        Block size of the mean.
+    method: str, default="gaussian"
+        "gaussian" is the Gaussian weighted mean of cv.adaptiveThreshold. "box" is the unweighted mean, computed in constant time per pixel
+        regardless of the block size. "downsampled" is the Gaussian mean of the image downsampled by scale, upsampled again;
+        an approximation that is several times faster for large blocks.
+    scale: int, default=4
+        Downsampling factor for method="downsampled".
+
+    Returns
+    -------
+    np.ndarray
+        Local mean, uint8, same size as source.
+    """
+    border = cv.BORDER_REPLICATE | cv.BORDER_ISOLATED
+
+    if method == "gaussian": # blurred in float and rounded, as in cv.adaptiveThreshold
+        blurred = cv.GaussianBlur(source.astype(np.float32), (s, s), 0, sigmaY=0, borderType=border)
+        return np.rint(blurred).astype(np.uint8)
+
+    if method == "box":
+        return cv.boxFilter(source, -1, (s, s), normalize=True, borderType=border)
+
+    if method != "downsampled":
+        raise ValueError(f"Unknown thresholding method: {method}")
+
+    h, w = source.shape[:2]
+    small = cv.resize(source, (max(1, w // scale), max(1, h // scale)), interpolation=cv.INTER_AREA)
+
+    small_s = max(3, (s // scale) | 1) # odd
+    blurred = cv.GaussianBlur(small, (small_s, small_s), _sigma(s) / scale, borderType=border)
+
+    return cv.resize(blurred, (w, h), interpolation=cv.INTER_LINEAR)
+
+def adaptive_threshold(
+        source,
+        s = 121,
+        C = 11,
+        method = "gaussian",
+        scale = 4,
+        background = None
+        ):
+    """
+    Inverted adaptive threshold of a grayscale image: pixels darker than their local mean by at least C are white.
+    With method="gaussian" and no background, this is cv.adaptiveThreshold with ADAPTIVE_THRESH_GAUSSIAN_C.
+
+    Returns thresholded image.
+
+    Parameters
+    ----------
+    source: np.ndarray
+        Grayscale image, i.e. the green channel of a dish.
+    s: int, default=121
+        Block size for thresholding.
+    C: int, default=11
+        Constant to subtract from thresholding.
+    method: str, default="gaussian"
+        Local mean, see local_mean.
+    scale: int, default=4
+        Downsampling factor for method="downsampled".
+    background: np.ndarray, optional
+        Precomputed local mean, i.e. from BackgroundCache. If passed, s, method and scale are ignored.
+
+    Returns
+    -------
+    np.ndarray
+        Binary image, dark objects white.
+    """
+    if background is None:
+        if method == "gaussian":
+            return cv.adaptiveThreshold(source, 255, cv.ADAPTIVE_THRESH_GAUSSIAN_C, cv.THRESH_BINARY_INV, s, C)
+        background = local_mean(source, s=s, method=method, scale=scale)
+
+    # same rounding of C as cv.adaptiveThreshold
+    difference = cv.subtract(source, background, dtype=cv.CV_16S)
+    return cv.compare(difference, -int(np.floor(C)), cv.CMP_LE)
+
+class BackgroundCache:
+    """
+    Local means of the dishes of a timelapse, reused over neighbouring frames.
+    The background of a dish varies slowly, so it is only recomputed every refresh frames; the threshold of each frame still uses the frame itself.
+
+    Parameters
+    ----------
+    refresh: int, default=6
+        Number of frames a local mean is reused for. 1 recomputes it every frame.
+    s: int, default=121
+        Block size of the mean.
+    method: str, default="gaussian"
+        Local mean, see local_mean.
+    scale: int, default=4
+        Downsampling factor for method="downsampled".
+    """
+    def __init__(self, refresh = 6, s = 121, method = "gaussian", scale = 4):
+        if method not in THRESHOLD_METHODS:
+            raise ValueError(f"Unknown thresholding method: {method}")
+        self.refresh = refresh
+        self.s = s
+        self.method = method
+        self.scale = scale
+        self.backgrounds = {} # key -> (frame index, local mean)
+        self.n_computed = 0
+
+    def get(self, key, t, source):
+        """
+        Returns the local mean of a dish at frame t, recomputed if it is older than refresh frames.
+
+        Parameters
+        ----------
+        key: hashable
+            Dish, i.e. its number.
+        t: int
+            Index of the frame.
+        source: np.ndarray
+            Grayscale image of the dish at frame t.
+        """
+        cached = self.backgrounds.get(key)
+        if cached is None or not 0 <= t - cached[0] < self.refresh or cached[1].shape != source.shape:
+            cached = (t, local_mean(source, s=self.s, method=self.method, scale=self.scale))
+            self.backgrounds[key] = cached
+            self.n_computed += 1
+        return cached[1]
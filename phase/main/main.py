@@ -1,17 +1,30 @@
-import cv2 as cv
 import numpy as np
 import os
-import yaml
+import warnings
+from contextlib import nullcontext
+from functools import partial
 import matplotlib.pyplot as plt
 
-from ..helpers.timelapse import make_masks, DishState, check_state
-from ..helpers.inputs import read_time, read_image_paths
+from ..helpers.timelapse import make_masks, process_dish, DishState, check_state
+from ..helpers.inputs import read_image_paths, file_hash
+from ..helpers.catalog import FrameCatalog
+from ..helpers.frames import FrameSource, load_frame
+from ..helpers.results import open_results
+from ..helpers.outputs import flush_images, save_image
+from ..helpers.checkpoint import Checkpoint
+from ..helpers.incremental import IncrementalDish
+from ..helpers.cube import DishCubes, build_cubes
 from ..helpers.plotting import init_plot, update_live_plot
+from ..helpers.parallel import run_parallel, DishPool
+from ..helpers.profiling import stage, frame as frame_context, cprofile
+from ..helpers.cache import StageCache, Stage, DEFAULT_CACHE_SIZE
+from ..helpers.stages import stage_version, decode_stage, dishes_stage, crop_stage, preprocess_stage, count_stage, draw_colonies
 
-from ..image_manipulation.preprocessing import preprocess, preprocess_fg_isolation
-from ..image_manipulation.dish_detection import detect_dishes, crop
+from ..image_manipulation.preprocessing import preprocess_fg_isolation
+from ..image_manipulation.thresholding import BackgroundCache
+from ..image_manipulation.registration import DishGeometry
 
-from ..colony_detection.counting import detect_colonies
+from ..colony_detection.tracking import ColonyTracker
 
 def pipeline(
         source,
@@ -19,103 +32,185 @@ def pipeline(
         save_metadata=False,
         save_dishes=False,
         save_preprocessed=False,
-        save_detected=True
+        save_detected=True,
+        count_method = "blob",
+        blob_params: dict = None,
+        cache_dir: str = None,
+        cache_size = DEFAULT_CACHE_SIZE,
+        export_metadata = False
         ):
     """
     Process image to get yield cropped dishes, with circled colonies.
+    The image is processed as a DAG of stages: decoding, dish detection, cropping, preprocessing and counting.
+    With a cache directory, the results of the stages are cached by the content of the image, their parameters and code,
+    so a rerun (i.e. with other blob parameters) only recomputes the stages downstream of the change.
+
+    Returns metadata - dish crop positions and number of colonies.
 
     Parameters
     ----------
     source: str
         Filepath to the image file of the petri dishes with the colonies.
-    kernel_size: int, optional
-        Kernel size for opening; higher number yields more smoothed, generally better results, but takes longer.
     save_path: str, optional
         Filepath where the images should be saved. Creates different folders for dish crops, preprocessed images, and dishes with detected colonies.
     save_metadata: bool, default=False
-        Whether to save metadata - dish crop positions and number of colonies.
+        Whether to save metadata - dish crop positions and number of colonies - to results.sqlite in the save path.
     save_dishes: bool, default=False
         Whether to save the dish crops.
     save_preprocessed: bool, default=False
         Whether to save the preprocessed images.
     save_detected: bool, default=True
         Whether to save the image with the detected colonies.
-
+    count_method: str, default="blob"
+        Counting backend of detect_colonies: "blob" or the faster "components".
+    blob_params: dict, optional
+        Parameters overriding BLOB_PARAMS of detect_colonies.
+    cache_dir: str, optional
+        Directory of the StageCache. If None, nothing is cached.
+    cache_size: int, default=4 GiB
+        Size in bytes the cache is kept within, by evicting the least recently used results.
+    export_metadata: bool, default=False
+        Whether to export the saved metadata to metadata.yaml in the save path, with save_metadata. Earlier results in metadata.yaml are kept.
+        The export writes all stored results, so over many images export once at the end with ResultsStore.export_yaml, as mult_pipeline does.
+
+    Returns
+    -------
+    dict
+        Metadata of the image; per dish the center, radius and colony count.
     """
     if not os.path.isfile(source):
         raise TypeError("source needs to be a string of a filepath.")
 
-    img = cv.imread(source)
-    file_name = os.path.splitext(os.path.basename(source))[0]
-
-    metadata = {file_name: {}}
+    if (save_dishes or save_preprocessed or save_detected) and not save_path:
+        warnings.warn(f"No specified save path. Images saved in the current directory ({os.getcwd()}).")
 
-    dishes, masks, coordinates, dish_metadata = detect_dishes(
-        source=img,
-        save=save_dishes,
-        save_path=save_path,
-        file_name=file_name,
-        metadata=metadata
-    )
-    
-    preprocessed = []
-
-    for idx, dish in enumerate(dishes):
-        preprocessed.append(preprocess(
-            source=dish,
-            mask=masks[idx],
-            area_filter=False,
-            save=save_preprocessed,
-            save_path=save_path,
-            file_name=file_name,
-            idx=idx+1
-        ))
-
-    for idx, preprocessed_img in enumerate(preprocessed):
-        colony_metadata = detect_colonies(
-            source=preprocessed_img,
-            raw_img=dishes[idx],
-            save=save_detected,
-            save_path=save_path,
-            file_name=file_name,
-            idx=idx+1
-        )
+    file_name = os.path.splitext(os.path.basename(source))[0]
+    cache = StageCache(cache_dir, cache_size) if cache_dir else None
+
+    with frame_context(file_name):
+        frame = decode_stage(cache, source, read=load_frame)
+        coordinates = dishes_stage(cache, frame)
+        crops = crop_stage(cache, frame, coordinates)
+
+        dish_metadata = {file_name: {idx: [{
+            "center": [x, y],
+            "radius": r,
+            "colony_count": None
+        }] for idx, (x, y, r) in enumerate(coordinates.value(), start=1)}}
+
+        for idx in range(len(coordinates.value())):
+            preprocessed = preprocess_stage(cache, crops, idx, area_filter=False)
+            count, colonies = count_stage(cache, preprocessed, method=count_method, params=blob_params).value()
+            dish_metadata[file_name][idx+1][0]["colony_count"] = count
+
+            # images are saved from the results, which may be cached
+            if save_dishes:
+                save_image(os.path.join(save_path, "Dishes", f"{file_name}_dish_{idx+1}.png"), crops.value()[0][idx])
+            if save_preprocessed:
+                save_image(os.path.join(save_path, "Preprocessing", f"{file_name}_preprocessed_{idx+1}.png"), preprocessed.value())
+            if save_detected:
+                save_image(os.path.join(save_path, "Colonies", f"{file_name}_colonies_{idx+1}.png"), draw_colonies(crops.value()[0][idx], colonies))
 
     if save_metadata:
-        metadata_file = os.path.join(save_path, "metadata.yaml")
-        
-        if os.path.exists(metadata_file):
-            with open(metadata_file, "r") as f:
-                metadata = yaml.safe_load(f) or {}
-        else:
-            metadata = {}
+        results = open_results(save_path)
+        results.add(dish_metadata)
+        if export_metadata:
+            results.export_yaml(os.path.join(save_path, "metadata.yaml"))
 
-        metadata.update(dish_metadata)
+    flush_images()
 
-        with open(metadata_file, "w") as f:
-            yaml.safe_dump(metadata, f)
+    return dish_metadata
 
 def mult_pipeline(
         source,
-        n_dishes = 6,
-        kernel_size=500, 
         save_path = "",
         save_metadata=False,
         save_dishes=False,
         save_preprocessed=False,
-        save_detected=True
+        save_detected=True,
+        count_method = "blob",
+        blob_params: dict = None,
+        cache_dir: str = None,
+        cache_size = DEFAULT_CACHE_SIZE,
+        n_workers = None,
+        cv_threads = 1,
+        resume = False,
+        progress = None
                   ):
-    for file in os.listdir(source):
-        pipeline(
-            source=os.path.join(source, file),
-            n_dishes = n_dishes,
-            kernel_size = kernel_size, 
-            save_path = save_path,
-            save_metadata = save_metadata,
-            save_dishes = save_dishes,
-            save_preprocessed=save_preprocessed,
-            save_detected=save_detected
-        )
+    """
+    Runs the pipeline over all images in a directory, in parallel.
+    On Windows, the calling script needs an `if __name__ == "__main__":` guard.
+
+    Returns results in the order of the processed images.
+
+    Parameters
+    ----------
+    source: str
+        Directory with the images of the petri dishes.
+    save_path: str, optional
+        Filepath where the images should be saved.
+    save_metadata: bool, default=False
+        Whether to save metadata - dish crop positions and number of colonies - to results.sqlite in the save path.
+        Once all images are processed, the results are exported to metadata.yaml; earlier results in it are kept.
+    save_dishes: bool, default=False
+        Whether to save the dish crops.
+    save_preprocessed: bool, default=False
+        Whether to save the preprocessed images.
+    save_detected: bool, default=True
+        Whether to save the image with the detected colonies.
+    count_method: str, default="blob"
+        Counting backend of detect_colonies: "blob" or the faster "components".
+    blob_params: dict, optional
+        Parameters overriding BLOB_PARAMS of detect_colonies.
+    cache_dir: str, optional
+        Directory of the StageCache shared by the workers, see pipeline. If None, nothing is cached.
+    cache_size: int, default=4 GiB
+        Size in bytes the cache is kept within.
+    n_workers: int, optional
+        Number of worker processes. If None, the number of CPUs is used; 1 processes the images in the current process.
+    cv_threads: int, default=1
+        Number of threads OpenCV may use in each worker.
+    resume: bool, default=False
+        Whether to skip images with results in results.sqlite of the save path, i.e. of an interrupted run. Needs save_metadata.
+    progress: callable, optional
+        Called as progress(done, total) before the first and after every processed image, see run_parallel.
+
+    Returns
+    -------
+    list of tuples
+        (metadata, None) for each processed image, (None, exception) for images that failed. Skipped images have no results.
+    """
+    image_paths, _ = read_image_paths(source)
+
+    if resume and not save_metadata:
+        warnings.warn("Resuming needs save_metadata, all images are processed.")
+    elif resume:
+        done = open_results(save_path).file_names()
+        image_paths = [path for path in image_paths if os.path.splitext(os.path.basename(path))[0] not in done]
+
+    kwargs_list = [dict(
+        source=image_path,
+        save_path = save_path,
+        save_metadata = save_metadata,
+        save_dishes = save_dishes,
+        save_preprocessed=save_preprocessed,
+        save_detected=save_detected,
+        count_method=count_method,
+        blob_params=blob_params,
+        cache_dir=cache_dir,
+        cache_size=cache_size
+    ) for image_path in image_paths]
+
+    results = run_parallel(pipeline, kwargs_list, n_workers=n_workers, cv_threads=cv_threads, progress=progress)
+
+    for image_path, (_, error) in zip(image_paths, results):
+        if error is not None:
+            warnings.warn(f"Processing of {image_path} failed: {error!r}")
+
+    if save_metadata:
+        open_results(save_path).export_yaml(os.path.join(save_path, "metadata.yaml"))
+
+    return results
 
 def timelapse_pipeline(
         source,
@@ -123,75 +218,262 @@ def timelapse_pipeline(
         save_path = "",
         n_to_stack = 5,
         plot = False,
-        fine_buffer = 3
+        fine_buffer = 3,
+        n_workers = 1,
+        cv_threads = 1,
+        max_frames = 8,
+        decode_threads = 2,
+        checkpoint_dir: str = None,
+        resume = True,
+        track = False,
+        incremental = False,
+        tolerance = 0,
+        cube_dir: str = None,
+        threshold_method = "gaussian",
+        background_refresh = 1,
+        register = False,
+        max_shift = 3.0,
+        profile_frame: int = None,
+        count_method = "blob",
+        blob_params: dict = None,
+        cache_dir: str = None,
+        cache_size = DEFAULT_CACHE_SIZE,
+        progress = None
 ):
-    kernel = cv.getStructuringElement(cv.MORPH_ELLIPSE, (3, 3))
-
-    image_paths, file_names = read_image_paths(source)
-
-    fg_masks, bg_masks, coordinates = make_masks(
-        image_paths=image_paths,
-        save_path=save_path,
-        save=save_intermediates,
-        n_to_stack=n_to_stack
-    )
-
-    if plot:
-        fig, ax = init_plot()
-
-    n_dishes = len(coordinates)
+    """
+    Counts colonies over a timelapse.
 
-    dish_states = [DishState(fine_buffer) for _ in range(n_dishes)]
+    Parameters
+    ----------
+    source: str
+        Directory with the images of the timelapse. Frames are ordered by the timestamp in their name, EXIF capture time or modification time.
+        The index of the frames is cached in cache_dir, or else the save path; the directory itself isn't written to.
+    save_intermediates: bool, default=False
+        Whether to save masks, dishes, preprocessed images and images with detected colonies.
+    save_path: str, optional
+        Path to directory where the images are saved.
+    n_to_stack: int, default=5
+        Number of images at the start of the timelapse stacked into the background masks.
+    plot: bool, default=False
+        Whether to show a live plot of the colony counts.
+    fine_buffer: int, default=3
+        Number of triggers before a dish switches from fine (area filtered) to coarse preprocessing.
+    n_workers: int, default=1
+        Number of worker processes the dishes of each frame are processed on. Frames are shared with the workers through
+        shared memory. 1 processes the dishes in the current process. On Windows, the calling script needs an `if __name__ == "__main__":` guard.
+    cv_threads: int, default=1
+        Number of threads OpenCV may use in each worker.
+    max_frames: int, default=8
+        Maximum number of decoded frames held in memory; frames are decoded ahead of processing.
+    decode_threads: int, default=2
+        Number of threads decoding frames in the background.
+    checkpoint_dir: str, optional
+        Directory for checkpoints. Masks and dish coordinates are saved once, dish states after every frame.
+    resume: bool, default=True
+        Whether to resume from the checkpoint in checkpoint_dir, skipping make_masks and all processed frames.
+    track: bool, default=False
+        Whether to track colonies across frames. Each DishState then has a ColonyTracker with stable colony ids,
+        the time each colony was first seen and its size trajectory.
+    incremental: bool, default=False
+        Whether to reprocess only the tiles of each dish that changed since the previous frame, with IncrementalDish.
+        Used for dishes in the fine state, with n_workers=1 and count_method="components"; intermediates aren't saved for these dishes,
+        and they are thresholded with the exact gaussian mean of every frame, whatever threshold_method and background_refresh.
+    tolerance: int, default=0
+        Largest change of a pixel in a tile treated as unchanged by incremental processing. 0 gives the counts of full processing.
+    cube_dir: str, optional
+        Directory for memory-mapped cubes of the cropped dishes of every frame. Made on the first run, repeat runs over the same
+        images read the dishes from the cubes and skip decoding the frames.
+    threshold_method: str, default="gaussian"
+        Local mean of the adaptive threshold: "gaussian" (exact), "box" or "downsampled" (faster approximations); see thresholding.local_mean.
+    background_refresh: int, default=1
+        Number of frames the local mean of each dish is reused for, with a BackgroundCache. 1 computes it every frame.
+    register: bool, default=False
+        Whether to check every frame for drifted dishes with DishGeometry.register, and follow them. Not used with cubes.
+    max_shift: float, default=3.0
+        Drift in px up to which dishes are considered unmoved.
+    profile_frame: int, optional
+        Index of a frame processed under cProfile; the profile is saved to profile_<frame name>.prof in the save path.
+        Stage timings are collected by running the pipeline within an active profiling.Profiler.
+    count_method: str, default="blob"
+        Counting backend of detect_colonies: "blob" or the faster "components".
+    blob_params: dict, optional
+        Parameters overriding BLOB_PARAMS of detect_colonies.
+    cache_dir: str, optional
+        Directory of a StageCache of the masks and the preprocessed and counted dishes of every frame, see pipeline.
+        A rerun (i.e. with other blob parameters) only recomputes the stages downstream of the change, and frames are only decoded
+        if a stage of theirs has to be computed. Used with n_workers=1, without incremental processing, cubes, background_refresh or saved intermediates.
+    cache_size: int, default=4 GiB
+        Size in bytes the cache is kept within, by evicting the least recently used results.
+    progress: callable, optional
+        Called as progress(done, total) with the number of frames processed in this run, before the first and after every frame.
+
+    Returns
+    -------
+    list of DishState
+        State of each dish, with the history of (hours since the first frame, colony count).
+    """
+    catalog = FrameCatalog(source, cache_dir=cache_dir or save_path or None) # chronological; the index is cached outside of the frame directory
+    image_paths, file_names, hours = catalog.paths, catalog.names, catalog.hours()
+
+    checkpoint = Checkpoint(checkpoint_dir) if checkpoint_dir else None
+    saved = checkpoint.load() if checkpoint is not None and resume else None
+
+    # the checkpoint only applies if its last frame is still at the same position in the timelapse
+    if saved is not None and saved["last_frame"] >= 0 and file_names[saved["last_frame"]:saved["last_frame"]+1] != [saved["last_frame_name"]]:
+        warnings.warn(f"Checkpoint in {checkpoint_dir} doesn't match the frames in {source}, starting over.")
+        saved = None
+
+    start = saved["last_frame"] + 1 if saved is not None else 0
+
+    if incremental and count_method != "components":
+        warnings.warn("Incremental processing counts with count_method=\"components\", dishes are processed fully.")
+        incremental = False
+
+    cache = StageCache(cache_dir, cache_size) if cache_dir else None
+    if cache is not None and (n_workers > 1 or incremental or cube_dir or background_refresh > 1 or save_intermediates):
+        warnings.warn("The stage cache is only used with n_workers=1, without incremental processing, cubes, background_refresh or saved intermediates.")
+        cache = None
+
+    cubes = DishCubes.open(cube_dir, image_paths) if cube_dir else None
+
+    frames = FrameSource(image_paths[start:], max_frames=max_frames, n_threads=decode_threads)
+
+    if saved is not None:
+        fg_masks, bg_masks, coordinates, dish_states = saved["fg_masks"], saved["bg_masks"], saved["coordinates"], saved["dish_states"]
+    else:
+        masks = Stage( # masks depend on the first n_to_stack frames and the last frame
+            cache,
+            "masks",
+            make_masks,
+            params={"n_to_stack": n_to_stack},
+            kwargs=dict(image_paths=image_paths, save_path=save_path, save=save_intermediates, frames=frames, cubes=cubes),
+            version=partial(stage_version, "masks"),
+            content=[file_hash(path) for path in image_paths[:n_to_stack] + image_paths[-1:]] if cache is not None else None
+        )
+        fg_masks, bg_masks, coordinates = masks.value()
+        dish_states = [DishState(fine_buffer) for _ in range(len(coordinates))]
 
-    t0 = None
+        if checkpoint is not None:
+            checkpoint.save(coordinates, dish_states, fg_masks, bg_masks, last_frame=-1, last_frame_name=None)
 
-    for img_path, file_name in zip(image_paths, file_names):
+    if cube_dir and cubes is None: # decodes every frame once, the loop reads from the cubes; the frames of make_masks are pinned in frames
+        cubes = build_cubes(cube_dir, image_paths, coordinates, names=file_names, hours=hours, max_frames=max_frames, n_threads=decode_threads, frames=frames if start == 0 else None)
 
-        # handling time steps
+    if track:
+        for state in dish_states:
+            if state.tracker is None:
+                state.tracker = ColonyTracker()
 
-        t = read_time(img_path)
+    if incremental and n_workers > 1:
+        warnings.warn("Incremental processing only runs with n_workers=1, dishes are processed fully.")
+    elif incremental and (threshold_method != "gaussian" or background_refresh > 1):
+        warnings.warn("Incremental processing thresholds with the exact gaussian mean of every frame, threshold_method and background_refresh only apply to dishes processed fully.")
 
-        if t0 is None:
-            t0 = t
-        else:
-            pass
+    incremental_dishes = None # IncrementalDish per dish, made from the masks of the first frame
 
-        delta_t = (t - t0).total_seconds() / 3600.0
+    backgrounds = BackgroundCache(background_refresh, method=threshold_method) if background_refresh > 1 else None
 
-        # cropping and preprocessing
+    if register and cubes is not None:
+        warnings.warn("The dishes of cubes are cropped already, frames aren't registered.")
+        register = False
 
-        dishes, masks = crop(img_path, coordinates)
+    geometry = None # DishGeometry, made from the first frame
 
-        # going through each dish and applying preprocessing and masks, dependant on growth state
+    if plot:
+        fig, ax = init_plot()
 
-        for idx, (dish, mask) in enumerate(zip(dishes, masks)):
-            if save_intermediates:
-                os.makedirs(os.path.join(save_path, "Dishes"), exist_ok=True)
-                cv.imwrite(os.path.join(save_path, "Dishes", f"{file_name}_dish_{idx+1}.jpg"), dish)
+    n_dishes = len(coordinates)
 
-            preprocessed = preprocess(source=dish,
-                        mask=mask,
-                        fg_mask=fg_masks[idx],
-                        bg_mask=bg_masks[idx],
-                        area_filter=dish_states[idx].fine,
-                        file_name=file_name,
+    # with cubes, no frame is decoded; with the stage cache, frames are decoded when a stage needs them
+    frame_iter = frames if cubes is None and cache is None else ((path, None) for path in image_paths[start:])
+
+    if cache is not None:
+        fg_stages = [Stage.constant(cache, "fg_mask", mask) for mask in fg_masks]
+        bg_stages = [Stage.constant(cache, "bg_mask", mask) for mask in bg_masks]
+
+    if progress is not None:
+        progress(0, len(image_paths) - start)
+
+    with frames, (DishPool(n_workers, cv_threads, coordinates, fg_masks, bg_masks, cube_dir=cube_dir, backgrounds=backgrounds) if n_workers > 1 else nullcontext()) as pool:
+        for frame_idx, ((img_path, frame), file_name, delta_t) in enumerate(zip(frame_iter, file_names[start:], hours[start:]), start=start):
+
+            with frame_context(file_name), (cprofile(os.path.join(save_path, f"profile_{file_name}.prof")) if frame_idx == profile_frame else nullcontext()):
+                if cubes is None and (cache is None or register):
+                    frame = frame if frame is not None else frames.get(img_path)
+                    geometry = geometry or DishGeometry(coordinates, frame.shape, max_shift=max_shift)
+                    if register:
+                        with stage("registration"):
+                            moved = geometry.register(frame)
+                        for idx in moved:
+                            warnings.warn(f"Dish {idx+1} drifted in {file_name}, moved to {geometry.coordinates[idx][:2]}.")
+                        coordinates = geometry.coordinates
+
+                # cropping, preprocessing and counting each dish, dependant on growth state
+
+                if cache is not None:
+                    frame_stage = decode_stage(cache, img_path, read=frames.get)
+                    crops = crop_stage(cache, frame_stage, Stage.constant(cache, "coordinates", [[int(v) for v in c] for c in coordinates]))
+                    results = []
+                    for idx in range(n_dishes):
+                        fine = dish_states[idx].fine
+                        preprocessed = preprocess_stage(cache, crops, idx, fg_stages[idx], bg_stages[idx], erode=not fine, area_filter=fine, threshold_method=threshold_method)
+                        count, colonies = count_stage(cache, preprocessed, method=count_method, params=blob_params).value()
+                        results.append((count, colonies) if track else count)
+                elif pool is None:
+                    with stage("crop"):
+                        dishes, masks = geometry.crop(frame) if cubes is None else cubes.crop(frame_idx)
+
+                    if incremental and incremental_dishes is None:
+                        incremental_dishes = [IncrementalDish(mask, fg_masks[idx], bg_masks[idx], tolerance=tolerance, params=blob_params) for idx, mask in enumerate(masks)]
+
+                    results = [incremental_dishes[idx].process(dish, return_colonies=track) if incremental and dish_states[idx].fine else process_dish(
+                        dish,
+                        mask,
+                        fg_masks[idx],
+                        bg_masks[idx],
+                        fine=dish_states[idx].fine,
                         save=save_intermediates,
                         save_path=save_path,
-                        idx=idx+1
-                        )
-            if not dish_states[idx].fine:
-                preprocessed = cv.morphologyEx(preprocessed, cv.MORPH_ERODE, kernel)
-
-            count, _ = detect_colonies(source=preprocessed, raw_img=dish, save=save_intermediates, save_path=save_path, file_name=file_name, idx=idx+1)
-            dish_states[idx].history.append((delta_t, count))        
-
-        if plot:
-            dish_counts_plot = {i: [(timestamp, count) for timestamp, count in dish_states[i].history] for i in range(n_dishes)}
-            update_live_plot(dish_counts_plot, fig, ax)
-            
-        check_state(dish_states)
+                        file_name=file_name,
+                        idx=idx+1,
+                        return_colonies=track,
+                        threshold_method=threshold_method,
+                        background=backgrounds.get(idx, frame_idx, dish[:, :, 1]) if backgrounds is not None else None,
+                        count_method=count_method,
+                        params=blob_params
+                    ) for idx, (dish, mask) in enumerate(zip(dishes, masks))]
+                else:
+                    fine = [state.fine for state in dish_states]
+                    kwargs = dict(save=save_intermediates, save_path=save_path, file_name=file_name, return_colonies=track, threshold_method=threshold_method, count_method=count_method, params=blob_params)
+                    with stage("dish_pool"): # the stages in the workers aren't timed
+                        results = pool.count(frame, fine, t=frame_idx, coordinates=coordinates, **kwargs) if cubes is None else pool.count_cube(frame_idx, fine, **kwargs)
+
+                # states are updated in dish order once all dishes are counted
+                for idx, result in enumerate(results):
+                    count, colonies = result if track else (result, None)
+                    dish_states[idx].history.append((delta_t, count))
+                    if track:
+                        dish_states[idx].tracker.update(delta_t, colonies)
+
+                if plot:
+                    dish_counts_plot = {i: [(timestamp, count) for timestamp, count in dish_states[i].history] for i in range(n_dishes)}
+                    update_live_plot(dish_counts_plot, fig, ax)
+                
+                check_state(dish_states)
+
+                if checkpoint is not None:
+                    with stage("checkpoint"):
+                        checkpoint.save(coordinates, dish_states, last_frame=frame_idx, last_frame_name=file_name)
+
+            frames.unpin(img_path) # pinned by make_masks; released here too if the loop doesn't iterate frames, i.e. with the stage cache
+
+            if progress is not None:
+                progress(frame_idx + 1 - start, len(image_paths) - start)
+
+    flush_images()
+
     if plot:
         plt.ioff()
         plt.show()
     
-    return(None)
+    return dish_states
@@ -0,0 +1,241 @@
+import cv2 as cv
+import os
+import time
+from datetime import datetime
+
+from ..helpers.catalog import VALID_EXTENSIONS, frame_time
+from ..helpers.checkpoint import Checkpoint
+from ..helpers.frames import load_frame
+from ..helpers.outputs import flush_images
+from ..helpers.results import open_results
+from ..helpers.timelapse import process_dish, DishState, check_state
+from ..image_manipulation.dish_detection import detect_dishes, crop
+from ..image_manipulation.preprocessing import preprocess_bg_isolation, preprocess_fg_isolation
+
+class StreamProcessor:
+    """
+    Processes the frames of a running timelapse as the camera writes them into a directory.
+
+    The dishes are detected on the first frame. Background masks are stacked from the first n_to_stack frames as they arrive.
+    Foreground masks are provisional: none until refine_every frames are processed, then re-made from the latest frame every
+    refine_every frames, with the downsampled tophat so the per-frame latency stays constant.
+
+    Progress is saved in save_path after every frame (a Checkpoint and results.sqlite), so a restarted
+    processor continues where it stopped and every frame is recorded exactly once.
+
+    Parameters
+    ----------
+    source: str
+        Directory the camera writes the frames into (see helpers/camera.py). Hidden files (starting with ".") are ignored,
+        so frames can be written under a hidden name and renamed when complete.
+    save_path: str
+        Directory for the state, results and saved images.
+    n_to_stack: int, default=5
+        Number of frames at the start stacked into the background masks.
+    refine_every: int, default=12
+        Number of frames between foreground mask refinements.
+    fine_buffer: int, default=3
+        Number of triggers before a dish switches from fine (area filtered) to coarse preprocessing.
+    settle: float, default=2
+        Seconds a frame must be unmodified before it is read, so that frames still being written are skipped.
+    save_intermediates: bool, default=False
+        Whether to save dishes, preprocessed images and images with detected colonies.
+    """
+    def __init__(
+            self,
+            source,
+            save_path,
+            n_to_stack = 5,
+            refine_every = 12,
+            fine_buffer = 3,
+            settle = 2.0,
+            save_intermediates = False
+    ):
+        self.source = source
+        self.save_path = save_path
+        self.n_to_stack = n_to_stack
+        self.refine_every = refine_every
+        self.fine_buffer = fine_buffer
+        self.settle = settle
+        self.save_intermediates = save_intermediates
+
+        os.makedirs(save_path, exist_ok=True)
+        self.checkpoint = Checkpoint(save_path)
+        self.results = open_results(save_path)
+
+        self.processed = [] # names of processed frames, in processing order
+        self.coordinates = None
+        self.t0 = None
+        self.n_stacked = 0
+        self.dish_states = []
+        self.fg_masks, self.bg_masks = None, None
+
+        self._load()
+
+    def _load(self):
+        checkpoint = self.checkpoint.load()
+        if checkpoint is None:
+            return
+
+        self.processed = checkpoint["processed"]
+        self.coordinates = checkpoint["coordinates"]
+        self.t0 = datetime.fromisoformat(checkpoint["t0"])
+        self.n_stacked = checkpoint["n_stacked"]
+        self.dish_states = checkpoint["dish_states"]
+        self.fg_masks, self.bg_masks = checkpoint["fg_masks"], checkpoint["bg_masks"]
+
+    def _save(self, masks_changed):
+        self.checkpoint.save( # the frame counts as processed once this succeeds
+            self.coordinates,
+            self.dish_states,
+            fg_masks=self.fg_masks if masks_changed else None, # masks change only during stacking and at refinements
+            bg_masks=self.bg_masks if masks_changed else None,
+            processed=self.processed,
+            t0=self.t0.isoformat(),
+            n_stacked=self.n_stacked
+        )
+
+    def pending(self):
+        """
+        Returns paths of complete, unprocessed frames in chronological order.
+        """
+        done = set(self.processed)
+        now = time.time()
+        frames = []
+
+        for name in os.listdir(self.source):
+            base, ext = os.path.splitext(name)
+            path = os.path.join(self.source, name)
+            if name.startswith(".") or ext.lower() not in VALID_EXTENSIONS or base in done:
+                continue
+            try:
+                if now - os.path.getmtime(path) < self.settle: # possibly still being written
+                    continue
+            except OSError: # removed in the meantime
+                continue
+            frames.append((frame_time(path)[0], base, path))
+
+        return [path for _, _, path in sorted(frames)]
+
+    def process(self, path):
+        """
+        Processes a single frame and saves the progress.
+
+        Returns number of colonies per dish.
+        """
+        frame = load_frame(path)
+        file_name = os.path.splitext(os.path.basename(path))[0]
+        t, _ = frame_time(path)
+        masks_changed = False
+
+        if self.coordinates is None: # first frame
+            _, _, coordinates, _ = detect_dishes(frame, save=False, file_name=file_name)
+            if not coordinates:
+                raise ValueError(f"No dishes detected in the first frame {path}.")
+            self.coordinates = [tuple(int(v) for v in c) for c in coordinates]
+            self.t0 = t
+            self.dish_states = [DishState(self.fine_buffer) for _ in self.coordinates]
+
+        dishes, masks = crop(frame, self.coordinates)
+
+        if self.n_stacked < self.n_to_stack: # provisional background masks, grown with each of the first frames
+            isolated = [preprocess_bg_isolation(source=dish, mask=mask, file_name=file_name) for dish, mask in zip(dishes, masks)]
+            self.bg_masks = isolated if self.bg_masks is None else [cv.bitwise_or(bg, new) for bg, new in zip(self.bg_masks, isolated)]
+            self.n_stacked += 1
+            masks_changed = True
+
+        if self.refine_every and (len(self.processed) + 1) % self.refine_every == 0: # foreground masks from the latest frame
+            self.fg_masks = [preprocess_fg_isolation(source=dish, mask=mask, file_name=file_name, method="pyramid") for dish, mask in zip(dishes, masks)]
+            masks_changed = True
+
+        counts = [process_dish(
+            dish,
+            mask,
+            self.fg_masks[idx] if self.fg_masks is not None else None,
+            self.bg_masks[idx],
+            fine=self.dish_states[idx].fine,
+            save=self.save_intermediates,
+            save_path=self.save_path,
+            file_name=file_name,
+            idx=idx+1
+        ) for idx, (dish, mask) in enumerate(zip(dishes, masks))]
+
+        delta_t = (t - self.t0).total_seconds() / 3600.0
+        for state, count in zip(self.dish_states, counts):
+            state.history.append((delta_t, count))
+        check_state(self.dish_states)
+
+        self.results.add({file_name: {idx+1: [{"center": [x, y], "radius": r, "colony_count": count}]
+                                      for idx, ((x, y, r), count) in enumerate(zip(self.coordinates, counts))}})
+        self.processed.append(file_name)
+        self._save(masks_changed)
+
+        return counts
+
+    def run(self, poll_interval = 5.0, timeout: float = None, max_frames: int = None, callback = None):
+        """
+        Watches the directory and processes new frames until stopped.
+
+        Parameters
+        ----------
+        poll_interval: float, default=5
+            Seconds between checks for new frames.
+        timeout: float, optional
+            Seconds without a new frame after which watching stops. If None, watches until interrupted.
+        max_frames: int, optional
+            Number of frames after which watching stops.
+        callback: callable, optional
+            Called with the frame name and the counts of each processed frame, e.g. to update a live plot.
+
+        Returns
+        -------
+        list of DishState
+            State of each dish, with the history of (hours since the first frame, colony count).
+        """
+        n_frames = 0
+        last_frame = time.monotonic()
+
+        try:
+            while True:
+                for path in self.pending():
+                    counts = self.process(path)
+                    n_frames += 1
+                    last_frame = time.monotonic()
+                    if callback is not None:
+                        callback(self.processed[-1], counts)
+                    if max_frames is not None and n_frames >= max_frames:
+                        return self.dish_states
+
+                if timeout is not None and time.monotonic() - last_frame > timeout:
+                    return self.dish_states
+                time.sleep(poll_interval)
+        finally:
+            flush_images()
+
+def stream_pipeline(source, save_path, poll_interval = 5.0, timeout: float = None, max_frames: int = None, **kwargs):
+    """
+    Counts colonies of a running timelapse, processing each frame as the camera writes it.
+    Restarting with the same save_path resumes after the last processed frame.
+
+    Parameters
+    ----------
+    source: str
+        Directory the camera writes the frames into.
+    save_path: str
+        Directory for the state, results and saved images.
+    poll_interval: float, default=5
+        Seconds between checks for new frames.
+    timeout: float, optional
+        Seconds without a new frame after which watching stops. If None, watches until interrupted.
+    max_frames: int, optional
+        Number of frames after which watching stops.
+    **kwargs
+        Parameters of StreamProcessor.
+
+    Returns
+    -------
+    list of DishState
+        State of each dish, with the history of (hours since the first frame, colony count).
+    """
+    processor = StreamProcessor(source, save_path, **kwargs)
+    return processor.run(poll_interval=poll_interval, timeout=timeout, max_frames=max_frames)
@@ -0,0 +1,80 @@
+import os
+import time
+from datetime import datetime, timedelta
+
+import cv2 as cv
+import pytest
+
+import phase.helpers.frames as frames_module
+import phase.main.main as main
+from phase.helpers.synthetic import synthetic_plate
+from phase.helpers.timelapse import make_masks
+
+class FakeCamera:
+    """
+    Writes synthetic frames into a directory like helpers/camera.py: under a hidden name first, then renamed.
+    """
+    def __init__(self, directory, start = datetime(2025, 10, 30, 23, 40), interval = timedelta(minutes=10)):
+        self.directory = directory
+        self.t = start
+        self.interval = interval
+        self.seed = 0
+
+    def capture(self):
+        name = self.t.strftime("%d.%m.%Y-%H.%M.%S")
+        hidden = os.path.join(self.directory, f".{name}.jpg")
+        cv.imwrite(hidden, synthetic_plate(self.seed))
+        os.replace(hidden, os.path.join(self.directory, f"{name}.jpg"))
+        self.t += self.interval
+        self.seed += 1
+        return name
+
+    def run(self, n_frames, delay = 0.0):
+        for _ in range(n_frames):
+            self.capture()
+            time.sleep(delay)
+
+@pytest.fixture
+def fake_camera():
+    """
+    The FakeCamera class.
+    """
+    return FakeCamera
+
+@pytest.fixture
+def timelapse_dir(tmp_path, request):
+    """
+    Directory of a timelapse of synthetic plates 10 minutes apart, from 30.10.2025 12:00. 3 frames, or request.param frames
+    with indirect parametrization.
+    """
+    source = os.path.join(tmp_path, "timelapse")
+    os.makedirs(source)
+    FakeCamera(source, start=datetime(2025, 10, 30, 12), interval=timedelta(minutes=10)).run(getattr(request, "param", 3))
+    return source
+
+@pytest.fixture
+def fast_masks(monkeypatch):
+    """
+    Makes the masks of timelapse_pipeline with the pyramid tophat; the exact tophat takes most of the runtime.
+    Returns the keyword arguments of every call.
+    """
+    calls = []
+    def masks(**kwargs):
+        calls.append(kwargs)
+        return make_masks(fg_method="pyramid", **kwargs)
+    monkeypatch.setattr(main, "make_masks", masks)
+    return calls
+
+@pytest.fixture
+def decoded(monkeypatch):
+    """
+    Paths of the frames decoded by FrameSource and the pipelines, in decoding order.
+    """
+    calls = []
+    load_frame = frames_module.load_frame
+    def counting_load_frame(path):
+        calls.append(path)
+        return load_frame(path)
+    monkeypatch.setattr(frames_module, "load_frame", counting_load_frame)
+    monkeypatch.setattr(main, "load_frame", counting_load_frame)
+    return calls
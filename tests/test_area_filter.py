@@ -0,0 +1,32 @@
+import cv2 as cv
+import numpy as np
+import pytest
+
+from phase.image_manipulation.preprocessing import filter_area
+
+def filter_area_loop(binary, min_area, max_area, invert):
+    # previous implementation: one full image comparison per component
+    num_labels, labels, stats, _ = cv.connectedComponentsWithStats(binary, connectivity=8)
+    filtered = np.zeros_like(binary)
+    for i in range(1, num_labels):
+        area = stats[i, cv.CC_STAT_AREA]
+        if (min_area <= area <= max_area) != invert:
+            filtered[labels == i] = 255
+    return filtered
+
+@pytest.mark.parametrize("invert", [False, True])
+def test_filter_area_matches_loop(invert):
+    rng = np.random.default_rng(0)
+    binary = (rng.random((400, 400)) > 0.6).astype(np.uint8) * 255
+    binary = cv.morphologyEx(binary, cv.MORPH_OPEN, np.ones((2, 2), np.uint8)) # components of varied sizes
+
+    filtered = filter_area(binary, min_area=5, max_area=200, invert=invert)
+
+    assert filtered.dtype == np.uint8
+    assert np.array_equal(filtered, filter_area_loop(binary, 5, 200, invert))
+
+def test_filter_area_empty():
+    binary = np.zeros((50, 50), np.uint8)
+
+    assert not filter_area(binary).any()
+    assert not filter_area(binary, invert=True).any()
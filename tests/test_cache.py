@@ -0,0 +1,157 @@
+import os
+import subprocess
+import sys
+import time
+
+import cv2 as cv
+import numpy as np
+import pytest
+
+import phase.helpers.cache as cache_module
+import phase.helpers.stages as stages_module
+import phase.main.main as main
+from phase.colony_detection import counting
+from phase.colony_detection.counting import detect_colonies
+from phase.helpers.cache import StageCache, Stage, code_version
+from phase.helpers.synthetic import SyntheticTimelapse, synthetic_plate
+from phase.image_manipulation import dish_detection
+from phase.image_manipulation.dish_detection import detect_dishes
+from phase.image_manipulation.preprocessing import preprocess
+
+BLOB_PARAMS = {"minArea": 60}
+
+def test_cache_round_trip(tmp_path):
+    cache = StageCache(str(tmp_path))
+    value = ([np.arange(6, dtype=np.uint8).reshape(2, 3), np.zeros((0, 3))], (3, 4.5, None), {"name": "dish", "count": np.int64(7)})
+    cache.put("ab" * 32, value)
+
+    loaded = cache.get("ab" * 32)
+    assert np.array_equal(loaded[0][0], value[0][0]) and loaded[0][1].shape == (0, 3)
+    assert loaded[1] == (3, 4.5, None) and loaded[2] == {"name": "dish", "count": 7}
+    assert cache.get("cd" * 32) is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    noise = np.random.default_rng(0).integers(0, 256, 10000, dtype=np.uint8) # incompressible
+    cache = StageCache(str(tmp_path), max_bytes=35000)
+    for key in ("a", "b", "c"):
+        cache.put(key * 64, noise)
+        time.sleep(0.01)
+    cache.get("a" * 64) # used, so "b" is the least recently used
+    time.sleep(0.01)
+    cache.put("d" * 64, noise)
+
+    assert "b" * 64 not in cache
+    assert all(key * 64 in cache for key in "acd")
+    assert cache.size <= 35000 and len(cache) == 3
+
+def test_cache_size_counts_rewritten_keys_once(tmp_path):
+    noise = np.random.default_rng(0).integers(0, 256, 10000, dtype=np.uint8)
+    cache = StageCache(str(tmp_path), max_bytes=100000)
+    for _ in range(3):
+        cache.put("a" * 64, noise)
+
+    assert len(cache) == 1 and cache.size == StageCache(str(tmp_path)).size
+
+def test_stages_are_lazy(tmp_path):
+    cache = StageCache(str(tmp_path))
+    calls = []
+
+    def build(offset):
+        source = Stage(cache, "source", lambda: calls.append("source") or np.arange(5), content="data", persist=False)
+        doubled = Stage(cache, "double", lambda x: calls.append("double") or 2 * x, [source])
+        return Stage(cache, "offset", lambda x, offset: calls.append("offset") or x + offset, [doubled], params={"offset": offset})
+
+    assert np.array_equal(build(1).value(), 2 * np.arange(5) + 1)
+    assert calls == ["source", "double", "offset"]
+
+    calls.clear()
+    assert np.array_equal(build(1).value(), 2 * np.arange(5) + 1)
+    assert calls == [] # cached
+
+    calls.clear()
+    build(2).value()
+    assert calls == ["offset"] # the inputs are cached, the source isn't read
+
+def test_pipeline_reruns_only_invalidated_stages(tmp_path, decoded):
+    path = os.path.join(tmp_path, "plate.png")
+    cv.imwrite(path, synthetic_plate(0))
+    cache_dir = os.path.join(tmp_path, "cache")
+
+    img = cv.imread(path)
+    dishes, masks, _, _ = detect_dishes(img, save=False)
+    expected = [detect_colonies(preprocess(dish, mask=mask, area_filter=False), save=False, params=BLOB_PARAMS)[0] for dish, mask in zip(dishes, masks)]
+
+    first = main.pipeline(path, save_detected=False, cache_dir=cache_dir)
+    assert len(decoded) == 1
+
+    rerun = main.pipeline(path, save_detected=False, blob_params=BLOB_PARAMS, cache_dir=cache_dir)
+    counts = [dish[0]["colony_count"] for dish in rerun["plate"].values()]
+    assert counts == expected and counts != [dish[0]["colony_count"] for dish in first["plate"].values()]
+    assert len(decoded) == 1 # only the counts were recomputed
+
+    main.pipeline(path, save_path=str(tmp_path), save_detected=True, blob_params=BLOB_PARAMS, cache_dir=cache_dir)
+    assert len(os.listdir(os.path.join(tmp_path, "Colonies"))) == len(dishes) # saved images need the dishes
+
+def test_timelapse_reruns_from_cache(tmp_path, fast_masks, decoded):
+    source, cache_dir = os.path.join(tmp_path, "frames"), os.path.join(tmp_path, "cache")
+    SyntheticTimelapse(0, n_frames=3, n_colonies=60).write(source)
+
+    expected = main.timelapse_pipeline(source, n_to_stack=2, blob_params=BLOB_PARAMS)
+    main.timelapse_pipeline(source, n_to_stack=2, cache_dir=cache_dir)
+    fast_masks.clear()
+    decoded.clear()
+
+    cached = main.timelapse_pipeline(source, n_to_stack=2, blob_params=BLOB_PARAMS, cache_dir=cache_dir)
+    assert [state.history for state in cached] == [state.history for state in expected]
+    assert fast_masks == [] and decoded == [] # masks and preprocessed dishes were cached
+
+def test_timelapse_cache_needs_serial_processing(tmp_path, fast_masks):
+    source = os.path.join(tmp_path, "frames")
+    SyntheticTimelapse(0, n_frames=2, n_colonies=20).write(source)
+
+    with pytest.warns(UserWarning, match="stage cache"):
+        main.timelapse_pipeline(source, n_to_stack=2, incremental=True, count_method="components", cache_dir=os.path.join(tmp_path, "cache"))
+
+def test_code_versions_are_computed_with_a_cache_only(tmp_path, monkeypatch):
+    # nothing is read on import
+    code = "import inspect; calls = []; getsource = inspect.getsource; inspect.getsource = lambda obj: calls.append(obj) or getsource(obj); import phase; assert not calls"
+    subprocess.run([sys.executable, "-c", code], check=True, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    path = os.path.join(tmp_path, "plate.png")
+    cv.imwrite(path, synthetic_plate(0))
+    calls = []
+    monkeypatch.setattr(stages_module, "code_version", lambda *modules: calls.append(modules) or "version")
+    stages_module.stage_version.cache_clear()
+    try:
+        main.pipeline(path, save_detected=False)
+        assert calls == []
+        main.pipeline(path, save_detected=False, cache_dir=os.path.join(tmp_path, "cache"))
+        assert len(calls) == 4 # dishes, crop, preprocess and count, once each
+    finally:
+        stages_module.stage_version.cache_clear()
+
+def test_crop_code_invalidates_downstream_stages(tmp_path, monkeypatch):
+    cache = StageCache(str(tmp_path))
+    frame = Stage.constant(cache, "frame", synthetic_plate(0))
+    coordinates = Stage.constant(cache, "coordinates", [[500, 500, 400]])
+    def count_key():
+        stages_module.stage_version.cache_clear()
+        crops = stages_module.crop_stage(cache, frame, coordinates)
+        return stages_module.count_stage(cache, stages_module.preprocess_stage(cache, crops, 0)).key
+
+    key = count_key()
+    version = stages_module.code_version
+    monkeypatch.setattr(stages_module, "code_version", lambda *modules: version(*modules) + ("-changed" if dish_detection in modules else ""))
+    try:
+        assert count_key() != key # i.e. a change of crop or crop_masks
+    finally:
+        stages_module.stage_version.cache_clear()
+
+def test_code_version_without_sources(monkeypatch):
+    assert len(code_version(counting)) == 16
+
+    def no_source(obj):
+        raise OSError("could not get source code")
+    monkeypatch.setattr(cache_module.inspect, "getsource", no_source)
+    assert code_version(counting).startswith("package-")
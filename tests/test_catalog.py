@@ -0,0 +1,74 @@
+import os
+import time
+from datetime import datetime
+
+import cv2 as cv
+import numpy as np
+import pytest
+
+import phase.helpers.catalog as catalog_module
+from phase.helpers.catalog import FrameCatalog
+from phase.helpers.inputs import read_image_paths
+
+NAMES = ["30.09.2025-23.50.00", "01.10.2025-00.00.00", "01.10.2025-00.10.00", "02.10.2025-12.00.00"]
+
+@pytest.fixture
+def directory(tmp_path):
+    img = np.zeros((4, 4, 3), np.uint8)
+    for name in NAMES:
+        cv.imwrite(os.path.join(tmp_path, f"{name}.jpg"), img)
+    with open(os.path.join(tmp_path, "notes.txt"), "w") as f:
+        f.write("not a frame")
+    return str(tmp_path)
+
+def test_chronological_order_across_months(directory):
+    catalog = FrameCatalog(directory)
+
+    assert catalog.names == NAMES
+    assert catalog[0] == os.path.join(directory, f"{NAMES[0]}.jpg")
+    assert catalog.hours()[:2] == [0.0, 1/6]
+    assert read_image_paths(directory)[1] == NAMES
+
+def test_mtime_fallback(directory):
+    path = os.path.join(directory, "unnamed.png")
+    cv.imwrite(path, np.zeros((4, 4, 3), np.uint8))
+    os.utime(path, (datetime(2025, 10, 1, 6).timestamp(),) * 2)
+
+    catalog = FrameCatalog(directory)
+
+    assert catalog.names[3] == "unnamed"
+    assert catalog.frames[3].source == "mtime"
+
+@pytest.mark.parametrize("in_directory", [False, True])
+def test_index_is_cached_until_directory_changes(directory, tmp_path_factory, monkeypatch, in_directory):
+    cache_dir = None if in_directory else str(tmp_path_factory.mktemp("cache"))
+    FrameCatalog(directory, cache_dir=cache_dir, in_directory=in_directory)
+
+    calls = []
+    frame_time = catalog_module.frame_time
+    monkeypatch.setattr(catalog_module, "frame_time", lambda path: calls.append(path) or frame_time(path))
+
+    assert FrameCatalog(directory, cache_dir=cache_dir, in_directory=in_directory).names == NAMES
+    assert calls == []
+
+    time.sleep(0.05) # coarse file system timestamps
+    cv.imwrite(os.path.join(directory, "03.10.2025-00.00.00.jpg"), np.zeros((4, 4, 3), np.uint8))
+    assert FrameCatalog(directory, cache_dir=cache_dir, in_directory=in_directory).names[-1] == "03.10.2025-00.00.00"
+    assert len(calls) == len(NAMES) + 1
+
+def test_frame_directory_is_not_written_to(directory, tmp_path_factory):
+    cache_dir = str(tmp_path_factory.mktemp("cache"))
+    files, mtime_ns = sorted(os.listdir(directory)), os.stat(directory).st_mtime_ns
+
+    FrameCatalog(directory, cache_dir=cache_dir)
+    FrameCatalog(directory)
+
+    assert sorted(os.listdir(directory)) == files and os.stat(directory).st_mtime_ns == mtime_ns
+    assert len(os.listdir(cache_dir)) == 1
+
+def test_range_queries(directory):
+    catalog = FrameCatalog(directory)
+
+    assert [frame.name for frame in catalog.between(datetime(2025, 10, 1), datetime(2025, 10, 1, 0, 10))] == NAMES[1:3]
+    assert [frame.name for frame in catalog.between(t1=datetime(2025, 10, 2))] == NAMES[3:]
+    assert [frame.name for frame in catalog.every(2)] == NAMES[::2]
@@ -0,0 +1,84 @@
+import os
+
+import numpy as np
+import pytest
+
+import phase.main.main as main
+from phase.colony_detection.tracking import ColonyTracker
+from phase.helpers.checkpoint import Checkpoint
+from phase.helpers.timelapse import DishState, check_state
+
+def test_checkpoint_round_trip(tmp_path):
+    checkpoint = Checkpoint(os.path.join(tmp_path, "checkpoint"))
+    assert checkpoint.load() is None
+
+    states = [DishState(3), DishState(2)]
+    states[1].trigger()
+    states[0].history = [(0.0, 12), (0.5, 14)]
+    fg = [np.full((10, 10), i, np.uint8) for i in range(2)]
+    bg = [np.eye(10, dtype=np.uint8) * (i + 1) for i in range(2)]
+
+    checkpoint.save([(1, 2, 3), (4, 5, 6)], states, fg, bg, last_frame=-1)
+    checkpoint.save([(1, 2, 3), (4, 5, 6)], states, last_frame=4, last_frame_name="b") # manifest only, masks are kept
+
+    saved = checkpoint.load()
+    assert saved["coordinates"] == [(1, 2, 3), (4, 5, 6)]
+    assert saved["last_frame"] == 4 and saved["last_frame_name"] == "b"
+    assert [s.history for s in saved["dish_states"]] == [s.history for s in states]
+    assert [s.fine_buffer for s in saved["dish_states"]] == [3, 1]
+    assert all(np.array_equal(a, b) for a, b in zip(saved["fg_masks"] + saved["bg_masks"], fg + bg))
+
+def test_checkpoint_appends_trajectories(tmp_path):
+    checkpoint = Checkpoint(os.path.join(tmp_path, "checkpoint"))
+    state = DishState()
+    state.tracker = ColonyTracker(max_dist=3, max_missed=1)
+    centers = np.random.default_rng(0).uniform(0, 1000, (300, 2))
+
+    sizes = []
+    for frame in range(30):
+        visible = centers[frame * 10 : frame * 10 + 100] # 100 colonies a frame, earlier ones are no longer matched
+        state.tracker.update(float(frame), np.column_stack([visible, np.full(len(visible), 4.0)]))
+        state.history.append((float(frame), len(visible)))
+        checkpoint.save([(0, 0, 1)], [state], last_frame=frame)
+        sizes.append(os.path.getsize(checkpoint.manifest_path))
+
+    points = state.tracker.points()
+    assert os.path.getsize(os.path.join(tmp_path, "checkpoint", "checkpoint_tracks_0.bin")) == points.nbytes # every point written once
+    assert sizes[-1] - sizes[10] < 19 * 64 # the manifest grows by the history only, not by 100 points a frame
+
+    with open(os.path.join(tmp_path, "checkpoint", "checkpoint_tracks_0.bin"), "ab") as f: # points of a frame whose manifest was never written
+        f.write(np.ones(50, np.float64).tobytes())
+
+    resumed = Checkpoint(os.path.join(tmp_path, "checkpoint"))
+    resumed_state = resumed.load()["dish_states"][0]
+    assert np.array_equal(resumed_state.tracker.points(), points)
+    assert resumed_state.tracker.state() == state.tracker.state()
+
+    rows = np.column_stack([centers[200:300], np.full(100, 4.0)])
+    assert resumed_state.tracker.update(30.0, rows) == state.tracker.update(30.0, rows)
+    resumed.save([(0, 0, 1)], [resumed_state], last_frame=30) # appended after the saved points
+    assert np.array_equal(Checkpoint(os.path.join(tmp_path, "checkpoint")).load()["dish_states"][0].tracker.points(), state.tracker.points())
+
+@pytest.mark.parametrize("timelapse_dir", [4], indirect=True)
+def test_timelapse_resumes_after_crash(tmp_path, timelapse_dir, fast_masks, monkeypatch):
+    source = timelapse_dir
+    reference = main.timelapse_pipeline(source, n_to_stack=2, track=True)
+
+    def crash_on_third_frame(states):
+        if len(states[0].history) == 3:
+            raise RuntimeError("power cut")
+        check_state(states)
+    monkeypatch.setattr(main, "check_state", crash_on_third_frame)
+
+    checkpoint_dir = os.path.join(tmp_path, "checkpoint")
+    with pytest.raises(RuntimeError):
+        main.timelapse_pipeline(source, n_to_stack=2, checkpoint_dir=checkpoint_dir, track=True)
+    assert Checkpoint(checkpoint_dir).load()["last_frame"] == 1
+
+    monkeypatch.setattr(main, "check_state", check_state)
+    resumed = main.timelapse_pipeline(source, n_to_stack=2, checkpoint_dir=checkpoint_dir, track=True)
+
+    assert len(fast_masks) == 2 # masks aren't made again on resume
+    assert [s.history for s in resumed] == [s.history for s in reference]
+    assert [s.fine for s in resumed] == [s.fine for s in reference]
+    assert [s.tracker.appearance_times() for s in resumed] == [s.tracker.appearance_times() for s in reference]
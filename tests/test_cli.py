@@ -0,0 +1,78 @@
+import csv
+import json
+import os
+
+import cv2 as cv
+import pytest
+
+from phase.cli import Progress, load_config, main as cli
+from phase.helpers.results import open_results
+from phase.helpers.synthetic import SyntheticTimelapse, synthetic_plate
+
+def write_config(tmp_path, text):
+    path = os.path.join(tmp_path, "params.yaml")
+    with open(path, "w") as f:
+        f.write(text)
+    return path
+
+def test_config_sections_override_shared_parameters(tmp_path):
+    path = write_config(tmp_path, "blob_params: {minArea: 60}\nn_to_stack: 3\ntimelapse:\n  n_to_stack: 2\nbatch:\n  save_dishes: true\n")
+
+    assert load_config(path, "timelapse") == {"blob_params": {"minArea": 60}, "n_to_stack": 2}
+    assert load_config(path, "batch") == {"blob_params": {"minArea": 60}, "save_dishes": True} # n_to_stack is a timelapse parameter
+
+    with pytest.raises(ValueError, match="n_to_stak"):
+        load_config(write_config(tmp_path, "n_to_stak: 2\n"), "timelapse")
+    with pytest.raises(ValueError, match="n_to_stack"):
+        load_config(write_config(tmp_path, "batch:\n  n_to_stack: 2\n"), "batch")
+
+def test_invalid_config_exits(tmp_path):
+    with pytest.raises(SystemExit) as e:
+        cli(["batch", str(tmp_path), "-c", write_config(tmp_path, "- 1\n")])
+    assert e.value.code == 2
+
+def test_progress_reports_fps_and_eta(capsys):
+    assert Progress.format(10, 40, 2.0) == "10/40 frames (25%) | 2.00 fps | ETA 0:00:15"
+    assert Progress.format(0, 40, 0.0).endswith("ETA --")
+
+    progress = Progress(interval=3600)
+    for done in range(4):
+        progress(done, 3)
+    lines = capsys.readouterr().err.splitlines()
+    assert [line.split(" ")[0] for line in lines] == ["0/3", "3/3"] # not a terminal: first, then every interval and the last
+
+def test_batch_resumes(tmp_path, capsys):
+    source, save_path = os.path.join(tmp_path, "images"), os.path.join(tmp_path, "results")
+    os.makedirs(source)
+    for seed in range(2):
+        cv.imwrite(os.path.join(source, f"plate_{seed}.png"), synthetic_plate(seed))
+
+    assert cli(["batch", source, "-o", save_path, "-j", "1", "--profile", os.path.join(tmp_path, "profile.json")]) == 0
+    assert open_results(save_path).file_names() == {"plate_0", "plate_1"}
+    with open(os.path.join(tmp_path, "profile.json")) as f:
+        assert "detection" in {row["stage"] for row in json.load(f)["stages"]}
+
+    cv.imwrite(os.path.join(source, "plate_2.png"), synthetic_plate(2))
+    capsys.readouterr()
+    assert cli(["batch", source, "-o", save_path, "-j", "1", "--resume"]) == 0
+    assert capsys.readouterr().err.splitlines()[-1].startswith("1/1 frames") # only the new image
+    assert open_results(save_path).file_names() == {"plate_0", "plate_1", "plate_2"}
+
+def test_timelapse_writes_counts(tmp_path, fast_masks, capsys):
+    source, save_path = os.path.join(tmp_path, "frames"), os.path.join(tmp_path, "results")
+    timelapse = SyntheticTimelapse(0, n_frames=3, n_colonies=20)
+    timelapse.write(source)
+
+    config = write_config(tmp_path, "timelapse:\n  n_to_stack: 2\n")
+    assert cli(["timelapse", source, "-o", save_path, "-c", config]) == 0
+
+    with open(os.path.join(save_path, "counts.csv"), newline="") as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == ["hours"] + [f"dish_{idx}" for idx in range(1, len(timelapse.coordinates) + 1)]
+    assert len(rows) == 4 and float(rows[1][0]) == 0
+
+    capsys.readouterr()
+    assert cli(["timelapse", source, "-o", save_path, "-c", config, "--resume"]) == 0
+    assert "0/0 frames" in capsys.readouterr().err # every frame was checkpointed
+    with open(os.path.join(save_path, "counts.csv"), newline="") as f:
+        assert list(csv.reader(f)) == rows
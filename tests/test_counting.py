@@ -0,0 +1,49 @@
+import cv2 as cv
+import numpy as np
+import pytest
+
+from phase.colony_detection.counting import count_blobs, count_components, detect_colonies
+from phase.helpers.synthetic import synthetic_dish
+from phase.image_manipulation.preprocessing import preprocess
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_components_match_blob_detector(seed):
+    dish, mask = synthetic_dish(seed)
+    preprocessed = preprocess(dish, mask=mask)
+
+    blobs = count_blobs(preprocessed)
+    components = count_components(preprocessed)
+
+    assert abs(len(components) - len(blobs)) <= max(1, 0.02 * len(blobs))
+
+    blob_points = np.array([k.pt for k in blobs])
+    component_points = np.array([k.pt for k in components])
+    distances = np.linalg.norm(blob_points[:, None] - component_points[None], axis=2)
+    nearest = distances.argmin(axis=1)
+
+    matched = distances[np.arange(len(blobs)), nearest] < 1
+    assert matched.mean() > 0.95
+
+    blob_sizes = np.array([k.size for k in blobs])[matched]
+    component_sizes = np.array([components[i].size for i in nearest[matched]])
+    assert np.median(np.abs(blob_sizes - component_sizes)) < 1
+
+def test_components_merge_close_colonies():
+    img = np.zeros((100, 100), np.uint8)
+    cv.circle(img, (40, 50), 3, 255, -1)
+    cv.circle(img, (48, 50), 3, 255, -1) # separate component, closer than minDistBetweenBlobs
+    cv.circle(img, (80, 50), 3, 255, -1)
+
+    assert len(count_components(img)) == len(count_blobs(img)) == 2
+
+def test_detect_colonies_methods():
+    dish, mask = synthetic_dish(3, n_colonies=50)
+    preprocessed = preprocess(dish, mask=mask)
+
+    count_fast, _ = detect_colonies(preprocessed, save=False, method="components")
+    count_blob, _ = detect_colonies(preprocessed, save=False, method="blob")
+    assert abs(count_fast - count_blob) <= 1
+    assert detect_colonies(preprocessed, save=False)[0] == count_blob # opt in to components, the default counts are unchanged
+
+    with pytest.raises(ValueError):
+        detect_colonies(preprocessed, save=False, method="unknown")
@@ -0,0 +1,39 @@
+import cv2 as cv
+import numpy as np
+
+from phase.image_manipulation.dish_detection import crop
+
+COORDINATES = [(700, 650, 520), (2030, 640, 515), (3400, 660, 520), (690, 2300, 510), (2040, 2310, 520), (3600, 2700, 500)]
+
+def crop_full_frame(img, coordinates):
+    # previous implementation: full frame mask per dish, sliced afterwards
+    dishes, masks = [], []
+    for (x, y, r) in coordinates:
+        mask = np.zeros(img.shape[:2], dtype=np.uint8)
+        cv.circle(mask, (x, y), r, 255, -1)
+        masked_img = cv.bitwise_and(img, img, mask=mask)
+        x1, y1 = max(0, x-r), max(0, y-r)
+        x2, y2 = min(img.shape[1], x+r), min(img.shape[0], y+r)
+        dishes.append(masked_img[y1:y2, x1:x2])
+        masks.append(mask[y1:y2, x1:x2])
+    return dishes, masks
+
+def test_crop_matches_full_frame_masking():
+    rng = np.random.default_rng(0)
+    img = rng.integers(0, 256, size=(3040, 4056, 3), dtype=np.uint8)
+
+    dishes, masks = crop(img, COORDINATES)
+    expected_dishes, expected_masks = crop_full_frame(img, COORDINATES)
+
+    assert len(dishes) == len(expected_dishes)
+    for dish, mask, expected_dish, expected_mask in zip(dishes, masks, expected_dishes, expected_masks):
+        assert dish.shape == expected_dish.shape
+        assert np.array_equal(dish, expected_dish)
+        assert np.array_equal(mask, expected_mask)
+
+def test_crop_reuses_masks_for_equal_geometry():
+    img = np.zeros((3040, 4056, 3), dtype=np.uint8)
+
+    _, masks = crop(img, [(1000, 1000, 500), (2500, 1000, 500)])
+
+    assert masks[0] is masks[1]
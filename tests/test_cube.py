@@ -0,0 +1,55 @@
+import os
+
+import numpy as np
+import pytest
+
+import phase.helpers.frames as frames_module
+import phase.helpers.timelapse as timelapse_module
+import phase.main.main as main
+from phase.helpers.cube import DishCubes, build_cubes
+from phase.helpers.frames import load_frame
+from phase.helpers.synthetic import COORDINATES
+from phase.image_manipulation.dish_detection import crop
+
+@pytest.fixture
+def timelapse(timelapse_dir):
+    return timelapse_dir, sorted(os.path.join(timelapse_dir, name) for name in os.listdir(timelapse_dir))
+
+def test_cubes_hold_the_cropped_dishes(tmp_path, timelapse):
+    _, paths = timelapse
+    cubes = build_cubes(os.path.join(tmp_path, "cubes"), paths, COORDINATES, hours=[0, 1/6, 2/6])
+
+    assert len(cubes) == 3 and cubes.hours == [0, 1/6, 2/6]
+    for t, path in enumerate(paths):
+        expected, expected_masks = crop(load_frame(path), COORDINATES)
+        dishes, masks = cubes.crop(t)
+        assert all(np.array_equal(a, b) for a, b in zip(dishes, expected))
+        assert all(np.array_equal(a, b) for a, b in zip(masks, expected_masks))
+    assert isinstance(cubes.dish(0), np.memmap) and np.shares_memory(cubes.crop(1)[0][0], cubes.dish(0))
+
+    assert DishCubes.open(os.path.join(tmp_path, "cubes"), paths) is not None
+    os.utime(paths[1], ns=(0, 0)) # a changed image invalidates the cubes
+    assert DishCubes.open(os.path.join(tmp_path, "cubes"), paths) is None
+    assert DishCubes.open(os.path.join(tmp_path, "missing")) is None
+
+def test_timelapse_reruns_from_cubes_without_decoding(tmp_path, timelapse, fast_masks, monkeypatch):
+    source, _ = timelapse
+    cube_dir = os.path.join(tmp_path, "cubes")
+
+    first = main.timelapse_pipeline(source, n_to_stack=2, cube_dir=cube_dir)
+
+    def no_decoding(*args, **kwargs):
+        raise AssertionError("frame decoded")
+    monkeypatch.setattr(frames_module, "load_frame", no_decoding)
+    monkeypatch.setattr(timelapse_module, "detect_dishes", no_decoding)
+
+    second = main.timelapse_pipeline(source, n_to_stack=2, cube_dir=cube_dir)
+    assert [s.history for s in second] == [s.history for s in first]
+
+    pooled = main.timelapse_pipeline(source, n_to_stack=2, cube_dir=cube_dir, n_workers=2)
+    assert [s.history for s in pooled] == [s.history for s in first]
+
+def test_first_run_decodes_every_frame_once(tmp_path, timelapse, fast_masks, decoded):
+    source, paths = timelapse
+    main.timelapse_pipeline(source, n_to_stack=2, cube_dir=os.path.join(tmp_path, "cubes"), max_frames=1)
+    assert sorted(decoded) == sorted(paths) # the cubes are built from the frames of make_masks
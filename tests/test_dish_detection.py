@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+
+from phase.image_manipulation.dish_detection import detect_dishes, refine_circle
+from phase.helpers.synthetic import COORDINATES, synthetic_plate
+
+@pytest.fixture(scope="module")
+def plate():
+    return synthetic_plate()
+
+def test_coarse_detection_matches_full(plate):
+    _, _, full, _ = detect_dishes(plate, save=False, method="full")
+    dishes, masks, coarse, _ = detect_dishes(plate, save=False, method="coarse")
+
+    assert len(coarse) == len(full) == len(COORDINATES)
+    assert np.abs(np.array(coarse) - np.array(full)).max() <= 5
+    assert len(dishes) == len(masks) == len(coarse)
+
+def test_coarse_detection_is_accurate(plate):
+    _, _, coarse, _ = detect_dishes(plate, save=False, method="coarse")
+
+    for (x, y, r), (ex, ey, er) in zip(coarse, COORDINATES):
+        assert abs(x - ex) <= 1 and abs(y - ey) <= 1
+        assert abs(r - (er + 3)) <= 1 # outer edge of the rim
+
+def test_refine_circle_recovers_offset(plate):
+    x, y, r = refine_circle(plate, (2036, 684, 500), search=12)
+
+    assert abs(x - 2030) <= 1 and abs(y - 690) <= 1 and abs(r - 508) <= 1
+
+def test_unknown_method(plate):
+    with pytest.raises(ValueError):
+        detect_dishes(plate, save=False, method="unknown")
@@ -0,0 +1,52 @@
+import numpy as np
+
+import phase.helpers.parallel as parallel
+from phase.helpers.parallel import DishPool, SharedFrame, attach_frame
+from phase.helpers.synthetic import COORDINATES, synthetic_plate
+from phase.helpers.timelapse import process_dish
+from phase.image_manipulation.thresholding import BackgroundCache
+from phase.image_manipulation.dish_detection import crop
+
+def test_dish_pool_matches_serial_processing():
+    frames = [synthetic_plate(seed) for seed in (0, 1)]
+    _, masks = crop(frames[0], COORDINATES)
+    fg_masks = [mask.copy() for mask in masks]
+    bg_masks = [np.zeros_like(mask) for mask in masks]
+    fine = [True] * len(COORDINATES)
+
+    with DishPool(3, 1, COORDINATES, fg_masks, bg_masks) as pool:
+        parallel = [pool.count(frame, fine) for frame in frames] # the shared frame is reused
+
+    for frame, counts in zip(frames, parallel):
+        dishes, masks = crop(frame, COORDINATES)
+        serial = [process_dish(dish, mask, fg, bg, idx=idx+1) for idx, (dish, mask, fg, bg) in enumerate(zip(dishes, masks, fg_masks, bg_masks))]
+        assert counts == serial
+        assert sum(counts) > 0
+
+def computed_backgrounds():
+    return parallel._dish_worker["backgrounds"].n_computed
+
+def test_dishes_keep_their_worker():
+    frames = [synthetic_plate(seed) for seed in range(4)]
+    _, masks = crop(frames[0], COORDINATES)
+    fg_masks = [mask.copy() for mask in masks]
+    bg_masks = [np.zeros_like(mask) for mask in masks]
+
+    with DishPool(2, 1, COORDINATES, fg_masks, bg_masks, backgrounds=BackgroundCache(2, method="box")) as pool:
+        for t, frame in enumerate(frames):
+            pool.count(frame, [True] * len(COORDINATES), t=t)
+        computed = sum(worker.submit(computed_backgrounds).result() for worker in pool.pools)
+
+    assert computed == 2 * len(COORDINATES) # frames 0 and 2; a dish moving to another worker would be recomputed there
+
+def test_workers_detach_replaced_frames():
+    small, large = SharedFrame((10, 10, 3)), SharedFrame((20, 20, 3))
+    attach_frame(*small.spec)
+    frame = attach_frame(*large.spec) # e.g. after a frame of another size
+    assert list(parallel._attached) == [large.spec[0]]
+    assert frame.shape == (20, 20, 3)
+
+    del frame
+    parallel._attached.pop(large.spec[0]).close()
+    small.close()
+    large.close()
@@ -0,0 +1,26 @@
+import numpy as np
+import pytest
+
+from phase.helpers.synthetic import synthetic_dish
+from phase.image_manipulation.preprocessing import estimate_background, preprocess_fg_isolation
+
+def iou(a, b):
+    a, b = a > 0, b > 0
+    return (a & b).sum() / max((a | b).sum(), 1)
+
+def test_pyramid_tophat_iou():
+    dish, mask = synthetic_dish(0, n_colonies=150, size=600)
+
+    exact = preprocess_fg_isolation(dish, mask=mask, kernel_size=300, method="exact")
+    pyramid = preprocess_fg_isolation(dish, mask=mask, kernel_size=300, method="pyramid", scale=8)
+
+    score = iou(exact, pyramid)
+    assert score > 0.95, f"IoU pyramid vs exact tophat mask: {score:.4f}"
+
+def test_estimate_background_shape_and_method():
+    img = np.random.default_rng(0).integers(0, 256, size=(203, 157), dtype=np.uint8)
+
+    assert estimate_background(img, kernel_size=50, method="pyramid", scale=8).shape == img.shape
+
+    with pytest.raises(ValueError):
+        estimate_background(img, method="unknown")
@@ -0,0 +1,68 @@
+import os
+
+import cv2 as cv
+import numpy as np
+import pytest
+
+import phase.main.main as main
+from phase.helpers.frames import FrameSource
+from phase.helpers.synthetic import SyntheticTimelapse
+
+@pytest.fixture
+def image_paths(tmp_path):
+    paths = []
+    for i in range(6):
+        path = os.path.join(tmp_path, f"frame_{i}.png")
+        cv.imwrite(path, np.full((8, 8, 3), i, np.uint8))
+        paths.append(path)
+    return paths
+
+def test_iterates_in_order(image_paths):
+    with FrameSource(image_paths, max_frames=3) as frames:
+        values = [(path, int(frame[0, 0, 0])) for path, frame in frames]
+
+    assert values == [(path, i) for i, path in enumerate(image_paths)]
+
+def test_cached_frames_are_not_decoded_again(image_paths, decoded):
+    with FrameSource(image_paths, max_frames=8) as frames:
+        frames.get(image_paths[-1])
+        frames.get(image_paths[0])
+        list(frames)
+
+    assert sorted(decoded) == sorted(image_paths)
+
+def test_memory_cap(image_paths, decoded):
+    with FrameSource(image_paths, max_frames=2) as frames:
+        for _ in frames:
+            assert len(frames._cache) <= 2
+        frames.get(image_paths[0]) # evicted, decoded again
+
+    assert len(decoded) == len(image_paths) + 1
+
+def test_pinned_frames_outlive_the_memory_cap(image_paths, decoded):
+    with FrameSource(image_paths, max_frames=2) as frames:
+        frames.pin([image_paths[0], image_paths[1], image_paths[-1]]) # the frames of make_masks
+        for path in (image_paths[-1], image_paths[0], image_paths[1]):
+            frames.get(path)
+        values = [int(frame[0, 0, 0]) for _, frame in frames]
+        assert frames._pinned == {} # released once iterated
+
+    assert values == list(range(len(image_paths)))
+    assert sorted(decoded) == sorted(image_paths)
+
+def test_timelapse_decodes_every_frame_once(tmp_path, decoded, fast_masks):
+    source = os.path.join(tmp_path, "frames")
+    paths = SyntheticTimelapse(0, n_frames=5, n_colonies=20).write(source)
+
+    main.timelapse_pipeline(source, n_to_stack=2, max_frames=2)
+
+    assert sorted(decoded) == sorted(paths) # the last frame is decoded for the masks, long before the loop reaches it
+
+def test_undecodable_frame(tmp_path):
+    path = os.path.join(tmp_path, "broken.jpg")
+    with open(path, "wb") as f:
+        f.write(b"not an image")
+
+    with FrameSource([path]) as frames:
+        with pytest.raises(ValueError):
+            frames.get(path)
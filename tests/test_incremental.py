@@ -0,0 +1,55 @@
+import cv2 as cv
+import numpy as np
+import pytest
+
+import phase.main.main as main
+from phase.helpers.incremental import IncrementalDish
+from phase.helpers.synthetic import full_count, growing_dish
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_incremental_matches_full_processing(seed):
+    bg_mask = np.zeros((1000, 1000), np.uint8)
+    cv.circle(bg_mask, (300, 300), 40, 255, -1)
+
+    incremental = None
+    for dish, mask in growing_dish(seed, growth=(0.3, 1.0) if seed else (0.05, 0.3)):
+        incremental = incremental or IncrementalDish(mask=mask, bg_mask=bg_mask)
+        count, colonies = incremental.process(dish, return_colonies=True)
+        expected_count, expected = full_count(dish, mask, bg_mask)
+
+        assert count == expected_count
+        assert np.allclose(colonies, expected)
+    assert incremental.dirty_fraction < 1
+
+def test_incremental_reuses_clean_frames():
+    dish, mask = next(growing_dish())
+    incremental = IncrementalDish(mask=mask)
+    first = incremental.process(dish, return_colonies=True)
+    second = incremental.process(dish.copy(), return_colonies=True)
+
+    assert incremental.dirty_fraction == 0
+    assert first[0] == second[0] and np.array_equal(first[1], second[1])
+
+def test_incremental_tolerance_keeps_clean_tiles():
+    incremental = None
+    for dish, mask in growing_dish(2, n_frames=5, noise=1.5):
+        incremental = incremental or IncrementalDish(mask=mask, tolerance=8)
+        count = incremental.process(dish)
+
+    assert incremental.dirty_fraction < 0.5
+    # the result is that of the frame made of the latest dirty tiles
+    reference = cv.cvtColor(incremental.green, cv.COLOR_GRAY2BGR)
+    assert count == full_count(reference, mask)[0]
+    assert abs(count - full_count(dish, mask)[0]) <= 2
+
+def test_timelapse_incremental_counts(timelapse_dir, fast_masks):
+    reference = main.timelapse_pipeline(timelapse_dir, n_to_stack=2, count_method="components")
+    incremental = main.timelapse_pipeline(timelapse_dir, n_to_stack=2, incremental=True, count_method="components")
+    assert [s.history for s in incremental] == [s.history for s in reference]
+
+    with pytest.warns(UserWarning, match="components"): # the incremental counts are those of the components backend
+        blob = main.timelapse_pipeline(timelapse_dir, n_to_stack=2, incremental=True)
+    assert [s.history for s in blob] == [s.history for s in main.timelapse_pipeline(timelapse_dir, n_to_stack=2)]
+
+    with pytest.warns(UserWarning, match="threshold_method and background_refresh"):
+        main.timelapse_pipeline(timelapse_dir, n_to_stack=2, incremental=True, count_method="components", threshold_method="box", background_refresh=2)
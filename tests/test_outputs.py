@@ -0,0 +1,51 @@
+import os
+import time
+
+import cv2 as cv
+import numpy as np
+import pytest
+
+from phase.helpers.outputs import ImageWriter
+
+def test_writes_all_images_on_flush(tmp_path):
+    writer = ImageWriter(n_threads=2, max_pending=2)
+    img = np.random.default_rng(0).integers(0, 256, (64, 64, 3), dtype=np.uint8)
+
+    paths = [writer.write(os.path.join(tmp_path, "nested", f"img_{i}.png"), img) for i in range(10)]
+    writer.flush()
+
+    for path in paths:
+        assert np.array_equal(cv.imread(path), img)
+    writer.close()
+
+def test_format_override(tmp_path):
+    writer = ImageWriter(fmt="jpg", jpeg_quality=80)
+
+    path = writer.write(os.path.join(tmp_path, "debug.png"), np.zeros((16, 16, 3), np.uint8))
+    writer.close()
+
+    assert path.endswith("debug.jpg") and os.path.isfile(path)
+
+def test_backpressure(tmp_path, monkeypatch):
+    writer = ImageWriter(n_threads=1, max_pending=1)
+    write = ImageWriter._write
+    def slow_write(self, path, img):
+        time.sleep(0.2)
+        write(self, path, img)
+    monkeypatch.setattr(ImageWriter, "_write", slow_write)
+
+    img = np.zeros((8, 8), np.uint8)
+    start = time.perf_counter()
+    for i in range(3):
+        writer.write(os.path.join(tmp_path, f"{i}.png"), img)
+    assert time.perf_counter() - start >= 0.35 # the third write waits for the first two
+
+    writer.close()
+
+def test_failed_write_warns(tmp_path):
+    writer = ImageWriter()
+
+    with pytest.warns(UserWarning):
+        writer.write(os.path.join(tmp_path, "image.unknown_format"), np.zeros((8, 8), np.uint8))
+        writer.flush()
+    writer.close()
@@ -0,0 +1,40 @@
+import os
+
+import cv2 as cv
+import pytest
+
+from phase.helpers.parallel import run_parallel
+from phase.helpers.synthetic import COORDINATES, synthetic_plate
+from phase.main.main import mult_pipeline
+
+def square(x):
+    if x == 3:
+        raise ValueError("bad input")
+    return x * x, cv.getNumThreads()
+
+@pytest.mark.parametrize("n_workers", [1, 2])
+def test_run_parallel_keeps_order_and_isolates_failures(n_workers):
+    results = run_parallel(square, [dict(x=x) for x in range(6)], n_workers=n_workers)
+
+    assert [result[0] if result else None for result, _ in results] == [0, 1, 4, None, 16, 25]
+    assert isinstance(results[3][1], ValueError)
+    assert all(error is None for i, (_, error) in enumerate(results) if i != 3)
+
+def test_run_parallel_limits_opencv_threads():
+    results = run_parallel(square, [dict(x=x) for x in (1, 2)], n_workers=2, cv_threads=1)
+
+    assert all(result[1] == 1 for result, _ in results)
+
+def test_mult_pipeline_counts_plates(tmp_path):
+    source, save_path = os.path.join(tmp_path, "images"), os.path.join(tmp_path, "results")
+    os.makedirs(source)
+    for seed in range(2):
+        cv.imwrite(os.path.join(source, f"plate_{seed}.png"), synthetic_plate(seed))
+
+    results = mult_pipeline(source, save_path=save_path, save_detected=False, n_workers=2)
+
+    assert [error for _, error in results] == [None, None]
+    for metadata, _ in results:
+        (dishes,) = metadata.values()
+        assert len(dishes) == len(COORDINATES)
+        assert all(dish[0]["colony_count"] > 0 for dish in dishes.values())
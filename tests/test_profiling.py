@@ -0,0 +1,87 @@
+import csv
+import json
+import logging
+import os
+import pstats
+
+import pytest
+
+import phase.main.main as main
+from phase.helpers import profiling
+from phase.helpers.profiling import Profiler, stage, cprofile
+from phase.helpers.synthetic import synthetic_dish
+from phase.helpers.timelapse import process_dish
+
+STAGES = {"threshold", "area_filter", "masking", "detection"}
+
+def test_stages_are_free_without_profiler():
+    assert profiling.active() is None
+    assert stage("threshold") is stage("detection") # the shared no-op context
+    with stage("threshold"):
+        pass
+
+def process_frame(name, dishes):
+    with profiling.frame(name):
+        return [process_dish(dish, mask, None, None, idx=idx+1) for idx, (dish, mask) in enumerate(dishes)]
+
+def test_profiler_times_stages_per_frame_and_dish(tmp_path):
+    dishes = [synthetic_dish(seed, size=400) for seed in range(2)]
+    with Profiler(memory=True) as profiler:
+        process_frame("frame_1", dishes)
+        process_frame("frame_2", dishes)
+    assert profiling.active() is None
+
+    by_stage = {row["stage"]: row for row in profiler.summary()}
+    assert STAGES <= set(by_stage)
+    assert by_stage["threshold"]["n"] == 4 and by_stage["threshold"]["wall"] > 0
+
+    by_frame = profiler.summary("frame")
+    assert {row["frame"] for row in by_frame} == {"frame_1", "frame_2"}
+    assert all(row["peak_memory"] > 400 * 400 for row in by_frame)
+    by_dish = profiler.summary("dish")
+    assert {(row["dish"], row["stage"]) for row in by_dish} >= {(1, "threshold"), (2, "threshold")}
+    assert all(row["peak_memory"] > 0 for row in by_dish)
+
+    profiler.to_json(os.path.join(tmp_path, "profile.json"))
+    profiler.to_csv(os.path.join(tmp_path, "profile.csv"))
+    with open(os.path.join(tmp_path, "profile.json")) as f:
+        exported = json.load(f)
+    with open(os.path.join(tmp_path, "profile.csv")) as f:
+        rows = list(csv.DictReader(f))
+    assert len(exported["records"]) == len(rows) == len(profiler.records)
+    assert {row["stage"] for row in exported["stages"]} == set(by_stage)
+    assert "threshold" in profiler.format_summary()
+
+def test_one_profiler_at_a_time():
+    with Profiler():
+        with pytest.raises(RuntimeError):
+            Profiler().__enter__()
+
+def test_cprofile_single_frame(tmp_path):
+    path = os.path.join(tmp_path, "frame.prof")
+    with cprofile(path):
+        process_frame("frame", [synthetic_dish(0, size=300)])
+
+    stats = pstats.Stats(path)
+    assert any(function == "process_dish" for _, _, function in stats.stats)
+
+def test_timelapse_profile(tmp_path, timelapse_dir, fast_masks):
+    source = timelapse_dir
+    save_path = os.path.join(tmp_path, "results")
+    os.makedirs(save_path)
+
+    with Profiler() as profiler:
+        main.timelapse_pipeline(source, save_path=save_path, n_to_stack=2, profile_frame=1)
+
+    frames = {row["frame"] for row in profiler.summary("frame") if row["stage"] == "crop"}
+    assert len(frames) == 3
+    assert {"decode", "crop", "threshold", "detection"} <= {row["stage"] for row in profiler.summary()}
+    assert len([name for name in os.listdir(save_path) if name.endswith(".prof")]) == 1
+
+def test_messages_are_logged_not_printed(capsys, caplog):
+    with caplog.at_level(logging.DEBUG, logger="phase"):
+        process_frame("frame", [synthetic_dish(0, size=300)])
+
+    assert capsys.readouterr().out == ""
+    assert any("preprocessed" in message for message in caplog.messages)
+    assert any("colonies detected" in message for message in caplog.messages)
@@ -0,0 +1,55 @@
+import os
+from datetime import datetime, timedelta
+
+import cv2 as cv
+import numpy as np
+import pytest
+
+import phase.main.main as main
+from phase.helpers.synthetic import COORDINATES, synthetic_plate
+from phase.image_manipulation.dish_detection import crop
+from phase.image_manipulation.registration import DishGeometry
+
+DRIFT = (9, -6) # of the second dish
+DRIFTED = [(x + DRIFT[0], y + DRIFT[1], r) if idx == 1 else (x, y, r) for idx, (x, y, r) in enumerate(COORDINATES)]
+
+@pytest.fixture(scope="module")
+def frames():
+    return synthetic_plate(0), synthetic_plate(1), synthetic_plate(2, coordinates=DRIFTED)
+
+def test_geometry_crops_like_crop(frames):
+    geometry = DishGeometry(COORDINATES, frames[0].shape)
+    dishes, masks = geometry.crop(frames[0])
+    expected, expected_masks = crop(frames[0], COORDINATES)
+
+    assert all(np.array_equal(a, b) for a, b in zip(dishes, expected))
+    assert all(np.array_equal(a, b) for a, b in zip(masks, expected_masks))
+
+@pytest.mark.parametrize("method, tolerance", [("shift", 2), ("redetect", 1)])
+def test_geometry_follows_drifted_dish(frames, method, tolerance):
+    geometry = DishGeometry(COORDINATES, frames[0].shape, method=method)
+
+    assert geometry.register(frames[0]) == [] # reference
+    assert geometry.register(frames[1]) == [] # new colonies, no drift
+    assert geometry.register(frames[2]) == [1]
+
+    x, y, r = geometry.coordinates[1]
+    assert abs(x - DRIFTED[1][0]) <= tolerance and abs(y - DRIFTED[1][1]) <= tolerance and r == COORDINATES[1][2]
+    assert geometry.coordinates[0] == COORDINATES[0]
+    assert geometry.masks[1].shape == crop(frames[0], COORDINATES)[1][1].shape
+
+    assert geometry.register(frames[2]) == [] # the reference moved along
+
+def test_unknown_method():
+    with pytest.raises(ValueError):
+        DishGeometry(COORDINATES, (3040, 4056, 3), method="hough")
+
+@pytest.mark.parametrize("n_workers", [1, 2])
+def test_timelapse_follows_drift(tmp_path, fast_masks, frames, n_workers):
+    start = datetime(2025, 10, 30, 12)
+    for idx, frame in enumerate(frames):
+        cv.imwrite(os.path.join(tmp_path, (start + idx * timedelta(minutes=10)).strftime("%d.%m.%Y-%H.%M.%S.jpg")), frame)
+
+    with pytest.warns(UserWarning, match="Dish 2 drifted"):
+        states = main.timelapse_pipeline(str(tmp_path), n_to_stack=2, register=True, n_workers=n_workers)
+    assert all(len(state.history) == 3 for state in states)
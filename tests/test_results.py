@@ -0,0 +1,91 @@
+import os
+
+import cv2 as cv
+import yaml
+
+from phase.helpers.parallel import run_parallel
+from phase.helpers.results import ResultsStore, open_results
+from phase.helpers.synthetic import synthetic_plate
+from phase.main.main import pipeline
+
+def image_metadata(i):
+    return {f"image_{i}": {dish: [{"center": [100 * dish, 200], "radius": 500, "colony_count": i + dish}] for dish in (1, 2, 3)}}
+
+def add_to_store(path, i):
+    ResultsStore(path).add(image_metadata(i))
+
+def add_to_results(save_path, i):
+    open_results(save_path).add(image_metadata(i))
+
+def test_concurrent_writers(tmp_path):
+    path = os.path.join(tmp_path, "results.sqlite")
+
+    results = run_parallel(add_to_store, [dict(path=path, i=i) for i in range(20)], n_workers=4)
+
+    assert all(error is None for _, error in results)
+    store = ResultsStore(path)
+    assert store.file_names() == {f"image_{i}" for i in range(20)}
+    assert store.has("image_3") and not store.has("image_20")
+
+def test_export_yaml_layout(tmp_path):
+    store = ResultsStore(os.path.join(tmp_path, "results.sqlite"))
+    store.add(image_metadata(1))
+    store.add(image_metadata(1)) # reprocessing replaces the records
+    store.add(image_metadata(2))
+
+    store.export_yaml(os.path.join(tmp_path, "metadata.yaml"))
+    with open(os.path.join(tmp_path, "metadata.yaml")) as f:
+        metadata = yaml.safe_load(f)
+
+    assert metadata == {**image_metadata(1), **image_metadata(2)}
+
+def test_existing_metadata_survives_exports(tmp_path):
+    with open(os.path.join(tmp_path, "metadata.yaml"), "w") as f: # written before the store existed
+        yaml.safe_dump(image_metadata(1), f)
+
+    store = open_results(str(tmp_path))
+    store.add(image_metadata(2))
+    store.export_yaml(os.path.join(tmp_path, "metadata.yaml"))
+
+    with open(os.path.join(tmp_path, "metadata.yaml")) as f:
+        assert yaml.safe_load(f) == {**image_metadata(1), **image_metadata(2)}
+
+def test_import_keeps_stored_records(tmp_path):
+    yaml_path = os.path.join(tmp_path, "metadata.yaml")
+    with open(yaml_path, "w") as f:
+        yaml.safe_dump({**image_metadata(1), **image_metadata(2)}, f)
+
+    store = ResultsStore(os.path.join(tmp_path, "results.sqlite"))
+    newer = {"image_1": {dish: [{"center": [0, 0], "radius": 1, "colony_count": 0}] for dish in (1, 2, 3)}}
+    store.add(newer) # written by a worker before the import
+
+    assert store.import_yaml(yaml_path) == 2
+    assert store.import_yaml(yaml_path) == 0 # imported once
+    assert store.to_metadata() == {**newer, **image_metadata(2)}
+
+def test_concurrent_writers_import_metadata_once(tmp_path):
+    stale = {name: {dish: [{"center": record[0]["center"], "radius": 500}] for dish, record in dishes.items()} for name, dishes in {**image_metadata(0), **image_metadata(1)}.items()}
+    with open(os.path.join(tmp_path, "metadata.yaml"), "w") as f: # without counts
+        yaml.safe_dump(stale, f)
+
+    results = run_parallel(add_to_results, [dict(save_path=str(tmp_path), i=i) for i in range(8)], n_workers=4)
+
+    assert all(error is None for _, error in results)
+    assert open_results(str(tmp_path)).to_metadata() == {name: records for i in range(8) for name, records in image_metadata(i).items()}
+
+def test_pipeline_exports_metadata(tmp_path):
+    path = os.path.join(tmp_path, "plate.png")
+    cv.imwrite(path, synthetic_plate(0))
+    save_path = os.path.join(tmp_path, "results")
+    os.makedirs(save_path)
+    with open(os.path.join(save_path, "metadata.yaml"), "w") as f:
+        yaml.safe_dump(image_metadata(1), f)
+
+    pipeline(path, save_path=save_path, save_metadata=True, save_detected=False) # exported on demand only
+    with open(os.path.join(save_path, "metadata.yaml")) as f:
+        assert yaml.safe_load(f) == image_metadata(1)
+
+    dish_metadata = pipeline(path, save_path=save_path, save_metadata=True, save_detected=False, export_metadata=True)
+
+    with open(os.path.join(save_path, "metadata.yaml")) as f:
+        assert yaml.safe_load(f) == {**image_metadata(1), **dish_metadata}
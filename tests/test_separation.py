@@ -0,0 +1,42 @@
+import cv2 as cv
+import numpy as np
+import pytest
+
+from phase.image_manipulation.preprocessing import separate_components, preprocess
+
+def touching_colonies():
+    binary = np.zeros((200, 300), np.uint8)
+    for x, y, r in [(50, 50, 15), (75, 50, 15), # pair
+                    (150, 50, 12), (172, 50, 12), (161, 70, 12), # triple
+                    (250, 150, 3), (100, 150, 20)]: # small and large single colony
+        cv.circle(binary, (x, y), r, 255, -1)
+    return binary
+
+def n_components(binary):
+    return cv.connectedComponents(binary, connectivity=8)[0] - 1
+
+@pytest.mark.parametrize("dish", [False, True])
+def test_separate_components_splits_touching_colonies(dish):
+    binary = touching_colonies()
+    source = cv.cvtColor(255 - binary, cv.COLOR_GRAY2BGR) if dish else None
+
+    split = separate_components(source, binary)
+    labels = separate_components(source, binary, return_labels=True)
+
+    assert n_components(binary) == 4
+    assert n_components(split) == 7
+    assert len(np.unique(labels)) - 1 == 7 and np.array_equal(labels > 0, split > 0)
+    assert not np.any(split[binary == 0]) # only cuts
+
+def test_separate_components_leaves_small_components():
+    binary = touching_colonies()
+    split = separate_components(None, binary, min_area=2000) # all components smaller
+
+    assert np.array_equal(split, binary)
+
+def test_preprocess_without_area_filter_separates_colonies():
+    binary = touching_colonies()
+    dish = cv.cvtColor(np.where(binary > 0, 60, 180).astype(np.uint8), cv.COLOR_GRAY2BGR)
+
+    preprocessed = preprocess(dish, area_filter=False, s=61, C=5)
+    assert n_components(preprocessed) == 7
@@ -0,0 +1,42 @@
+import os
+import threading
+
+from phase.helpers.synthetic import COORDINATES
+from phase.main.stream import StreamProcessor
+
+def test_stream_processes_frames_as_they_arrive(tmp_path, fake_camera):
+    source, save_path = os.path.join(tmp_path, "capture"), os.path.join(tmp_path, "results")
+    os.makedirs(source)
+    camera = fake_camera(source)
+
+    producer = threading.Thread(target=camera.run, args=(3, 0.2))
+    producer.start()
+    processor = StreamProcessor(source, save_path, n_to_stack=2, refine_every=2, settle=0)
+    states = processor.run(poll_interval=0.05, max_frames=3, timeout=30)
+    producer.join()
+
+    assert len(processor.coordinates) == len(COORDINATES)
+    assert all(len(state.history) == 3 for state in states)
+    assert [h for h, _ in states[0].history] == [0.0, 1/6, 2/6] # across midnight and month boundary
+    assert processor.n_stacked == 2 and processor.fg_masks is not None
+    assert processor.results.file_names() == set(processor.processed)
+
+def test_stream_resumes_without_reprocessing(tmp_path, fake_camera):
+    source, save_path = os.path.join(tmp_path, "capture"), os.path.join(tmp_path, "results")
+    os.makedirs(source)
+    camera = fake_camera(source)
+    camera.run(2)
+
+    first = StreamProcessor(source, save_path, n_to_stack=2, settle=0)
+    first.run(poll_interval=0.05, timeout=0.1)
+    assert len(first.processed) == 2
+
+    camera.run(1)
+    restarted = StreamProcessor(source, save_path, n_to_stack=2, settle=0)
+    assert restarted.pending() == [os.path.join(source, f"{camera.t - camera.interval:%d.%m.%Y-%H.%M.%S}.jpg")]
+
+    states = restarted.run(poll_interval=0.05, timeout=0.1)
+    assert restarted.processed[:2] == first.processed
+    assert len(restarted.processed) == 3
+    assert all(len(state.history) == 3 for state in states)
+    assert [h for h, _ in states[0].history] == [0.0, 1/6, 2/6]
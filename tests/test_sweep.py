@@ -0,0 +1,63 @@
+import os
+
+import cv2 as cv
+import pytest
+
+from phase.colony_detection.counting import detect_colonies
+from phase.helpers.sweep import crop_samples, format_table, parameter_grid, random_parameters, save_table, sweep, sweep_dish
+from phase.helpers.synthetic import synthetic_dish, synthetic_plate
+from phase.image_manipulation.preprocessing import preprocess
+
+SPACE = {"s": [101, 121], "C": [9, 11], "min_area": [5, 10], "minArea": [2, 10, 20]}
+
+def test_sweep_dish_memoizes_stages():
+    dish, mask = synthetic_dish(0)
+    candidates = parameter_grid(SPACE)
+    counts, stats = sweep_dish(dish, mask, candidates)
+
+    assert stats == {"thresholds": 4, "cleaned": 8} # 24 parameter sets
+    for params, count in zip(candidates, counts):
+        preprocessed = preprocess(dish, mask=mask, s=params["s"], C=params["C"], min_area=params["min_area"])
+        assert count == detect_colonies(preprocessed, save=False, params={"minArea": params["minArea"]})[0]
+
+def test_sweep_ranks_against_ground_truth(tmp_path):
+    samples = []
+    for seed in range(3):
+        dish, mask = synthetic_dish(seed)
+        true_count, _ = detect_colonies(preprocess(dish, mask=mask, s=101, C=9), save=False, params={"minArea": 10})
+        samples.append((f"plate{seed}", 1, dish, mask, true_count))
+
+    candidates = parameter_grid(SPACE)
+    rows = sweep(samples, candidates, n_workers=1)
+    assert rows[0]["mae"] == 0 and (rows[0]["s"], rows[0]["C"], rows[0]["minArea"]) == (101, 9, 10)
+    assert [row["mae"] for row in rows] == sorted(row["mae"] for row in rows)
+
+    pooled = sweep(samples, candidates, n_workers=2)
+    assert [row["counts"] for row in pooled] == [row["counts"] for row in rows]
+
+    assert format_table(rows, top=3).count("\n") == 3
+    save_table(rows, os.path.join(tmp_path, "sweep.csv"))
+    with open(os.path.join(tmp_path, "sweep.csv")) as f:
+        assert len(f.readlines()) == len(candidates) + 1
+
+def test_random_parameters():
+    candidates = random_parameters({"s": (51, 151), "C": [9, 11], "minConvexity": (0.5, 0.9)}, n=20, seed=0)
+    assert len(candidates) == 20
+    assert all(c["s"] % 2 == 1 and c["C"] in (9, 11) and 0.5 <= c["minConvexity"] <= 0.9 for c in candidates)
+
+    sizes = {c["s"] for c in random_parameters({"s": (50, 56)}, n=100, seed=0)}
+    assert sizes == {51, 53, 55} # odd and within the bounds
+
+    with pytest.raises(ValueError):
+        random_parameters({"s": (52, 52)}, n=1)
+    with pytest.raises(ValueError):
+        random_parameters({"s": [101, 120]}, n=1)
+
+    with pytest.raises(ValueError):
+        sweep([], [{"blockSize": 3}])
+
+def test_crop_samples(tmp_path):
+    path = os.path.join(tmp_path, "plate.jpg")
+    cv.imwrite(path, synthetic_plate(0))
+    samples = crop_samples([path, os.path.join(tmp_path, "no_truth.jpg")], {"plate": [10, None, 30, 40, 50, 60]})
+    assert [(name, idx, count) for name, idx, _, _, count in samples] == [("plate", 1, 10), ("plate", 3, 30), ("plate", 4, 40), ("plate", 5, 50), ("plate", 6, 60)]
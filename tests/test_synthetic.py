@@ -0,0 +1,29 @@
+import os
+
+import numpy as np
+import pytest
+
+from phase.helpers.synthetic import FRAME_SHAPE, SyntheticTimelapse, dish_grid
+
+def test_dish_grid_fits_frame():
+    coordinates = dish_grid(6)
+    assert len(coordinates) == 6
+    assert all(r <= x <= FRAME_SHAPE[1] - r and r <= y <= FRAME_SHAPE[0] - r for x, y, r in coordinates)
+
+    with pytest.raises(ValueError):
+        dish_grid(12)
+
+def test_timelapse_has_known_counts(tmp_path):
+    timelapse = SyntheticTimelapse(0, n_frames=4, coordinates=dish_grid(2), n_colonies=50, n_dust=10, markers=True)
+
+    counts = [timelapse.counts(t) for t in range(4)]
+    assert counts[-1] == [50, 50]
+    assert np.all(np.diff(counts, axis=0) >= 0)
+
+    for centers, _, _ in timelapse.colonies: # colonies never touch
+        distances = np.linalg.norm(centers[:, None] - centers[None], axis=2) + np.eye(len(centers)) * 1e9
+        assert distances.min() >= 2 * timelapse.max_radius
+
+    assert np.array_equal(timelapse.frame(2), timelapse.frame(2)) # frames render in any order
+    paths = timelapse.write(str(tmp_path))
+    assert [os.path.basename(path) for path in paths][:2] == ["30.10.2025-12.00.00.jpg", "30.10.2025-12.10.00.jpg"]
@@ -0,0 +1,55 @@
+import cv2 as cv
+import numpy as np
+import pytest
+
+import phase.main.main as main
+from phase.colony_detection.counting import count_components
+from phase.helpers.synthetic import synthetic_dish
+from phase.image_manipulation.preprocessing import preprocess
+from phase.image_manipulation.thresholding import adaptive_threshold, local_mean, BackgroundCache
+
+@pytest.mark.parametrize("s, C", [(121, 11), (31, 3.5), (121, -2)])
+def test_gaussian_background_matches_opencv(s, C):
+    dish, _ = synthetic_dish(0)
+    green = dish[:, :, 1]
+    expected = cv.adaptiveThreshold(green, 255, cv.ADAPTIVE_THRESH_GAUSSIAN_C, cv.THRESH_BINARY_INV, s, C)
+
+    assert np.array_equal(adaptive_threshold(green, s=s, C=C), expected)
+    assert np.array_equal(adaptive_threshold(green, C=C, background=local_mean(green, s=s)), expected)
+
+@pytest.mark.parametrize("method", ["box", "downsampled"])
+@pytest.mark.parametrize("seed", [0, 1])
+def test_fast_thresholds_match_gaussian(method, seed):
+    dish, mask = synthetic_dish(seed)
+    expected = preprocess(dish, mask=mask)
+    fast = preprocess(dish, mask=mask, threshold_method=method)
+
+    assert (fast != expected)[mask > 0].mean() < 0.001
+    assert abs(len(count_components(fast)) - len(count_components(expected))) <= 3
+
+def test_unknown_method():
+    with pytest.raises(ValueError):
+        local_mean(np.zeros((10, 10), np.uint8), s=3, method="median")
+
+def test_background_cache_refreshes():
+    dish, _ = synthetic_dish(0)
+    green = dish[:, :, 1]
+    cache = BackgroundCache(refresh=3)
+
+    backgrounds = [cache.get(1, t, green) for t in range(7)]
+    assert cache.n_computed == 3 # frames 0, 3 and 6
+    assert backgrounds[1] is backgrounds[0] and backgrounds[3] is not backgrounds[0]
+
+    cache.get(1, 2, green) # an earlier frame, i.e. after resuming
+    cache.get(2, 2, green) # another dish
+    assert cache.n_computed == 5
+
+@pytest.mark.parametrize("timelapse_dir", [4], indirect=True)
+@pytest.mark.parametrize("n_workers", [1, 2])
+def test_timelapse_reuses_backgrounds(timelapse_dir, fast_masks, n_workers):
+    reference = main.timelapse_pipeline(timelapse_dir, n_to_stack=2)
+    cached = main.timelapse_pipeline(timelapse_dir, n_to_stack=2, threshold_method="box", background_refresh=2, n_workers=n_workers)
+
+    for state, expected in zip(cached, reference):
+        assert [t for t, _ in state.history] == [t for t, _ in expected.history]
+        assert all(abs(count - expected_count) <= 3 for (_, count), (_, expected_count) in zip(state.history, expected.history))
@@ -0,0 +1,64 @@
+import cv2 as cv
+import numpy as np
+
+from phase.colony_detection.counting import detect_colonies
+from phase.colony_detection.tracking import ColonyTracker, keypoints_to_array
+from phase.helpers.synthetic import synthetic_dish
+
+def growing_colonies(seed = 0, n_colonies = 3000, n_frames = 50, size = 2000, jitter = 0.3):
+    """
+    Colonies appearing at random frames and growing, detected with a little centroid jitter.
+    Yields the (x, y, size) rows and true ids of each frame.
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.uniform(0, size, (n_colonies, 2))
+    appear = rng.integers(0, n_frames, n_colonies)
+    for frame in range(n_frames):
+        visible = np.flatnonzero(appear <= frame)
+        visible = visible[rng.permutation(len(visible))] # detection order isn't stable
+        sizes = 2 + 0.2 * (frame - appear[visible])
+        rows = np.column_stack([centers[visible] + rng.normal(0, jitter, (len(visible), 2)), sizes])
+        yield rows, visible, appear
+
+def test_tracker_keeps_ids_and_appearance_times():
+    tracker = ColonyTracker(max_dist=3)
+    truth = {} # true colony -> tracked id
+    for frame, (rows, visible, appear) in enumerate(growing_colonies(n_colonies=500, n_frames=20, size=1000)):
+        ids = tracker.update(float(frame), rows)
+        for true_id, tracked_id in zip(visible, ids):
+            assert truth.setdefault(true_id, tracked_id) == tracked_id
+
+    assert len(tracker.colonies) == 500
+    times = tracker.appearance_times()
+    assert all(times[truth[i]] == appear[i] for i in truth)
+    sizes = [size for _, _, _, size in tracker.colonies[truth[0]].trajectory]
+    assert sizes == sorted(sizes)
+
+def test_tracker_bridges_missed_frames_and_round_trips():
+    tracker = ColonyTracker(max_dist=3, max_missed=1)
+    a, b = [10.0, 10.0, 4.0], [50.0, 50.0, 4.0]
+    assert tracker.update(0, np.array([a, b])) == [0, 1]
+    assert tracker.update(1, np.array([b])) == [1] # a missed once
+    tracker = ColonyTracker.from_state(tracker.state(), tracker.points())
+    assert tracker.update(2, np.array([a, b])) == [0, 1]
+    tracker.update(3, np.array([b]))
+    tracker.update(4, np.array([b])) # a missed twice, no longer matched
+    assert tracker.update(5, np.array([a, b])) == [2, 1]
+
+def test_tracker_scales_linearly():
+    compared = []
+    for scale in (1, 2): # 4x the colonies at the same density
+        tracker = ColonyTracker(max_dist=3)
+        for frame, (rows, _, _) in enumerate(growing_colonies(n_colonies=750 * scale**2, n_frames=20, size=1000 * scale)):
+            tracker.update(float(frame), rows)
+        assert len(tracker.colonies) == 750 * scale**2
+        compared.append(tracker.n_compared)
+    assert 3 < compared[1] / compared[0] < 5 # comparing all pairs takes 16x
+
+def test_detect_colonies_returns_keypoints():
+    img, _ = synthetic_dish(seed=1)
+    _, binary = cv.threshold(cv.cvtColor(img, cv.COLOR_BGR2GRAY), 100, 255, cv.THRESH_BINARY_INV)
+    count, _, keypoints = detect_colonies(binary, save=False, return_keypoints=True)
+    colonies = keypoints_to_array(keypoints)
+    assert count > 100 and colonies.shape == (count, 3)
+    assert keypoints_to_array([]).shape == (0, 3)
@@ -0,0 +1,96 @@
+import os
+
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+from matplotlib.backends.backend_pdf import PdfPages
+import numpy as np
+import pytest
+
+import phase.helpers.validation as validation
+from phase.helpers.inputs import read_pdf
+from phase.helpers.validation import parse_pdfs, counts_from_metadata, validate, format_report
+
+PLATES = [("WT 1 P 1", 37), ("WT 1 P 2", 12), ("WT 2 P 1", 0), ("WT 2 P 2", 105)]
+
+def make_pdf(path, plates = PLATES):
+    """
+    Writes a pdf like the export of the cell counter: per page a header image, the image of the dish, its name and count.
+    """
+    matplotlib.rcParams["pdf.fonttype"] = 42 # extractable text
+    with PdfPages(path) as pdf:
+        for idx, (name, count) in enumerate(plates):
+            fig = plt.figure(figsize=(3, 3))
+            fig.figimage(np.zeros((10, 30, 3), np.uint8)) # header
+            fig.figimage(np.full((20, 20, 3), idx * 40, np.uint8), 50, 50)
+            fig.text(0.1, 0.9, name)
+            fig.text(0.1, 0.8, f"Count : {count}")
+            pdf.savefig(fig)
+            plt.close(fig)
+        fig = plt.figure(figsize=(3, 3)) # summary page without a plate
+        fig.text(0.1, 0.9, "Summary")
+        pdf.savefig(fig)
+        plt.close(fig)
+    return path
+
+@pytest.fixture
+def pdf_path(tmp_path):
+    return make_pdf(os.path.join(tmp_path, "counts.pdf"))
+
+def test_read_pdf_saves_one_image_per_plate(tmp_path, pdf_path):
+    counts = read_pdf(pdf_path, save_images=True, save_path=str(tmp_path))
+
+    assert counts == {name.replace(" ", "_"): count for name, count in PLATES}
+    assert sorted(os.listdir(os.path.join(tmp_path, "FromPDF"))) == sorted(f"from_pdf_{name.replace(' ', '_')}.png" for name, _ in PLATES)
+
+def test_parse_pdfs_in_page_ranges(pdf_path):
+    records = parse_pdfs(pdf_path, n_workers=1, pages_per_task=3)
+
+    assert [(record["name"], record["count"], record["page"]) for record in records] == [(name.replace(" ", "_"), count, idx) for idx, (name, count) in enumerate(PLATES)]
+    assert all(isinstance(record["image"], bytes) for record in records)
+
+def test_parse_pdfs_caches_records(tmp_path, pdf_path, monkeypatch):
+    cache_dir = os.path.join(tmp_path, "cache")
+    first = parse_pdfs(pdf_path, cache_dir=cache_dir, n_workers=1)
+    assert all(os.path.isfile(record["image"]) for record in first)
+
+    def no_parsing(*args, **kwargs):
+        raise AssertionError("pdf parsed")
+    monkeypatch.setattr(validation, "run_parallel", no_parsing)
+    monkeypatch.setattr(validation, "PdfReader", no_parsing)
+
+    assert parse_pdfs(pdf_path, cache_dir=cache_dir) == first
+
+    other = make_pdf(os.path.join(tmp_path, "other.pdf"), PLATES[:1]) # a new pdf is parsed
+    with pytest.raises(AssertionError):
+        parse_pdfs([pdf_path, other], cache_dir=cache_dir)
+
+def test_recounts_keep_their_own_image_and_count(tmp_path):
+    path = make_pdf(os.path.join(tmp_path, "recount.pdf"), [("WT 1 P 1", 37), ("WT 1 P 2", 12), ("WT 1 P 1", 40)])
+    records = parse_pdfs(path, cache_dir=os.path.join(tmp_path, "cache"), n_workers=1)
+
+    images = [record["image"] for record in records]
+    assert len(set(images)) == 3 and all(os.path.isfile(image) for image in images)
+
+    counts = {os.path.splitext(image)[0]: detected for image, detected in zip(images, [35, 12, 41])} # as in validate_pdfs
+    report = validate(records, counts)
+    assert report["n"] == 3
+    assert sorted((plate["true"], plate["detected"]) for plate in report["plates"]) == [(12, 12), (37, 35), (40, 41)]
+
+def test_validate_reports_errors():
+    records = [{"name": name.replace(" ", "_"), "count": count} for name, count in PLATES]
+    metadata = {
+        "from_pdf_WT_1_P_1": {1: [{"colony_count": 40}]},
+        "from_pdf_WT_1_P_2": {1: [{"colony_count": 12}]},
+        "wt2p2": {1: [{"colony_count": 100}], 2: [{"colony_count": None}]},
+    }
+    counts = counts_from_metadata([(metadata, None), (None, ValueError())])
+    report = validate(records, counts)
+
+    assert report["n"] == 3 and report["unmatched"] == ["WT_2_P_1"]
+    assert report["mae"] == pytest.approx(8 / 3) and report["bias"] == pytest.approx(-2 / 3)
+    assert report["rmse"] == pytest.approx(np.sqrt(34 / 3))
+    assert [(plate["name"], plate["delta"]) for plate in report["plates"]] == [("WT_2_P_2", -5), ("WT_1_P_1", 3), ("WT_1_P_2", 0)]
+    assert "MAE 2.67" in format_report(report)
+
+    assert validate(records, {})["mae"] is None